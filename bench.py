@@ -0,0 +1,257 @@
+# BENCH - Reproducible benchmarks for the simulation and rendering hot paths
+#
+#   python bench.py                              run everything, print a table
+#   python bench.py --save bench_baseline.json   ...and store the results as a baseline
+#   python bench.py --baseline bench_baseline.json [--fail-over 10]   show % deltas against a stored baseline (+ = better)
+#
+# Every benchmark is seeded and repeated; the best repeat is reported (least disturbed by the rest of the machine).
+# The frame benchmark runs code.py against SDL's dummy video driver, so no display is needed.
+# The startup benchmark times fresh interpreters: launch -> `import engine` done, and launch -> first frame of code.py.
+# The metrics benchmark compares the metrics stream's per-day cost (record + write) with a default day of the loop.
+# The scheduler benchmark counts scheduled+dispatched events per second, then runs 10k users with the day in 24 slices.
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy"); os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import sys
+import json
+import time
+import runpy
+import subprocess
+import platform
+import argparse
+import tempfile
+import contextlib
+from collections import deque
+import numpy as np
+from engine import Network, SimConfig, Exchange, format_num
+from router import Router
+from orderbook import OrderBook, route_order
+from metrics import MetricsWriter, MetricsRecorder, pyarrow_available
+
+BENCH_SEED = 12345
+BENCH_REPEATS = 3
+FRAME_BENCH_FRAMES = 300
+FRAME_BENCH_NODES = 10_000
+FRAME_BENCH_HISTORY = 100_000 # Price points in the graph
+ROUTER_BENCH_POOLS = 50
+BOOK_BENCH_EVENTS = 300_000
+BOOK_BENCH_MIX = (0.60, 0.30) # Shares of limit adds and cancels; the rest are market orders
+STARTUP_BENCH_RUNS = 5 # Fresh interpreters per startup measurement
+
+@contextlib.contextmanager
+def _silent(): # stdout to /dev/null for the block
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull): yield
+
+def _best(func, repeats=BENCH_REPEATS): # Best wall time of `repeats` calls to func()
+    best = float("inf")
+    for _ in range(repeats): t0 = time.perf_counter(); func(); best = min(best, time.perf_counter() - t0)
+    return best
+
+def _network(users=0, nodes=0, **overrides):
+    with _silent():
+        network = Network(SimConfig(**overrides), seed=BENCH_SEED)
+        if users: network.add_multiple_users(users)
+        for _ in range(nodes): network.add_node(network.config.MIN_STAKE, 5, is_our=False, silent=True)
+    return network
+
+# --- Benchmarks (each returns a list of (name, value, unit, higher_is_better)) ---
+def bench_quotes(quick=False):
+    ex = _network().exchange; n = 20_000 if quick else 100_000
+    amounts = np.random.default_rng(BENCH_SEED).uniform(10.0, 1_000_000.0, n).tolist()
+    results = []
+    for name, quote in (("buy", ex.get_buy_quote), ("sell", ex.get_sell_quote), ("system_buy", ex.get_system_buy_quote_for_usd), ("system_sell", ex.get_system_sell_quote_for_coins)):
+        def run():
+            for amount in amounts: quote(amount)
+        results.append((f"quote.{name}", n / _best(run), "quotes/s", True))
+    sizes = np.geomspace(10.0, ex.coin_pool * 0.5, 5_000) # One vectorized call: a full depth curve, as the liquidity chart draws it
+    results.append(("quote.depth_curve_5000", _best(lambda: ex.depth_curve(sizes)) * 1e3, "ms", False))
+    return results
+
+def bench_router(quick=False): # Order splitting across ROUTER_BENCH_POOLS pools of random depth/fee, and one arbitrage pass
+    rng = np.random.default_rng(BENCH_SEED); n = 5_000 if quick else 20_000
+    with _silent(): pools = [Exchange(c, u, f) for c, u, f in zip(rng.uniform(1e6, 3e7, ROUTER_BENCH_POOLS).tolist(), rng.uniform(3e5, 1e7, ROUTER_BENCH_POOLS).tolist(), rng.choice([0.0005, 0.003, 0.01], ROUTER_BENCH_POOLS).tolist())]
+    router = Router(pools); amounts = rng.uniform(1e3, 5e6, n).tolist(); results = []
+    for name, split in (("sell", router.split_sell), ("buy", router.split_buy), ("buy_usd", router.split_buy_usd)):
+        def run():
+            for amount in amounts: split(amount)
+        results.append((f"router.split_{name}_{ROUTER_BENCH_POOLS}", _best(run) / n * 1e6, "us/order", False))
+    def repeat(): # The same quote every frame while the pools stand still: served from the quote cache after the first
+        for _ in range(n): router.get_buy_quote(250_000.0)
+    results.append((f"router.quote_repeat_{ROUTER_BENCH_POOLS}", _best(repeat) / n * 1e6, "us/quote", False))
+    t0 = time.perf_counter(); router.arbitrage(); results.append((f"router.arbitrage_{ROUTER_BENCH_POOLS}", (time.perf_counter() - t0) * 1e3, "ms", False))
+    return results
+
+def bench_order_book(quick=False): # Mixed limit/cancel/market events on one book, then market orders routed across book + pool
+    rng = np.random.default_rng(BENCH_SEED); n = 60_000 if quick else BOOK_BENCH_EVENTS
+    sides = np.where(rng.random(n) < 0.5, 1, -1); prices = (0.33 * (1.0 - sides * (rng.exponential(0.01, n) - 0.001))).tolist() # A few limits cross
+    kinds = rng.random(n).tolist(); picks = rng.random(n).tolist(); sizes = rng.uniform(10.0, 1_000.0, n).tolist(); sides = sides.tolist()
+    add_share, cancel_share = BOOK_BENCH_MIX; books = []
+    def run():
+        book = OrderBook(); add = book.add; cancel = book.cancel; match = book.match; live = []
+        for kind, side, price, size, pick in zip(kinds, sides, prices, sizes, picks):
+            if kind < add_share:
+                order, _ = add(side, price, size)
+                if order is not None: live.append(order[4])
+            elif kind < add_share + cancel_share:
+                if live: j = int(pick * len(live)); live[j], live[-1] = live[-1], live[j]; cancel(live.pop())
+            else: match(side, size * 3)
+        books.append(book)
+    results = [("book.events", n / _best(run), "events/s", True)]
+    book = books[-1]; orders = 5_000 if quick else 20_000; sizes = rng.uniform(1e3, 2e5, orders).tolist()
+    with _silent(): pool = Exchange(SimConfig().EXCHANGE_INITIAL_COIN_LIQUIDITY, SimConfig().EXCHANGE_INITIAL_USD_LIQUIDITY)
+    t0 = time.perf_counter()
+    for side, size in zip(sides, sizes): route_order(book, pool, side, size)
+    results.append(("book.route_hybrid", (time.perf_counter() - t0) / orders * 1e6, "us/order", False))
+    return results
+
+def bench_user_activity(quick=False):
+    results = []
+    for model, users, days in (("agents", 1_000, 50), ("agents", 100_000, 5), ("agents", 1_000_000, 3), ("cohorts", 100_000, 5), ("cohorts", 1_000_000, 3), ("cohorts", 10_000_000, 2)):
+        if quick and users > 100_000: continue
+        network = _network(users - SimConfig().INITIAL_USERS, USER_MODEL=model)
+        with _silent(): network.run_days(2) # Warm-up: users pick up some COIN so sells happen too
+        def run():
+            for _ in range(days): network.day += 1; network.simulate_user_activity()
+        results.append((f"users.{'activity' if model == 'agents' else 'cohorts'}_{format_num(users).replace(',', '_')}", _best(run) / days * 1e3, "ms/day", False))
+    return results
+
+def bench_market_maker(quick=False):
+    network = _network(); ex = network.exchange; days = 500 if quick else 2_000
+    rng = np.random.default_rng(BENCH_SEED); sides = np.where(rng.random(days) < 0.5, 1, -1); sizes = rng.uniform(1e4, 5e5, days)
+    total = 0.0
+    with _silent():
+        for d in range(days): # Move the pool with one untimed trade, then time the MM's reaction to it
+            ex.execute_batch(sides[d:d + 1], sizes[d:d + 1], [np.inf]); network.day += 1
+            t0 = time.perf_counter(); network.run_market_maker_logic(); total += time.perf_counter() - t0
+    return [("mm.logic_per_day", total / days * 1e3, "ms/day", False)]
+
+def bench_day_loop(quick=False):
+    years = 1 if quick else 10
+    network = _network(nodes=FRAME_BENCH_NODES)
+    with _silent(): elapsed = _best(lambda: network.run_days(years * network.config.DAYS_PER_YEAR), repeats=1)
+    return [(f"rewards.{years}y_{format_num(FRAME_BENCH_NODES).replace(',', '_')}_nodes", elapsed, "s", False)]
+
+def bench_scheduler(quick=False): # Raw dispatch of no-op events, and the day loop's event rate with the day cut into slices
+    from scheduler import Scheduler
+    events = 200_000 if quick else 1_000_000; results = []
+    for label, spread in (("distinct_times", events), ("shared_times", 1_000)): # Every event at its own second, or 1000 events per second
+        def run():
+            sched = Scheduler(); noop = lambda argument: None
+            for i in range(events): sched.at(i % spread, noop)
+            sched.run_until(spread)
+        results.append((f"scheduler.{label}", events / _best(run) / 1e6, "M events/s", True))
+    users = 10_000; days = 5 if quick else 20; slices = 24
+    network = _network(users - SimConfig().INITIAL_USERS, DAY_SLICES=slices)
+    with _silent():
+        network.run_days(2); ran = network.scheduler.processed
+        elapsed = _best(lambda: network.run_days(days), repeats=1); ran = network.scheduler.processed - ran
+    results += [(f"scheduler.day_{slices}_slices_rate", ran / elapsed, "events/s", True), (f"scheduler.day_{slices}_slices", elapsed / days * 1e3, "ms/day", False)]
+    return results
+
+def bench_metrics(quick=False): # Per-day metrics stream: the day listener's cost, then batch writes per format, against the day loop itself
+    days = 1_000 if quick else 5_000; network = _network()
+    with _silent(): day = _best(lambda: network.run_days(days), repeats=1) / days
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in ("csv", "parquet") if pyarrow_available() else ("csv",):
+            warmup = MetricsWriter(os.path.join(tmp, f"warmup.{fmt}"), interval=3600); MetricsRecorder(warmup)(network); warmup.close() # First-use costs (pyarrow)
+            writer = MetricsWriter(os.path.join(tmp, f"metrics.{fmt}"), interval=3600); recorder = MetricsRecorder(writer) # Flushed by close() below
+            t0 = time.perf_counter()
+            for _ in range(days): recorder(network)
+            record = (time.perf_counter() - t0) / days; writer.close(); write = writer.seconds / writer.written
+            if not results: results.append(("metrics.record", record * 1e6, "us/day", False))
+            results += [(f"metrics.{fmt}_write", write * 1e6, "us/row", False), (f"metrics.{fmt}_overhead", (record + write) / day * 100, "% of day", False)]
+    return results
+
+def bench_frame(quick=False): # Full frames of code.py: event handling + every draw phase + flip, clock.tick disabled
+    import pygame
+    import engine
+    frames = 60 if quick else FRAME_BENCH_FRAMES; stamps = []
+    original_init = engine.Network.__init__
+    def init(self, *args, **kwargs): # Filled node table, long price history, and a worker that stays idle during the run
+        original_init(self, *args, **kwargs); self.config.DAY_DURATION = 1e9
+        for _ in range(FRAME_BENCH_NODES): self.add_node(self.config.MIN_STAKE, 5, is_our=False, silent=True)
+        walk = 0.33 * np.exp(np.cumsum(np.random.default_rng(BENCH_SEED).normal(0, 0.01, FRAME_BENCH_HISTORY)))
+        self.price_history = deque(walk.tolist())
+    def get_events(): return [pygame.event.Event(pygame.QUIT)] if len(stamps) >= frames else []
+    def flip(): stamps.append(time.perf_counter()); original_flip()
+    class NoWaitClock:
+        def tick(self, framerate=0): return 0
+    original_flip = pygame.display.flip; original_get = pygame.event.get; original_clock = pygame.time.Clock
+    engine.Network.__init__ = init; pygame.display.flip = flip; pygame.event.get = get_events; pygame.time.Clock = NoWaitClock
+    try:
+        with _silent(): runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "code.py"), run_name="__main__")
+    except SystemExit: pass
+    finally: engine.Network.__init__ = original_init; pygame.display.flip = original_flip; pygame.event.get = original_get; pygame.time.Clock = original_clock
+    frame_times = np.diff(stamps[10:]) * 1e3 # Skip warm-up frames (first plot build, text cache fill)
+    return [("frame.draw_p50", float(np.median(frame_times)), "ms/frame", False), ("frame.draw_p99", float(np.percentile(frame_times, 99)), "ms/frame", False)]
+
+# Child scripts for bench_startup: argv[1] is the parent's time.time() at launch, the result goes to stdout as "<seconds> <pygame loaded>"
+STARTUP_IMPORT_SCRIPT = """import sys, time
+import engine
+print(time.time() - float(sys.argv[1]), "pygame" in sys.modules)"""
+STARTUP_FRAME_SCRIPT = """import sys, os, time, runpy, contextlib
+import pygame
+def flip(): print(time.time() - float(sys.argv[1]), True, file=sys.__stdout__, flush=True); os._exit(0)
+pygame.display.flip = flip
+with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull): runpy.run_path("code.py", run_name="__main__")"""
+
+def _startup_run(script): # (seconds from launch, pygame loaded) for one fresh interpreter in this directory
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    out = subprocess.run([sys.executable, "-c", script, repr(time.time())], cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, timeout=120)
+    seconds, loaded = out.stdout.split()[-2:]
+    return float(seconds), loaded == "True"
+
+def bench_startup(quick=False): # Cold start: importing the engine (must not pull in pygame), and launching the UI up to its first frame
+    runs = 3 if quick else STARTUP_BENCH_RUNS
+    imports = [_startup_run(STARTUP_IMPORT_SCRIPT) for _ in range(runs)]; frames = [_startup_run(STARTUP_FRAME_SCRIPT)[0] for _ in range(runs)]
+    if any(loaded for _, loaded in imports): print("Warning: importing engine loaded pygame", file=sys.stderr)
+    return [("startup.import_engine", min(t for t, _ in imports) * 1e3, "ms", False), ("startup.first_frame", min(frames) * 1e3, "ms", False)]
+
+BENCHMARKS = {"quotes": bench_quotes, "router": bench_router, "book": bench_order_book, "users": bench_user_activity, "mm": bench_market_maker, "rewards": bench_day_loop, "sched": bench_scheduler, "metrics": bench_metrics, "frame": bench_frame, "startup": bench_startup}
+
+# --- Baselines ---
+def machine_info():
+    return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+def compare(results, baseline): # {name: % change, signed so that positive = better}
+    old = {r["name"]: r for r in baseline.get("results", [])}; deltas = {}
+    for r in results:
+        b = old.get(r["name"])
+        if b and b["value"]: change = (r["value"] - b["value"]) / b["value"] * 100.0; deltas[r["name"]] = change if r["higher_is_better"] else -change
+    return deltas
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the exchange, order router, order book, user simulation, market maker, day loop, frame rendering and startup time.")
+    parser.add_argument("--only", default=None, help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes (skips the 1M-user case)")
+    parser.add_argument("--save", metavar="PATH", help="Write results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a saved baseline")
+    parser.add_argument("--fail-over", type=float, default=None, metavar="PCT", help="Exit 1 if any benchmark regressed by more than PCT percent")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS: parser.error(f"unknown benchmark '{name}'")
+    results = []
+    for name in names:
+        t0 = time.perf_counter()
+        for bench_name, value, unit, higher in BENCHMARKS[name](args.quick): results.append({"name": bench_name, "value": value, "unit": unit, "higher_is_better": higher})
+        print(f"[{name}] done in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    deltas = {}
+    if args.baseline:
+        with open(args.baseline) as f: deltas = compare(results, json.load(f))
+    print(f"{'benchmark':<32}{'value':>16}  {'unit':<10}{'vs baseline':>12}")
+    for r in results:
+        delta = f"{deltas[r['name']]:+.1f}%" if r["name"] in deltas else ""
+        print(f"{r['name']:<32}{r['value']:>16,.3f}  {r['unit']:<10}{delta:>12}")
+    if args.save:
+        with open(args.save, "w") as f: json.dump({"created": time.time(), "quick": args.quick, "machine": machine_info(), "results": results}, f, indent=2)
+        print(f"Baseline saved: {args.save}")
+    regressions = [name for name, pct in deltas.items() if args.fail_over is not None and pct < -args.fail_over]
+    if regressions: print(f"Regressed by more than {args.fail_over}%: {', '.join(regressions)}", file=sys.stderr); return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
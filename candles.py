@@ -0,0 +1,103 @@
+# CANDLES - Daily OHLCV history stored as fixed-width columns in one append-only memory-mapped file
+#
+# File layout (little-endian):
+#   magic  b"BSGCNDL\0"   8 bytes
+#   u32    format version
+#   u32    column count
+#   u64    capacity (rows reserved per column)
+#   u64    size (rows written)
+#   ...    zero padding up to CANDLE_HEADER_BYTES
+#   column 0 [capacity x 8 bytes], column 1 [capacity x 8 bytes], ... in CANDLE_COLUMNS order
+# The file is created sparse, so reserved rows cost no disk until written; when it fills up it is rewritten with
+# twice the capacity. Reads are numpy views straight into the mapping: a range query copies nothing, and only the
+# pages actually touched are resident, so RAM use stays flat however many years the run covers.
+
+import os
+import sys
+import struct
+import numpy as np
+
+CANDLE_MAGIC = b"BSGCNDL\0"
+CANDLE_VERSION = 1
+CANDLE_HEADER_BYTES = 4096 # One page: every column starts page-aligned
+CANDLE_INITIAL_CAPACITY = 4096 # Rows (~11 simulated years) before the first regrow
+_HEADER = struct.Struct("<8sIIQQ")
+
+CANDLE_COLUMNS = ( # All 8 bytes wide, so column i starts at CANDLE_HEADER_BYTES + i * capacity * 8
+    ("day", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("trades", "<i8"), ("volume_coin", "<f8"), ("volume_usd", "<f8"), ("fees_usd", "<f8"),
+    ("coin_pool", "<f8"), ("usd_pool", "<f8"), ("mm_coin", "<f8"), ("mm_usd", "<f8"),
+)
+
+class CandleError(Exception): pass
+
+# --- Candle Store ---
+class CandleStore:
+    def __init__(self, path, capacity=CANDLE_INITIAL_CAPACITY): # Opens an existing store for appending, or creates a new one
+        self.path = path
+        if not os.path.exists(path) or os.path.getsize(path) == 0: _create(path, max(1, int(capacity)))
+        self._map()
+
+    def _map(self):
+        with open(self.path, "rb") as f: prefix = f.read(_HEADER.size)
+        if len(prefix) < _HEADER.size: raise CandleError(f"'{self.path}' is too short to be a candle store")
+        magic, version, num_columns, capacity, size = _HEADER.unpack(prefix)
+        if magic != CANDLE_MAGIC: raise CandleError(f"'{self.path}' is not a candle store")
+        if version > CANDLE_VERSION: raise CandleError(f"Candle store format v{version} is newer than supported v{CANDLE_VERSION}")
+        if num_columns != len(CANDLE_COLUMNS): raise CandleError(f"'{self.path}' has {num_columns} columns, expected {len(CANDLE_COLUMNS)}")
+        self.capacity = capacity; self.size = size
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode="r+")
+        self._meta = np.ndarray((2,), dtype="<u8", buffer=self._mm, offset=16) # [capacity, size], live in the mapped header
+        self.columns = {name: np.ndarray((capacity,), dtype=dtype, buffer=self._mm, offset=_column_offset(i, capacity))
+                        for i, (name, dtype) in enumerate(CANDLE_COLUMNS)}
+
+    def _grow(self): # Rewrites into a file with twice the capacity; views handed out earlier keep reading the old mapping
+        new_capacity = self.capacity * 2; tmp_path = f"{self.path}.tmp"
+        _create(tmp_path, new_capacity, self.size)
+        new = np.memmap(tmp_path, dtype=np.uint8, mode="r+")
+        for i, (name, dtype) in enumerate(CANDLE_COLUMNS):
+            np.ndarray((self.size,), dtype=dtype, buffer=new, offset=_column_offset(i, new_capacity))[:] = self.columns[name][:self.size]
+        new.flush(); del new
+        self._mm.flush(); os.replace(tmp_path, self.path)
+        self._map()
+
+    def __len__(self): return self.size
+
+    def append(self, **values): # One row; every name in CANDLE_COLUMNS is required (None -> NaN)
+        if self.size == self.capacity: self._grow()
+        i = self.size; columns = self.columns
+        for name, _ in CANDLE_COLUMNS:
+            value = values[name]; columns[name][i] = np.nan if value is None else value
+        self.size = i + 1; self._meta[1] = self.size
+
+    # --- Reads (zero-copy views, valid until the next regrow) ---
+    def column(self, name): return self.columns[name][:self.size]
+    def rows(self, start, stop): stop = min(stop, self.size); return {name: col[start:max(start, stop)] for name, col in self.columns.items()}
+    def days(self, first_day, last_day): # Candles for days first_day..last_day inclusive, e.g. store.days(10_000, 12_000)["close"]
+        days = self.column("day")
+        start = int(np.searchsorted(days, first_day, side="left")); stop = int(np.searchsorted(days, last_day, side="right"))
+        return {name: col[start:max(start, stop)] for name, col in self.columns.items()}
+    def last_day(self): return int(self.columns["day"][self.size - 1]) if self.size else None
+
+    def rewind(self, day): # Drops every candle after `day` (e.g. when a run resumes from an older snapshot)
+        self.size = int(np.searchsorted(self.column("day"), day, side="right")); self._meta[1] = self.size
+
+    def flush(self): self._mm.flush()
+    def close(self): self.flush(); self.columns = {}; self._meta = None; self._mm = None
+
+def _column_offset(index, capacity): return CANDLE_HEADER_BYTES + index * capacity * 8
+
+def _create(path, capacity, size=0):
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(CANDLE_MAGIC, CANDLE_VERSION, len(CANDLE_COLUMNS), capacity, size))
+        f.truncate(_column_offset(len(CANDLE_COLUMNS), capacity)) # Sparse: no blocks allocated until rows are written
+
+# --- Recording ---
+class CandleRecorder: # Day listener: network.add_day_listener(CandleRecorder(CandleStore("run.candles")))
+    def __init__(self, store): self.store = store
+    def __call__(self, network):
+        exchange = network.exchange; store = self.store
+        if exchange is None: return
+        if store.size and store.last_day() >= network.day: # Resumed from an earlier day: the old future is overwritten
+            print(f"[Candles] Rewinding '{store.path}' to day {network.day - 1}", file=sys.stderr); store.rewind(network.day - 1)
+        store.append(day=network.day, mm_coin=network.mm_coin_balance, mm_usd=network.mm_usd_balance, **exchange.session_candle())
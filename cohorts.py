@@ -0,0 +1,156 @@
+# COHORTS - Mean-field user model: users trade as balance/behavior cohorts, a few pool touches per day
+#
+# Who trades is drawn as in the agent model (active users, then buy or sell per slot), but their orders are not sent one
+# by one. Each trader joins a cohort: (behavior, bucket of the balance it trades from: USD for buyers, COIN for sellers),
+# buckets log-spaced COHORT_BUCKET_RATIO apart. A cohort's flow comes from its aggregate statistics in closed form, with
+# the agent rules: a buyer spends min(USD, cost of U), a seller sells min(U, USER_TRADE_PERCENT_MAX * COIN), where
+# U ~ uniform(SIMULATED_TRADE_MIN_COINS, SIMULATED_TRADE_MAX_COINS); the sum over the cohort is taken as normal (mean +
+# CLT noise). All cohorts' buys, then sells (alternating), hit the main pool as one order each in COHORT_POOL_SLICES
+# slices per slot, buys re-priced at each slice (with DAY_SLICES > 1 the slot's flow is shared out over the day's
+# slices, see Network.trade_slot, still about COHORT_POOL_SLICES orders per side in all). Fills go back to each cohort
+# by its part of the flow, and to its members by balance: a buyer's USD and a seller's COIN shrink by the cohort's
+# filled fraction. So wallets still evolve one by one (capped buyers go all-in, as agents do) while the per-trade cost
+# becomes a few O(traders) array passes.
+
+import math
+import numpy as np
+
+COHORT_BUCKET_RATIO = 2.0 # Balance ratio between neighbouring buckets
+COHORT_BALANCE_FLOOR = 0.01 # Balances below this fall in bucket 0
+COHORT_BUCKETS = 48 # Per behavior, bucket 0 included: the top bucket starts at FLOOR * RATIO^46 (~7e11)
+BEHAVIOR_HASH = 0.6180339887498949 # Golden-ratio stride: spreads behaviors evenly over user indices, with no stored column
+
+def behavior_of(indices, behaviors): # Behavior number of each user index, by the shares in USER_BEHAVIORS (name, share, buy probability, size scale)
+    shares = np.cumsum([b[1] for b in behaviors], dtype=np.float64); shares /= shares[-1]
+    return np.minimum(np.searchsorted(shares, (np.asarray(indices) * BEHAVIOR_HASH) % 1.0, side="right"), len(behaviors) - 1)
+
+def _capped_moments(cap, lo, hi): # Mean and variance of min(cap, X), X ~ uniform(lo, hi), elementwise
+    cap = np.clip(cap, lo, hi); width = np.maximum(hi - lo, 1e-300)
+    mean = ((cap * cap - lo * lo) / 2.0 + cap * (hi - cap)) / width
+    second = ((cap ** 3 - lo ** 3) / 3.0 + cap * cap * (hi - cap)) / width
+    return mean, np.maximum(second - mean * mean, 0.0)
+
+def _per(part, whole): return np.divide(part, whole, out=np.zeros_like(part), where=whole > 0) # Per unit of balance, 0 for empty cohorts
+
+class CohortModel:
+    def __init__(self, config):
+        self.config = config; behaviors = config.USER_BEHAVIORS; self.cohorts = len(behaviors) * COHORT_BUCKETS
+        self.buy_probability = np.array([b[2] for b in behaviors], dtype=np.float64)
+        self.size_scale = np.repeat(np.array([b[3] for b in behaviors], dtype=np.float64), COHORT_BUCKETS) # Per cohort
+        self.pool_orders = 0 # Aggregate orders sent to the pool so far
+        self.active = None; self.kind = None # Today's active users and their behaviors (start_day)
+
+    @staticmethod
+    def bucket(balances): # Bucket index per balance: 0 below the floor, then one per COHORT_BUCKET_RATIO
+        raw = np.floor(np.log(np.maximum(balances, COHORT_BALANCE_FLOOR * 0.5) / COHORT_BALANCE_FLOOR) / math.log(COHORT_BUCKET_RATIO)) + 1
+        return np.clip(raw, 0, COHORT_BUCKETS - 1).astype(np.int64)
+
+    def simulate_day(self, network): # One day of user trading on network.exchange; returns the number of pool orders sent
+        self.start_day(network); return sum(self.trade_slot(network) for _ in range(self.config.TRADES_PER_ACTIVE_USER))
+
+    def start_day(self, network): # Draws today's active users; trade_slot() then runs one trade slot each
+        cfg = self.config
+        self.active = active = np.flatnonzero(network.rng.random(len(network.users)) < cfg.DAILY_ACTIVE_USER_PERCENT) # Each user active with that probability: no costly sample without replacement
+        self.kind = behavior_of(active, cfg.USER_BEHAVIORS) if len(cfg.USER_BEHAVIORS) > 1 else None # None: one behavior, cohort = bucket
+
+    def trade_slot(self, network): # One trade slot of today's active users, all at once; returns the number of pool orders sent
+        slot = self.open_slot(network)
+        if slot is None: return 0
+        orders = self.run_flows(network, slot); self.settle(network, slot); return orders
+
+    # A slot in three steps, so the scheduler can spread its flow over the day: open_slot() draws who trades and the
+    # cohorts' flows, run_flows() sends a share of them to the pool (COHORT_POOL_SLICES orders per side), settle() pays
+    # the members once the shares add up to 1.
+    def open_slot(self, network):
+        cfg = self.config; users = network.users; rng = network.rng; cohorts = self.cohorts; active = self.active; kind = self.kind
+        if active is None or network.exchange.k == 0.0: return None
+        buy_probability = self.buy_probability[kind] if kind is not None else self.buy_probability[0]
+        lo = cfg.SIMULATED_TRADE_MIN_COINS * self.size_scale; hi = cfg.SIMULATED_TRADE_MAX_COINS * self.size_scale
+        is_buy = rng.random(len(active)) < buy_probability
+        buyers = active[is_buy]; usd_b = users.usd[buyers]; keep = usd_b > 0.01
+        buyers = buyers[keep]; usd_b = usd_b[keep]; label_b = self.bucket(usd_b) if kind is None else kind[is_buy][keep] * COHORT_BUCKETS + self.bucket(usd_b)
+        sellers = active[~is_buy]; coin_s = users.coin[sellers]; keep = coin_s > 0
+        sellers = sellers[keep]; coin_s = coin_s[keep]; label_s = self.bucket(coin_s) if kind is None else kind[~is_buy][keep] * COHORT_BUCKETS + self.bucket(coin_s)
+        n_b = np.bincount(label_b, minlength=cohorts); usd = np.bincount(label_b, weights=usd_b, minlength=cohorts)
+        n_s = np.bincount(label_s, minlength=cohorts); coin = np.bincount(label_s, weights=coin_s, minlength=cohorts)
+        # Sell flow is in COIN, so it is fixed for the slot; buy flow is re-priced at every pool order
+        cap = coin / np.maximum(n_s, 1) * cfg.USER_TRADE_PERCENT_MAX; mean, var = _capped_moments(cap, lo, hi)
+        mean = np.where(cap >= cfg.SIMULATED_TRADE_MIN_COINS, mean, 0.0) # Below the minimum size: no trade
+        sell = np.clip(n_s * mean + np.sqrt(n_s * var) * rng.standard_normal(cohorts), 0.0, np.minimum(n_s * cap, coin))
+        return {"buyers": buyers, "usd_b": usd_b, "label_b": label_b, "sellers": sellers, "coin_s": coin_s, "label_s": label_s,
+                "n_b": n_b, "usd": usd, "coin": coin, "sell": sell, "lo": lo, "hi": hi, "cap_b": usd / np.maximum(n_b, 1), "noise": rng.standard_normal(cohorts),
+                "spent": np.zeros(cohorts), "bought": np.zeros(cohorts), "sold": np.zeros(cohorts), "proceeds": np.zeros(cohorts), "step": 0}
+
+    def run_flows(self, network, slot, share=1.0): # Sends `share` of the slot's flows to the main pool; returns the number of pool orders
+        cfg = self.config; exchange = network.exchange; slices = max(1, int(round(cfg.COHORT_POOL_SLICES * share))); orders = 0 # About COHORT_POOL_SLICES per slot in all
+        n_b = slot["n_b"]; cap_b = slot["cap_b"]; usd = slot["usd"]; spent = slot["spent"]; bought = slot["bought"]; sold = slot["sold"]; proceeds = slot["proceeds"]
+        sell = slot["sell"] * share / slices
+        for _ in range(slices):
+            if exchange.k == 0.0: break
+            q = exchange.usd_pool / exchange.coin_pool * (1.0 + exchange.fee_rate) # Marginal buy cost, fee included
+            mean, var = _capped_moments(cap_b, slot["lo"] * q, slot["hi"] * q); mean = np.where(cap_b >= cfg.SIMULATED_TRADE_MIN_COINS * q, mean, 0.0)
+            spend = np.clip(np.clip(n_b * mean + np.sqrt(n_b * var) * slot["noise"], 0.0, n_b * cap_b) * share / slices, 0.0, usd - spent)
+            for side in ((1, -1) if slot["step"] % 2 == 0 else (-1, 1)):
+                flow = spend if side > 0 else sell; total = float(flow.sum())
+                if total <= 0.0: continue
+                fill = exchange.execute_budget_buys([total]) if side > 0 else exchange.execute_batch([-1], [total], [total]); orders += 1
+                if not fill["filled"][0]: continue
+                flow_share = flow / total
+                if side > 0: spent += flow_share * fill["usd"][0]; bought += flow_share * fill["coins"][0]
+                else: sold += flow; proceeds += flow_share * fill["usd"][0]
+            slot["step"] += 1
+        self.pool_orders += orders; return orders
+
+    def settle(self, network, slot): # Members share their cohort's fills by balance: buyers per USD held, sellers per COIN held
+        users = network.users; usd = slot["usd"]; coin = slot["coin"]; usd_b = slot["usd_b"]; coin_s = slot["coin_s"]
+        if len(slot["buyers"]): users.apply_trades(slot["buyers"], _per(slot["bought"], usd)[slot["label_b"]] * usd_b, -np.minimum(_per(slot["spent"], usd), 1.0)[slot["label_b"]] * usd_b)
+        if len(slot["sellers"]): users.apply_trades(slot["sellers"], -np.minimum(_per(slot["sold"], coin), 1.0)[slot["label_s"]] * coin_s, _per(slot["proceeds"], coin)[slot["label_s"]] * coin_s)
+
+# --- Validation ---
+# Runs the same configuration under both user models (several seeds each) and compares their price paths: the gap
+# between the two ensemble means against the spread of the runs around them, return volatility, and run time.
+def validation_report(users=20_000, days=180, seeds=4, workers=None, base_seed=0):
+    import os, time
+    from sweep import make_tasks, run_sweep, collect # Deferred: sweep imports engine, which imports this module
+    report = {"users": users, "days": days, "seeds": seeds, "models": {}}; paths = {}
+    for model in ("agents", "cohorts"):
+        tasks = make_tasks({"USER_MODEL": [model], "INITIAL_USERS": [users]}, seeds, days, base_seed)
+        t0 = time.perf_counter(); data, _ = collect(run_sweep(tasks, workers), len(tasks), days); elapsed = time.perf_counter() - t0
+        price = data[:, 0, :].astype(np.float64); paths[model] = price
+        returns = np.diff(np.log(price), axis=1)
+        report["models"][model] = {"final_price_mean": float(np.mean(price[:, -1])), "final_price_std": float(np.std(price[:, -1])),
+                                   "daily_volatility": float(np.mean(np.std(returns, axis=1))), "seconds_per_day": elapsed * min(workers or os.cpu_count() or 1, len(tasks)) / (len(tasks) * days)}
+    agents = paths["agents"]; cohort = paths["cohorts"]; mean_a = agents.mean(axis=0); mean_c = cohort.mean(axis=0)
+    gap = np.abs(mean_c - mean_a) / mean_a; spread = np.sqrt((agents.var(axis=0) + cohort.var(axis=0)) / 2.0)
+    report["mean_relative_gap"] = float(gap.mean()); report["max_relative_gap"] = float(gap.max()); report["final_relative_gap"] = float(gap[-1])
+    report["max_gap_in_spreads"] = float(np.max(np.abs(mean_c - mean_a) / np.maximum(spread, 1e-12))) # Gap in run-to-run standard deviations
+    report["path_correlation"] = float(np.corrcoef(mean_a, mean_c)[0, 1])
+    return report
+
+def format_report(report):
+    lines = [f"Cohort vs agent user model: {report['users']:,} users, {report['days']} days, {report['seeds']} seeds per model"]
+    for model, stats in report["models"].items():
+        lines.append(f"  {model:<8} final price ${stats['final_price_mean']:.5f} +/- {stats['final_price_std']:.5f} | daily volatility {stats['daily_volatility']:.3%} | {stats['seconds_per_day'] * 1e3:.2f} ms/day")
+    lines.append(f"  Mean price path gap: mean {report['mean_relative_gap']:.2%}, max {report['max_relative_gap']:.2%}, final {report['final_relative_gap']:.2%} "
+                 f"(max {report['max_gap_in_spreads']:.1f} run-to-run std devs) | path correlation {report['path_correlation']:.4f}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    import sys, json, argparse
+    parser = argparse.ArgumentParser(description="Compare price paths of the agent-based and cohort user models.")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--seeds", type=int, default=4, help="Runs per model")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", metavar="PATH", help="Also write the report here")
+    args = parser.parse_args(argv)
+    report = validation_report(args.users, args.days, args.seeds, args.workers)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+        print(f"Report saved: {args.json}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,1128 @@
+# ENGINE v3.5.13 - Headless simulation core (no pygame, no wall-clock pacing)
+
+import time
+import sys
+import os
+import argparse
+import contextlib
+import math
+import numpy as np
+from collections import deque # Needed for efficient price history management & MM state
+from ledger import UserLedger, NodeLedger # Columnar user/node storage
+from profiler import PhaseProfiler
+from router import Router
+from orderbook import OrderBook, route_order, cross_with_pool
+from cohorts import CohortModel, behavior_of
+from scheduler import Scheduler, SECONDS_PER_DAY, SPEEDS
+from eventlog import EventLog, DEBUG, INFO, WARNING, ERROR, LEVELS_BY_NAME
+
+# --- Constants ---
+TOTAL_COINS = 5_000_000_000
+YEARLY_REWARD_RATE = 0.02
+DAYS_PER_YEAR = 365
+MIN_STAKE = 100_000
+DAY_DURATION = 8 # Ускорим немного для тестов ММ
+CATCHUP_FRAME_BUDGET = 0.008 # Max seconds of simulation per distribute_rewards() call while behind real time (<=0: no limit)
+DAY_SLICES = 1 # Reward emission, site traffic and MM checks happen once per slice of the day; user orders are timestamped across it (1: one batch per day)
+INITIAL_USERS = 10
+INITIAL_USER_USD = 20.0
+INITIAL_SYSTEM_USD = 10_000_000.0 # USD, остающийся у "системы" ПОСЛЕ выделения ММ
+EXCHANGE_INITIAL_COIN_LIQUIDITY = 30_000_000.0
+EXCHANGE_INITIAL_USD_LIQUIDITY = 10_000_000.0
+EXCHANGE_FEE_RATE = 0.003
+EXCHANGE_EXTRA_POOLS = () # More COIN/USD pools next to the main one: (coin liquidity, usd liquidity, fee rate) each; orders are routed across all
+ARBITRAGE_MIN_PROFIT_USD = 1.0 # End-of-day arbitrage between pools only runs when it would earn more than this
+ORDER_BOOK_TICK = 0.0001 # USD price step of the limit order book that sits next to the main pool
+USER_LIMIT_ORDER_PERCENT = 0.0 # Share of simulated user orders posted as limit orders instead of market orders (0: users never post)
+USER_LIMIT_ORDER_MAX_OFFSET = 0.05 # Limit prices are drawn up to this far from spot: below it for bids, above it for asks
+ORDER_TTL_DAYS = 3 # Resting orders still on the book this many days after posting are cancelled and refunded
+DAILY_ACTIVE_USER_PERCENT = 0.30
+TRADES_PER_ACTIVE_USER = 2
+SIMULATED_TRADE_MIN_COINS = 10.0
+SIMULATED_TRADE_MAX_COINS = 1000000.0
+USER_TRADE_PERCENT_MAX = 0.60
+USER_BEHAVIORS = (("retail", 1.0, 0.5, 1.0),) # (name, share of users, buy probability per trade, trade size scale); users are spread over them by index
+USER_MODEL = "agents" # "agents": every active user trades on its own; "cohorts": users trade as balance/behavior cohorts (mean-field, see cohorts.py)
+COHORT_POOL_SLICES = 4 # Cohort mode: slices per trade slot, each one aggregate buy and one aggregate sell on the main pool
+GRAPH_MAX_POINTS = 365
+SITE_TRAFFIC_USER_PERCENT = 0.30
+SITE_USD_REVENUE_PER_TRAFFIC_UNIT = 0.02
+SITE_REWARD_USD_PERCENTAGE = 0.80
+
+# --- Market Maker v1.5 Constants ---
+MM_ENABLED = True
+MM_INITIAL_COIN_ALLOCATION = 50_000_000.0 # Начальный баланс COIN для ММ
+MM_INITIAL_USD_ALLOCATION =  5_000_000.0 # Начальный баланс USD для ММ
+# --- v1.2 Params ---
+MM_BASE_REACTION_PERCENT = 0.50     # % от изменения пула, который ММ пытается компенсировать (25%)
+MM_PRICE_TARGET = 2.0             # Целевая цена для модификатора
+MM_PRICE_MODIFIER_BELOW_TARGET = {'sell': 1.1, 'buy': 0.9} # Множители объема < $2
+MM_PRICE_MODIFIER_ABOVE_TARGET = {'sell': 0.8, 'buy': 1.2} # Множители объема >= $2
+MM_POOL_IMPACT_PERCENT = 0.4    # Макс. влияние на ликвидность пула (0.5%)
+MM_MAX_BALANCE_USAGE_PERCENT = 0.40 # Макс % от *своего* баланса, который ММ использует за раз (10%)
+MM_MIN_COIN_BUFFER = 100_000.0    # Мин. остаток COIN у ММ
+MM_MIN_USD_BUFFER = 10_000.0     # Мин. остаток USD у ММ
+MM_MIN_TRADE_SIZE_COIN = 100.0
+MM_MIN_TRADE_SIZE_USD = 50.0
+MM_ACTION_EPSILON = 1.0           # Минимальное изменение пула (COIN), чтобы ММ среагировал
+# --- v1.5 Panic/Dip Buying Params ---
+MM_PANIC_THRESHOLD_PERCENT = 0.10     # Price drop % in 1 day to trigger panic buy
+MM_PANIC_DELTA_COIN_THRESHOLD_RATIO = 0.01 # Delta coin > 1% of pool to trigger panic buy
+MM_PANIC_BUY_BALANCE_USAGE_PERCENT = 0.30 # Use 30% of MM USD balance during panic
+# --- v1.5 Proactive Nudging Params ---
+MM_FAIR_VALUE_BASE = 0.30            # Base fair value at initial users
+MM_FAIR_VALUE_USER_SCALING = 1.0     # Scaling factor for user count in FV calc
+MM_FAIR_VALUE_DEVIATION_THRESHOLD = 0.15 # Price deviation > 15% from FV to nudge
+MM_PROACTIVE_BUY_USD = 2000.0       # Fixed USD amount for proactive buy
+MM_PROACTIVE_SELL_COIN = 500.0      # Fixed COIN amount for proactive sell
+# --- Order Book Quotes ---
+MM_BOOK_QUOTES = False              # Also quote a bid and an ask on the order book every day (replacing yesterday's)
+MM_QUOTE_SPREAD = 0.02              # Quotes sit this far below/above spot
+MM_QUOTE_SIZE_COIN = 100_000.0      # COIN per quote
+BOOK_OWNER_MM = -1                  # Order book owner tag of the MM's orders (users are tagged with their ledger index)
+
+# --- Ledger Debug ---
+LEDGER_CHECK_EVERY_DAYS = 0 # >0: every N days recount all running aggregates and report any drift (debug mode)
+
+PRICE_HISTORY_BUFFER_LEN = GRAPH_MAX_POINTS + 50
+FLOAT_EPSILON = sys.float_info.epsilon # Budget buys size themselves this many ulps short (see Exchange.affordable_spend)
+
+# --- Simulation Config ---
+# Every tuning knob above, bundled into one object so a Network can run with its own parameters
+# (sweeps, tuning, snapshots) without editing module globals. Defaults are the module constants.
+CONFIG_KEYS = (
+    "TOTAL_COINS", "YEARLY_REWARD_RATE", "DAYS_PER_YEAR", "MIN_STAKE", "DAY_DURATION", "CATCHUP_FRAME_BUDGET", "DAY_SLICES", "INITIAL_USERS", "INITIAL_USER_USD",
+    "INITIAL_SYSTEM_USD", "EXCHANGE_INITIAL_COIN_LIQUIDITY", "EXCHANGE_INITIAL_USD_LIQUIDITY", "EXCHANGE_FEE_RATE", "EXCHANGE_EXTRA_POOLS", "ARBITRAGE_MIN_PROFIT_USD",
+    "ORDER_BOOK_TICK", "USER_LIMIT_ORDER_PERCENT", "USER_LIMIT_ORDER_MAX_OFFSET", "ORDER_TTL_DAYS",
+    "DAILY_ACTIVE_USER_PERCENT", "TRADES_PER_ACTIVE_USER", "SIMULATED_TRADE_MIN_COINS", "SIMULATED_TRADE_MAX_COINS",
+    "USER_TRADE_PERCENT_MAX", "USER_BEHAVIORS", "USER_MODEL", "COHORT_POOL_SLICES", "GRAPH_MAX_POINTS", "SITE_TRAFFIC_USER_PERCENT", "SITE_USD_REVENUE_PER_TRAFFIC_UNIT",
+    "SITE_REWARD_USD_PERCENTAGE", "MM_ENABLED", "MM_INITIAL_COIN_ALLOCATION", "MM_INITIAL_USD_ALLOCATION",
+    "MM_BASE_REACTION_PERCENT", "MM_PRICE_TARGET", "MM_PRICE_MODIFIER_BELOW_TARGET", "MM_PRICE_MODIFIER_ABOVE_TARGET",
+    "MM_POOL_IMPACT_PERCENT", "MM_MAX_BALANCE_USAGE_PERCENT", "MM_MIN_COIN_BUFFER", "MM_MIN_USD_BUFFER", "MM_MIN_TRADE_SIZE_COIN",
+    "MM_MIN_TRADE_SIZE_USD", "MM_ACTION_EPSILON", "MM_PANIC_THRESHOLD_PERCENT", "MM_PANIC_DELTA_COIN_THRESHOLD_RATIO",
+    "MM_PANIC_BUY_BALANCE_USAGE_PERCENT", "MM_FAIR_VALUE_BASE", "MM_FAIR_VALUE_USER_SCALING", "MM_FAIR_VALUE_DEVIATION_THRESHOLD",
+    "MM_PROACTIVE_BUY_USD", "MM_PROACTIVE_SELL_COIN", "MM_BOOK_QUOTES", "MM_QUOTE_SPREAD", "MM_QUOTE_SIZE_COIN", "PRICE_HISTORY_BUFFER_LEN",
+    "LEDGER_CHECK_EVERY_DAYS")
+class SimConfig:
+    def __init__(self, **overrides):
+        for key in CONFIG_KEYS: value = globals()[key]; setattr(self, key, dict(value) if isinstance(value, dict) else list(value) if isinstance(value, (list, tuple)) else value) # Own copy of dict/list-valued knobs
+        for key, value in overrides.items():
+            if key not in CONFIG_KEYS: raise KeyError(f"Unknown config key '{key}'")
+            setattr(self, key, value)
+    def to_dict(self): return {key: getattr(self, key) for key in CONFIG_KEYS}
+    def __repr__(self): return f"SimConfig({', '.join(f'{k}={v!r}' for k, v in self.to_dict().items() if v != globals()[k])})"
+
+# --- Helper Functions ---
+def format_num(number, decimals=0):
+    try:
+        if number is None or (isinstance(number, (float, int)) and (math.isnan(number) or math.isinf(number))): return "N/A"
+        if decimals > 0: return f"{float(number):,.{decimals}f}"
+        else: return f"{int(number):,}"
+    except (ValueError, TypeError): return str(number)
+
+# --- Messages ---
+# Engine objects never touch UI globals; they report user-facing messages through notify().
+# A client (the pygame UI, a CLI...) can subscribe via on_message(text, level) with level in "success"/"warning"/"error".
+class Notifier:
+    on_message = None; last_message = None
+    def notify(self, text, level="error"):
+        self.last_message = {"text": text, "level": level, "time": time.time()}
+        if self.on_message: self.on_message(text, level)
+
+# --- Entity Classes ---
+# --- Exchange Class ---
+class Exchange(Notifier):
+    # Cumulative trade counters plus the open/high/low of the current session (one simulated day); see record_fill/start_session.
+    # Class-level defaults so instances restored without __init__ (snapshots) start from clean counters.
+    trade_count = 0; volume_coin = 0.0; volume_usd = 0.0; fees_usd = 0.0
+    events = None # EventLog shared with the owning Network (set by Network)
+    session_open = None; session_high = None; session_low = None; session_marks = (0, 0.0, 0.0, 0.0)
+    version = 0 # Pool-state version: bumped by every reserve mutation, so anything derived from the reserves can tell it is stale
+    def __init__(self, initial_coin_pool, initial_usd_pool, fee_rate=EXCHANGE_FEE_RATE):
+        self.coin_pool = float(initial_coin_pool); self.usd_pool = float(initial_usd_pool); self.fee_rate = float(fee_rate);
+        if self.coin_pool <= 1e-9 or self.usd_pool <= 1e-9: print(f"Warning: Exchange initialized with near-zero pools (C:{self.coin_pool}, U:{self.usd_pool}). Setting k=0.", file=sys.stderr); self.k = 0.0
+        else:
+            try: self.k = self.coin_pool * self.usd_pool
+            except OverflowError: print("Error: Overflow calculating initial k constant.", file=sys.stderr); self.k = 0.0
+        print(f"Exchange initialized. Coin Pool: {format_num(self.coin_pool)}, USD Pool: ${format_num(self.usd_pool, 2)}, k={format_num(self.k, 2) if self.k is not None else 'N/A'}")
+        self.start_session()
+    def _recalculate_k(self): # Every reserve mutation ends here (or in execute_batch), so this is where the version moves
+        self.version += 1
+        if self.coin_pool > 1e-9 and self.usd_pool > 1e-9:
+            try: self.k = self.coin_pool * self.usd_pool
+            except OverflowError: print("Error: Overflow recalculating k constant. Setting k=0.", file=sys.stderr); self.k = 0.0
+        else: self.k = 0.0
+    def get_spot_price(self):
+        try:
+            if self.coin_pool is None or self.usd_pool is None or self.k == 0.0: return None
+            if abs(self.coin_pool) < 1e-9: return None
+            price = self.usd_pool / self.coin_pool;
+            if math.isnan(price) or math.isinf(price) or price < 0: return None
+            return price
+        except (TypeError, OverflowError): return None
+        except Exception as e: print(f"ERROR in get_spot_price: {e}", file=sys.stderr); return None
+    def get_buy_quote(self, coin_amount_to_buy):
+        try:
+            dx = float(coin_amount_to_buy);
+            if dx <= 0 or self.k == 0.0: return None
+            if dx >= self.coin_pool - 1e-9: return None
+            x = self.coin_pool; y = self.usd_pool; target_x = x - dx;
+            if target_x <= 1e-9: return None
+            target_y = self.k / target_x; dy_gross = target_y - y; fee = dy_gross * self.fee_rate; dy_net = dy_gross + fee;
+            if dy_net <= 0 or math.isnan(dy_net) or math.isinf(dy_net): return None
+            effective_price = dy_net / dx; return {"usd_cost": dy_net, "fee": fee, "effective_price": effective_price}
+        except (TypeError, ValueError, OverflowError): return None
+        except Exception as e: print(f"ERROR in get_buy_quote: {e}", file=sys.stderr); return None
+    def get_sell_quote(self, coin_amount_to_sell):
+        try:
+            dx = float(coin_amount_to_sell);
+            if dx <= 0 or self.k == 0.0: return None
+            x = self.coin_pool; y = self.usd_pool; target_x = x + dx;
+            if target_x <= 1e-9: return None
+            target_y = self.k / target_x;
+            if target_y < 1e-9: target_y = 0
+            dy_gross = y - target_y; fee = dy_gross * self.fee_rate; dy_net = dy_gross - fee;
+            if dy_net <= 0 or math.isnan(dy_net) or math.isinf(dy_net): return None
+            usd_needed_from_pool = dy_gross;
+            if usd_needed_from_pool > self.usd_pool + 1e-9: return None
+            effective_price = dy_net / dx; return {"usd_received": dy_net, "fee": fee, "effective_price": effective_price}
+        except (TypeError, ValueError, OverflowError): return None
+        except Exception as e: print(f"ERROR in get_sell_quote: {e}", file=sys.stderr); return None
+    def get_system_buy_quote_for_usd(self, usd_amount_to_spend):
+        try:
+            dy = float(usd_amount_to_spend);
+            if dy <= 0 or self.k == 0.0: return None
+            x = self.coin_pool; y = self.usd_pool; target_y = y + dy;
+            if target_y <= 1e-9: return None
+            target_x = self.k / target_y;
+            if target_x < 1e-9: target_x = 0
+            dx_received = x - target_x;
+            if dx_received <= 0 or dx_received >= self.coin_pool - 1e-9 or math.isnan(dx_received) or math.isinf(dx_received): return None
+            effective_price = dy / dx_received if dx_received > 0 else float('inf');
+            if math.isnan(effective_price) or math.isinf(effective_price) or effective_price < 0: return None
+            return {"coins_received": dx_received, "usd_spent": dy, "effective_price": effective_price}
+        except (TypeError, ValueError, OverflowError): return None
+        except Exception as e: print(f"ERROR in get_system_buy_quote_for_usd: {e}", file=sys.stderr); return None
+    def get_system_sell_quote_for_coins(self, coin_amount_to_sell):
+        try:
+            dx = float(coin_amount_to_sell);
+            if dx <= 0 or self.k == 0.0: return None
+            x = self.coin_pool; y = self.usd_pool; target_x = x + dx;
+            if target_x <= 1e-9: return None
+            target_y = self.k / target_x;
+            if target_y < 1e-9: target_y = 0
+            dy_received = y - target_y;
+            if dy_received <= 0 or dy_received >= self.usd_pool - 1e-9 or math.isnan(dy_received) or math.isinf(dy_received): return None
+            effective_price = dy_received / dx if dx > 0 else 0;
+            if math.isnan(effective_price) or math.isinf(effective_price) or effective_price < 0: return None
+            return {"usd_received": dy_received, "coins_sold": dx, "effective_price": effective_price}
+        except (TypeError, ValueError, OverflowError): return None
+        except Exception as e: print(f"ERROR in get_system_sell_quote_for_coins: {e}", file=sys.stderr); return None
+
+    # --- Vectorized Quotes ---
+    # Array in, array out, with the arithmetic and fill rules of the scalar quotes above; sizes the pool can't fill come back
+    # as NaN. Thousands of sizes cost one NumPy pass, e.g. a full depth curve for the liquidity chart.
+    def get_buy_quotes(self, coin_amounts): # {"usd_cost", "fee", "effective_price"} per amount, as get_buy_quote
+        dx = np.asarray(coin_amounts, dtype=np.float64); x = self.coin_pool; y = self.usd_pool
+        with np.errstate(divide="ignore", invalid="ignore"):
+            target_x = x - dx; gross = self.k / target_x - y; fee = gross * self.fee_rate; cost = gross + fee
+            ok = (dx > 0) & (dx < x - 1e-9) & (target_x > 1e-9) & np.isfinite(cost) & (cost > 0) & (self.k != 0.0)
+            cost = np.where(ok, cost, np.nan); return {"usd_cost": cost, "fee": np.where(ok, fee, np.nan), "effective_price": cost / dx}
+    def get_sell_quotes(self, coin_amounts): # {"usd_received", "fee", "effective_price"} per amount, as get_sell_quote
+        dx = np.asarray(coin_amounts, dtype=np.float64); x = self.coin_pool; y = self.usd_pool
+        with np.errstate(divide="ignore", invalid="ignore"):
+            target_y = self.k / (x + dx); target_y = np.where(target_y < 1e-9, 0.0, target_y)
+            gross = y - target_y; fee = gross * self.fee_rate; received = gross - fee
+            ok = (dx > 0) & (x + dx > 1e-9) & np.isfinite(received) & (received > 0) & (gross <= y + 1e-9) & (self.k != 0.0)
+            received = np.where(ok, received, np.nan); return {"usd_received": received, "fee": np.where(ok, fee, np.nan), "effective_price": received / dx}
+    def max_buy_for_usd(self, usd_budgets): # Most COIN each budget buys, fee included: the inverse of get_buy_quote's usd_cost
+        # (1+f) * (k/(x - dx) - y) = B   =>   dx = B*x / ((1+f)*y + B), fed the affordable_spend() of B so the buy fills
+        budget = np.asarray(usd_budgets, dtype=np.float64); x = self.coin_pool; y = self.usd_pool
+        if self.k == 0.0: return np.zeros_like(budget)
+        with np.errstate(over="ignore"): spend = self.affordable_spend(np.maximum(budget, 0.0))
+        return np.where(spend > 0, spend * x / ((1.0 + self.fee_rate) * y + np.maximum(spend, 0.0)), 0.0)
+    def affordable_spend(self, budget): # What to size a budget buy with, so its cost as evaluated in floats never tops `budget`
+        # With u = eps/2, B = budget and g = (1+f)*y: the closed form's dx is off by <= 4u*dx (four roundings), which moves
+        # the cost by <= 4u*B*(1 + B/g); evaluating (1+f)*(k/(x - dx) - y) adds <= 3u*(g + 2B) (k, x - dx, the division,
+        # the subtraction, the fee). Total < u*(10B + 4B^2/g + 3g); the margin is twice that. It grows like B^2/y, so a
+        # budget far above the reserves still fits (a fixed fraction of B does not once B/y passes ~1e9).
+        g = (1.0 + self.fee_rate) * self.usd_pool
+        return budget - FLOAT_EPSILON * (10.0 * budget + 4.0 * budget * budget / g + 3.0 * g)
+    def depth_curve(self, coin_sizes): # Effective buy/sell price per size and its slippage from spot (fractions), NaN past what the pool can fill
+        sizes = np.asarray(coin_sizes, dtype=np.float64); spot = self.get_spot_price() or np.nan
+        buy = self.get_buy_quotes(sizes)["effective_price"]; sell = self.get_sell_quotes(sizes)["effective_price"]
+        return {"sizes": sizes, "spot": spot, "buy_price": buy, "sell_price": sell, "buy_slippage": buy / spot - 1.0, "sell_slippage": 1.0 - sell / spot}
+
+    def quote_copy(self): # Detached copy of the pool state: quotes only, safe to read while the original keeps trading
+        copy = Exchange.__new__(Exchange); copy.coin_pool = self.coin_pool; copy.usd_pool = self.usd_pool; copy.fee_rate = self.fee_rate; copy.k = self.k; copy.version = self.version
+        return copy
+
+    # --- Trade Statistics ---
+    def record_fill(self, coins, usd, fee=0.0): # Called after every pool mutation outside execute_batch (which tallies inline)
+        self.trade_count += 1; self.volume_coin += coins; self.volume_usd += usd; self.fees_usd += fee
+        price = self.get_spot_price()
+        if price is None: return
+        if self.session_high is None or price > self.session_high: self.session_high = price
+        if self.session_low is None or price < self.session_low: self.session_low = price
+    def start_session(self): # Opens a new candle at the current spot price
+        self.session_open = self.session_high = self.session_low = self.get_spot_price()
+        self.session_marks = (self.trade_count, self.volume_coin, self.volume_usd, self.fees_usd)
+    def session_candle(self): # OHLC, trade count/volume/fees since start_session(), and the current pool reserves
+        trades, volume_coin, volume_usd, fees_usd = self.session_marks
+        return {"open": self.session_open, "high": self.session_high, "low": self.session_low, "close": self.get_spot_price(),
+                "trades": self.trade_count - trades, "volume_coin": self.volume_coin - volume_coin, "volume_usd": self.volume_usd - volume_usd,
+                "fees_usd": self.fees_usd - fees_usd, "coin_pool": self.coin_pool, "usd_pool": self.usd_pool}
+
+    def buy_coins(self, user, coin_amount_to_buy_str):
+        try:
+            coin_amount = float(str(coin_amount_to_buy_str).replace(',', '.'))
+            assert coin_amount > 0
+        except (ValueError, TypeError, AssertionError):
+            self.notify("Invalid coin amount (>0)", "error")
+            return False
+        quote = self.get_buy_quote(coin_amount)
+        if quote is None:
+            self.notify("Cannot buy (check amount/liquidity)", "error")
+            return False
+        usd_cost = quote["usd_cost"]
+        if user.usd_balance < usd_cost:
+            self.notify(f"Insufficient USD ({format_num(user.usd_balance, 2)}<{format_num(usd_cost, 2)})", "error")
+            return False
+        user.usd_balance -= usd_cost
+        user.coin_balance += coin_amount
+        self.coin_pool -= coin_amount
+        self.usd_pool += usd_cost
+        self._recalculate_k()
+        self.record_fill(coin_amount, usd_cost, quote["fee"])
+        return True
+
+    def sell_coins(self, user, coin_amount_to_sell_str):
+        try:
+            coin_amount = float(str(coin_amount_to_sell_str).replace(',', '.'))
+            assert coin_amount > 0
+        except (ValueError, TypeError, AssertionError):
+            self.notify("Invalid coin amount (>0)", "error")
+            return False
+        if user.coin_balance < coin_amount:
+            self.notify(f"Insufficient coins ({format_num(user.coin_balance)}<{format_num(coin_amount)})", "error")
+            return False
+        quote = self.get_sell_quote(coin_amount)
+        if quote is None:
+            self.notify("Cannot sell (check amount/liquidity)", "error")
+            return False
+        usd_received = quote["usd_received"]
+        usd_taken_from_pool = usd_received + quote["fee"]
+        if usd_taken_from_pool > self.usd_pool + 1e-9 :
+             self.notify("Error: Insufficient USD in pool for payout", "error")
+             if self.events: self.events.log("exchange", ERROR, f"Sell error: tried to take {usd_taken_from_pool} USD, pool has {self.usd_pool}")
+             return False
+        user.coin_balance -= coin_amount
+        user.usd_balance += usd_received
+        self.coin_pool += coin_amount
+        self.usd_pool -= usd_taken_from_pool
+        self._recalculate_k()
+        self.record_fill(coin_amount, usd_received, quote["fee"])
+        return True
+
+    # --- System Trades (fee-free; used by the market maker and the system wallet, which move their own balances) ---
+    def system_buy(self, usd_to_spend): # Returns the COIN received, or None if the pool can't fill it
+        quote = self.get_system_buy_quote_for_usd(usd_to_spend)
+        if quote is None or quote["coins_received"] > self.coin_pool - 1e-9: return None
+        coins = quote["coins_received"]; self.coin_pool -= coins; self.usd_pool += usd_to_spend; self._recalculate_k(); self.record_fill(coins, usd_to_spend); return coins
+    def system_sell(self, coins_to_sell): # Returns the USD received, or None if the pool can't fill it
+        quote = self.get_system_sell_quote_for_coins(coins_to_sell)
+        if quote is None or quote["usd_received"] > self.usd_pool - 1e-9: return None
+        usd = quote["usd_received"]; self.coin_pool += coins_to_sell; self.usd_pool -= usd; self._recalculate_k(); self.record_fill(coins_to_sell, usd); return usd
+
+    # --- Batched Execution ---
+    # Applies an ordered batch of trades in one pass with exactly the fill rules and arithmetic of
+    # buy_coins/sell_coins (fill-or-reject, fee on top for buys / taken out for sells, k refreshed after each fill),
+    # but without string parsing, quote dicts or messages. sides: +1 buy / -1 sell; amounts: COIN per trade;
+    # budgets: what the trader can spend (USD for buys, COIN for sells). Balances are NOT touched: the caller
+    # applies the returned per-trade fills to whoever placed the orders.
+    def execute_batch(self, sides, amounts, budgets):
+        amounts = np.asarray(amounts, dtype=np.float64)
+        x = self.coin_pool; y = self.usd_pool; k = self.k; fee_rate = self.fee_rate; inf = math.inf
+        high = self.session_high if self.session_high is not None else -inf; low = self.session_low if self.session_low is not None else inf
+        usd_flow = []; fees = []; add_usd = usd_flow.append; add_fee = fees.append # Rejected trades record 0 USD / 0 fee
+        for side, dx, budget in zip(np.asarray(sides).tolist(), amounts.tolist(), np.asarray(budgets, dtype=np.float64).tolist()):
+            if dx <= 0 or k == 0.0: add_usd(0.0); add_fee(0.0); continue
+            if side > 0: # Buy dx COIN, pay gross + fee in USD
+                target_x = x - dx
+                if dx >= x - 1e-9 or target_x <= 1e-9: add_usd(0.0); add_fee(0.0); continue
+                dy_gross = k / target_x - y; fee = dy_gross * fee_rate; dy_net = dy_gross + fee
+                if dy_net <= 0 or dy_net != dy_net or dy_net == inf or budget < dy_net: add_usd(0.0); add_fee(0.0); continue
+                x -= dx; y += dy_net
+            else: # Sell dx COIN, receive gross - fee in USD
+                target_x = x + dx
+                if budget < dx or target_x <= 1e-9: add_usd(0.0); add_fee(0.0); continue
+                target_y = k / target_x
+                if target_y < 1e-9: target_y = 0
+                dy_gross = y - target_y; fee = dy_gross * fee_rate; dy_net = dy_gross - fee
+                if dy_net <= 0 or dy_net != dy_net or dy_net == inf or dy_gross > y + 1e-9: add_usd(0.0); add_fee(0.0); continue
+                x += dx; y -= dy_net + fee
+            add_usd(dy_net); add_fee(fee)
+            k = x * y if (x > 1e-9 and y > 1e-9) else 0.0
+            if k != 0.0: # Same spot price get_spot_price() would report, for the session high/low
+                price = y / x
+                if price > high: high = price
+                if price < low: low = price
+        self.coin_pool = x; self.usd_pool = y; self.k = k; self.version += 1
+        usd_flow = np.array(usd_flow, dtype=np.float64); filled = usd_flow > 0 # Every fill moves a strictly positive USD amount
+        fees = np.array(fees, dtype=np.float64); coins = np.where(filled, amounts, 0.0)
+        self.trade_count += int(filled.sum()); self.volume_coin += float(coins.sum()); self.volume_usd += float(usd_flow.sum()); self.fees_usd += float(fees.sum())
+        if high != -inf: self.session_high = high
+        if low != inf: self.session_low = low
+        return {"filled": filled, "coins": coins, "usd": usd_flow, "fee": fees}
+
+    def execute_budget_buys(self, budgets, min_coins=0.0): # Ordered user buys of "all this USD buys", sized at fill time with max_buy_for_usd
+        # Same fill arithmetic and result shape as execute_batch (sides all +1); a buy smaller than min_coins is rejected.
+        x = self.coin_pool; y = self.usd_pool; k = self.k; fee_rate = self.fee_rate; inf = math.inf
+        high = self.session_high if self.session_high is not None else -inf; low = self.session_low if self.session_low is not None else inf
+        coins = []; usd_flow = []; fees = []
+        for budget in np.asarray(budgets, dtype=np.float64).tolist():
+            g = (1.0 + fee_rate) * y; spend = budget - FLOAT_EPSILON * (10.0 * budget + 4.0 * budget * budget / g + 3.0 * g) if k != 0.0 else 0.0 # affordable_spend(), inline
+            dx = spend * x / (g + spend) if spend > 0 else 0.0
+            target_x = x - dx
+            if dx <= 0 or dx < min_coins or dx >= x - 1e-9 or target_x <= 1e-9: coins.append(0.0); usd_flow.append(0.0); fees.append(0.0); continue
+            dy_gross = k / target_x - y; fee = dy_gross * fee_rate; dy_net = dy_gross + fee
+            if dy_net <= 0 or dy_net != dy_net or dy_net == inf or budget < dy_net: coins.append(0.0); usd_flow.append(0.0); fees.append(0.0); continue
+            x -= dx; y += dy_net; coins.append(dx); usd_flow.append(dy_net); fees.append(fee)
+            k = x * y if (x > 1e-9 and y > 1e-9) else 0.0
+            if k != 0.0:
+                price = y / x
+                if price > high: high = price
+                if price < low: low = price
+        self.coin_pool = x; self.usd_pool = y; self.k = k; self.version += 1
+        usd_flow = np.array(usd_flow, dtype=np.float64); filled = usd_flow > 0; coins = np.array(coins, dtype=np.float64); fees = np.array(fees, dtype=np.float64)
+        self.trade_count += int(filled.sum()); self.volume_coin += float(coins.sum()); self.volume_usd += float(usd_flow.sum()); self.fees_usd += float(fees.sum())
+        if high != -inf: self.session_high = high
+        if low != inf: self.session_low = low
+        return {"filled": filled, "coins": coins, "usd": usd_flow, "fee": fees}
+
+
+# --- Network Class ---
+class Network(Notifier):
+    catchup_backlog = 0; catchup_total = 0 # Days owed to real time, and the size of the current catch-up (see distribute_rewards)
+    cohorts = None # CohortModel, built on first use in cohort mode
+    speed = 1.0 # Simulated days per DAY_DURATION seconds of wall-clock time (see SPEEDS): 0 pauses, inf runs flat out
+    user_day = None # Today's active users and their per-user buy probability / size scale (agent mode), set by start_user_day
+    closing = False # True while close_day() runs the day listeners, i.e. before the pools' next session starts
+    def __init__(self, config=None, seed=None):
+        self.config = cfg = config if config is not None else SimConfig()
+        self.base_emission = cfg.TOTAL_COINS; self.total_emission = cfg.TOTAL_COINS; self.nodes = NodeLedger(); self.users = UserLedger(cfg.INITIAL_USER_USD) # Node totals are running counters on the ledger
+        self.rng = np.random.default_rng(seed) # All simulation randomness goes through this generator
+        self.day = 0; self.last_reward_time = time.time(); self.added_emission = 0;
+        self.scheduler = Scheduler() # The day cycle as timestamped events (see begin_day); empty between days
+        self.price_history = deque(maxlen=cfg.PRICE_HISTORY_BUFFER_LEN)
+        self.prev_price = None # For MM v1.5 panic detection
+        self.day_listeners = [] # Callables run as listener(network) after every simulated day (snapshots, exporters...)
+        self.profiler = PhaseProfiler() # Disabled by default; set profiler.enabled = True to time the phases of step_day
+        self.events = EventLog() # MM/contest/exchange/node/user/system events (ring buffer; optional file, see EventLog.open)
+
+        # --- Initial Allocation ---
+        current_available_coins = cfg.TOTAL_COINS
+        self.mm_coin_balance = 0.0; self.mm_usd_balance = 0.0
+        mm_coin_alloc = min(cfg.MM_INITIAL_COIN_ALLOCATION, current_available_coins)
+        self.mm_coin_balance = mm_coin_alloc; current_available_coins -= mm_coin_alloc
+        if mm_coin_alloc < cfg.MM_INITIAL_COIN_ALLOCATION: print(f"Warning: Allocated only {format_num(mm_coin_alloc)} COIN to MM (requested {format_num(cfg.MM_INITIAL_COIN_ALLOCATION)}).")
+        else: print(f"Allocated {format_num(self.mm_coin_balance)} COIN to MM.")
+        self.our_usd_balance = cfg.INITIAL_SYSTEM_USD; self.mm_usd_balance = cfg.MM_INITIAL_USD_ALLOCATION
+        self.remainder = current_available_coins
+        print(f"Initial Remainder (before Exch/Node): {format_num(self.remainder)}")
+
+        initial_coins_for_exchange = min(cfg.EXCHANGE_INITIAL_COIN_LIQUIDITY, self.remainder * 0.5)
+        initial_usd_for_exchange = cfg.EXCHANGE_INITIAL_USD_LIQUIDITY
+        if self.remainder >= initial_coins_for_exchange:
+            self.remainder -= initial_coins_for_exchange
+            self.exchange = Exchange(initial_coins_for_exchange, initial_usd_for_exchange, cfg.EXCHANGE_FEE_RATE)
+            print(f"Exchange seeded. Took {format_num(initial_coins_for_exchange)} coins.")
+        else:
+            print(f"Warning: Not enough remainder ({format_num(self.remainder)}) to seed exchange with {format_num(initial_coins_for_exchange)}. Seeding minimally.", file=sys.stderr);
+            minimal_seed = min(1.0, self.remainder); self.remainder -= minimal_seed; self.exchange = Exchange(minimal_seed, initial_usd_for_exchange, cfg.EXCHANGE_FEE_RATE)
+        self.exchange.on_message = self.notify; self.exchange.events = self.events # Exchange errors surface through the network's channels
+        self.pools = [self.exchange] # Main pool first; extra pools are seeded from Summa like the main one
+        for coin_liquidity, usd_liquidity, fee_rate in cfg.EXCHANGE_EXTRA_POOLS:
+            coins = min(float(coin_liquidity), self.remainder * 0.5); self.remainder -= coins
+            pool = Exchange(coins, usd_liquidity, fee_rate); pool.on_message = self.notify; pool.events = self.events; self.pools.append(pool)
+        self.router = Router(self.pools) # MM, system and manual user trades are split across every pool
+        self.book = OrderBook(cfg.ORDER_BOOK_TICK) # Limit orders next to the main pool (see place_order)
+        self.book_queue = deque(); self.mm_quotes = [] # Resting orders in posting order (for ORDER_TTL_DAYS), and the MM's quote ids
+
+        node_stake_success = self.add_node(cfg.MIN_STAKE, 0.05, is_our=True, silent=False)
+        if node_stake_success: print(f"Initial node staked.")
+        else: print(f"Warning: Failed to stake initial node (not enough remainder?)!")
+
+        print(f"Final Remainder (Summa): {format_num(self.remainder)}")
+        print(f"Initial Our USD (System): ${format_num(self.our_usd_balance, 2)}")
+        print(f"Initial MM COIN: {format_num(self.mm_coin_balance)}")
+        print(f"Initial MM USD: ${format_num(self.mm_usd_balance, 2)}")
+
+        for _ in range(cfg.INITIAL_USERS): self.add_user(silent=True)
+        self.last_simulated_day = -1
+        self.prev_coin_pool = self.exchange.coin_pool if self.exchange else 0.0
+        self.prev_usd_pool = self.exchange.usd_pool if self.exchange else 0.0
+
+        if self.exchange:
+            initial_price = self.exchange.get_spot_price()
+            if initial_price is not None:
+                self.price_history.append(initial_price)
+                self.prev_price = initial_price
+
+    def add_user(self, silent=False):
+        new_user = self.users[self.users.add(1)]
+        if not silent: self.events.log("user", INFO, f"User {new_user.id} added. Total: {len(self.users)}", day=self.day); self.notify(f"User {new_user.id} added", "success")
+        return True
+
+    def add_multiple_users(self, count_str):
+        try: count = int(count_str); assert count > 0
+        except (ValueError, TypeError, AssertionError): self.notify("Invalid count (>0)", "error"); return False
+        self.users.add(count); added = count
+        if added > 0: self.notify(f"Added {added} users", "success"); self.events.log("user", INFO, f"Added {added} users via menu. Total: {len(self.users)}", day=self.day);
+        return True
+
+    def process_daily_site_activity(self, part=0, parts=1): # Part `part` of `parts` equal shares of the day's traffic (the whole day by default)
+        cfg = self.config
+        if not self.users or not self.exchange: return
+        num_traffic_users = max(0, int(len(self.users) * cfg.SITE_TRAFFIC_USER_PERCENT));
+        if parts > 1: num_traffic_users = num_traffic_users * (part + 1) // parts - num_traffic_users * part // parts # Shares add up to the daily count
+        if num_traffic_users == 0: return
+        traffic_users = self.users.sample(num_traffic_users, self.rng);
+        if len(traffic_users) == 0: return
+        total_usd_revenue = num_traffic_users * cfg.SITE_USD_REVENUE_PER_TRAFFIC_UNIT; self.our_usd_balance += total_usd_revenue;
+        usd_to_distribute = total_usd_revenue * cfg.SITE_REWARD_USD_PERCENTAGE;
+        if usd_to_distribute <= 0: return
+        current_price = self.exchange.get_spot_price();
+        if current_price is None or current_price <= 1e-9: return
+        try: total_coins_to_distribute = usd_to_distribute / current_price
+        except (ZeroDivisionError, OverflowError): return
+        if total_coins_to_distribute <= 0: return
+        if self.remainder >= total_coins_to_distribute:
+            coins_per_user = total_coins_to_distribute / len(traffic_users);
+            if coins_per_user <= 0: return
+            self.remainder -= total_coins_to_distribute;
+            self.users.credit_coin(traffic_users, coins_per_user)
+        else: pass
+
+    def mm_buy_coins(self, usd_to_spend):
+        if not self.exchange: return False; usd_to_spend = float(usd_to_spend);
+        if usd_to_spend <= 0: return False
+        if self.mm_usd_balance < usd_to_spend: self.events.log("mm", ERROR, f"Buy error: insufficient MM USD ({format_num(self.mm_usd_balance, 2)} < ${format_num(usd_to_spend, 2)})", day=self.day); return False
+        fill = self.router.system_buy(usd_to_spend)
+        if fill is None: return False
+        coins_received, usd_spent = fill; self.mm_usd_balance -= usd_spent; self.mm_coin_balance += coins_received; return True
+
+    def mm_sell_coins(self, coins_to_sell):
+        if not self.exchange: return False; coins_to_sell = float(coins_to_sell);
+        if coins_to_sell <= 0: return False
+        if self.mm_coin_balance < coins_to_sell: self.events.log("mm", ERROR, f"Sell error: insufficient MM COIN ({format_num(self.mm_coin_balance)} < {format_num(coins_to_sell)})", day=self.day); return False
+        fill = self.router.system_sell(coins_to_sell)
+        if fill is None: return False
+        usd_received, coins_sold = fill; self.mm_coin_balance -= coins_sold; self.mm_usd_balance += usd_received; return True
+
+    def calculate_fair_value(self):
+        cfg = self.config
+        if not self.users or cfg.INITIAL_USERS <= 0: return cfg.MM_FAIR_VALUE_BASE
+        try:
+            user_ratio = max(1, len(self.users) / cfg.INITIAL_USERS)
+            user_factor = math.log10(user_ratio)
+            fair_value = cfg.MM_FAIR_VALUE_BASE + user_factor * cfg.MM_FAIR_VALUE_USER_SCALING
+            return max(0.0001, fair_value)
+        except Exception as e:
+            print(f"Error calculating fair value: {e}", file=sys.stderr)
+            return cfg.MM_FAIR_VALUE_BASE
+
+    # =========================================================================
+    # MARKET MAKER LOGIC (v1.5 - Panic Buy + Proactive Nudge)
+    # =========================================================================
+    def run_market_maker_logic(self):
+        cfg = self.config; events = self.events; log_mm = events.enabled("mm", INFO); log_panic = events.enabled("mm", WARNING) # Checked once per day
+        # --- 0. Pre-checks ---
+        if not cfg.MM_ENABLED or not self.exchange or self.exchange.k == 0.0: return
+        if self.prev_coin_pool is None or self.prev_usd_pool is None:
+            self.prev_coin_pool = self.exchange.coin_pool; self.prev_usd_pool = self.exchange.usd_pool; return
+
+        # --- 1. Get Current State & Calculate Deltas ---
+        current_coin_pool = self.exchange.coin_pool; current_usd_pool = self.exchange.usd_pool;
+        current_price = self.exchange.get_spot_price()
+        if current_price is None or current_price <= 1e-9 :
+             self.prev_coin_pool = current_coin_pool; self.prev_usd_pool = current_usd_pool; self.prev_price = current_price; return
+
+        delta_coin = current_coin_pool - self.prev_coin_pool
+        flow_magnitude_coin = abs(delta_coin)
+
+        # --- 1b. Panic/Dip Detection ---
+        is_panic_dip = False
+        price_change_percent = 0.0
+        if self.prev_price is not None and self.prev_price > 1e-9:
+            price_change_percent = (current_price - self.prev_price) / self.prev_price
+            if price_change_percent < -cfg.MM_PANIC_THRESHOLD_PERCENT:
+                is_panic_dip = True
+                if log_panic: events.log("mm", WARNING, f"Panic detect: price drop > {cfg.MM_PANIC_THRESHOLD_PERCENT*100:.0f}% ({price_change_percent*100:.1f}%)", day=self.day)
+
+        if self.prev_coin_pool > 1e-9:
+             panic_delta_threshold = self.prev_coin_pool * cfg.MM_PANIC_DELTA_COIN_THRESHOLD_RATIO
+             if delta_coin > panic_delta_threshold:
+                  is_panic_dip = True
+                  if log_panic: events.log("mm", WARNING, f"Panic detect: large coin influx > {cfg.MM_PANIC_DELTA_COIN_THRESHOLD_RATIO*100:.1f}% ({format_num(delta_coin)} > {format_num(panic_delta_threshold)})", day=self.day)
+
+        # --- 2. Determine Reactive Action based on COIN flow ---
+        action = None
+        if delta_coin < -cfg.MM_ACTION_EPSILON: action = "sell"
+        elif delta_coin > cfg.MM_ACTION_EPSILON: action = "buy"
+
+        # --- 3. Execute Reactive Action (If Applicable) ---
+        reactive_action_taken = False
+        if action:
+            base_compensation_volume_coin = flow_magnitude_coin * cfg.MM_BASE_REACTION_PERCENT
+            price_modifier = 1.0
+            if current_price < cfg.MM_PRICE_TARGET: price_modifier = cfg.MM_PRICE_MODIFIER_BELOW_TARGET.get(action, 1.0)
+            else: price_modifier = cfg.MM_PRICE_MODIFIER_ABOVE_TARGET.get(action, 1.0)
+            modified_compensation_volume_coin = base_compensation_volume_coin * price_modifier
+
+            final_trade_volume = 0; limit_reason = "(Base)";
+            balance_usage_percent = cfg.MM_MAX_BALANCE_USAGE_PERCENT
+            if action == "buy" and is_panic_dip:
+                 balance_usage_percent = cfg.MM_PANIC_BUY_BALANCE_USAGE_PERCENT
+                 if log_mm: events.log("mm", INFO, f"Panic action: applying panic buy balance usage {balance_usage_percent*100:.0f}%", day=self.day)
+
+            if action == "sell":
+                limit_pool_imp = current_coin_pool * cfg.MM_POOL_IMPACT_PERCENT
+                limit_mm_bal = self.mm_coin_balance * balance_usage_percent
+                final_trade_volume = min(modified_compensation_volume_coin, limit_pool_imp, limit_mm_bal)
+                if abs(final_trade_volume - limit_pool_imp) < 1e-6: limit_reason = "(Pool Imp)"
+                elif abs(final_trade_volume - limit_mm_bal) < 1e-6: limit_reason = "(MM Bal)"
+                if self.mm_coin_balance - final_trade_volume < cfg.MM_MIN_COIN_BUFFER: final_trade_volume = 0
+                if final_trade_volume < cfg.MM_MIN_TRADE_SIZE_COIN: final_trade_volume = 0
+                if final_trade_volume > 0:
+                    if log_mm: events.log("mm", INFO, f"Pool dC:{format_num(delta_coin)}. Selling {format_num(final_trade_volume)} COIN {limit_reason} @P={format_num(current_price,4)}", day=self.day, action="sell", coin=final_trade_volume)
+                    success = self.mm_sell_coins(final_trade_volume)
+                    if success: reactive_action_taken = True # Mark as taken ONLY if successful
+
+            elif action == "buy":
+                base_usd_to_spend_estimated = modified_compensation_volume_coin * current_price
+                if base_usd_to_spend_estimated <= 0 : final_trade_volume = 0
+                else:
+                    limit_pool_imp_usd = current_usd_pool * cfg.MM_POOL_IMPACT_PERCENT
+                    limit_mm_bal_usd = self.mm_usd_balance * balance_usage_percent
+                    final_trade_volume = min(base_usd_to_spend_estimated, limit_pool_imp_usd, limit_mm_bal_usd)
+                    if abs(final_trade_volume - limit_pool_imp_usd) < 1e-6 : limit_reason = "(Pool Imp)"
+                    elif abs(final_trade_volume - limit_mm_bal_usd) < 1e-6 : limit_reason = "(MM Bal)"
+                    if self.mm_usd_balance - final_trade_volume < cfg.MM_MIN_USD_BUFFER: final_trade_volume = 0
+                    if final_trade_volume < cfg.MM_MIN_TRADE_SIZE_USD: final_trade_volume = 0
+                if final_trade_volume > 0:
+                    if log_mm: events.log("mm", INFO, f"Pool dC:{format_num(delta_coin)}. {'PANIC ' if is_panic_dip else ''}Buying w/ ${format_num(final_trade_volume, 2)} {limit_reason} @P={format_num(current_price,4)}", day=self.day, action="buy", usd=final_trade_volume)
+                    success = self.mm_buy_coins(final_trade_volume)
+                    if success: reactive_action_taken = True # Mark as taken ONLY if successful
+
+        # --- 4. Proactive Nudging (Only if NO reactive action was taken and market is calm) ---
+        if not reactive_action_taken and flow_magnitude_coin < cfg.MM_ACTION_EPSILON * 10:
+            fair_value = self.calculate_fair_value()
+            if fair_value > 1e-9:
+                deviation = (fair_value - current_price) / fair_value
+                proactive_action = None; proactive_volume = 0;
+
+                if deviation > cfg.MM_FAIR_VALUE_DEVIATION_THRESHOLD:
+                    if self.mm_usd_balance - cfg.MM_PROACTIVE_BUY_USD >= cfg.MM_MIN_USD_BUFFER:
+                         proactive_action = "buy"; proactive_volume = cfg.MM_PROACTIVE_BUY_USD;
+                elif deviation < -cfg.MM_FAIR_VALUE_DEVIATION_THRESHOLD:
+                     if self.mm_coin_balance - cfg.MM_PROACTIVE_SELL_COIN >= cfg.MM_MIN_COIN_BUFFER:
+                          proactive_action = "sell"; proactive_volume = cfg.MM_PROACTIVE_SELL_COIN;
+
+                if proactive_action == "buy":
+                     if log_mm: events.log("mm", INFO, f"Proactive nudge: price ({format_num(current_price,4)}) << FV ({format_num(fair_value,4)}). Buying w/ ${format_num(proactive_volume,2)}", day=self.day, action="nudge_buy", usd=proactive_volume)
+                     self.mm_buy_coins(proactive_volume)
+                elif proactive_action == "sell":
+                     if log_mm: events.log("mm", INFO, f"Proactive nudge: price ({format_num(current_price,4)}) >> FV ({format_num(fair_value,4)}). Selling {format_num(proactive_volume)} COIN", day=self.day, action="nudge_sell", coin=proactive_volume)
+                     self.mm_sell_coins(proactive_volume)
+
+        # --- 5. Update Previous State for Next Day's Calculation ---
+        self.prev_coin_pool = self.exchange.coin_pool
+        self.prev_usd_pool = self.exchange.usd_pool
+        self.prev_price = current_price
+
+
+    # --- Day cycle ---
+    # A day is a set of timestamped events on self.scheduler, in integer simulated seconds: day d runs from
+    # (d-1) * SECONDS_PER_DAY to its close at d * SECONDS_PER_DAY. begin_day() schedules them, so at equal times they run
+    # in this order:
+    #   each slice start   the previous slice's MM check, then reward emission and site traffic (1/DAY_SLICES of the day's each)
+    #   each slot start    a trade slot (TRADES_PER_ACTIVE_USER per day): today's active users draw one order each,
+    #                      timestamped uniformly over the slot; the orders between two other events run as one batch
+    #   day end            close_day(): price history, the last MM check, order book, arbitrage, listeners
+    # The MM reacts to the pool change since its previous check, so with DAY_SLICES > 1 it trades inside the day.
+    # DAY_SLICES = 1 is the one-batch-per-day cycle, draw for draw.
+    def begin_day(self):
+        cfg = self.config; sched = self.scheduler; self.day += 1; start = (self.day - 1) * SECONDS_PER_DAY
+        slices = min(max(1, int(cfg.DAY_SLICES)), SECONDS_PER_DAY); slots = max(0, int(cfg.TRADES_PER_ACTIVE_USER))
+        for i in range(slices):
+            t = start + i * SECONDS_PER_DAY // slices
+            if i: sched.at(t, self.market_maker_check)
+            sched.at(t, self.emit_rewards, slices); sched.at(t, self.site_traffic, (i, slices))
+        sched.at(start, self.start_user_day)
+        for slot in range(slots): sched.at(start + slot * SECONDS_PER_DAY // slots, self.open_trade_slot, slot)
+        sched.at(start + SECONDS_PER_DAY, self.close_day)
+
+    def emit_rewards(self, slices): # Event: 1/slices of the daily node reward
+        cfg = self.config; prof = self.profiler; t = prof.clock() if prof.enabled else 0.0
+        daily_reward=(self.base_emission*cfg.YEARLY_REWARD_RATE)/cfg.DAYS_PER_YEAR; reward = daily_reward / slices
+        if self.nodes.stake_total > 1e-9:
+            self.remainder += self.nodes.accrue(reward) # O(1) whatever the node count; withheld commission returns to Summa
+            self.total_emission += reward; self.added_emission += reward
+        if prof.enabled: prof.lap("reward_accrual", t)
+
+    def site_traffic(self, part): # Event: part = (slice, slices) of the day's site traffic
+        prof = self.profiler; t = prof.clock() if prof.enabled else 0.0
+        self.process_daily_site_activity(*part)
+        if prof.enabled: prof.lap("site_activity", t)
+
+    def market_maker_check(self, _=None): # Event: an MM check inside the day (the last one is part of close_day)
+        prof = self.profiler; t = prof.clock() if prof.enabled else 0.0
+        self.run_market_maker_logic()
+        if prof.enabled: prof.lap("market_maker", t)
+
+    def close_day(self, _=None): # Event: end of the day
+        cfg = self.config; prof = self.profiler; t = prof.clock() if prof.enabled else 0.0
+        current_price_for_history = self.exchange.get_spot_price() if self.exchange else None
+        if current_price_for_history is not None and isinstance(current_price_for_history, (int, float)) and not math.isinf(current_price_for_history) and not math.isnan(current_price_for_history) and current_price_for_history >= 0: self.price_history.append(current_price_for_history)
+        else: self.price_history.append(self.price_history[-1] if self.price_history else None) # Carry last known price forward
+        if prof.enabled: t = prof.lap("price_history", t)
+        self.run_market_maker_logic()
+        if prof.enabled: t = prof.lap("market_maker", t)
+        if self.book_in_use():
+            self.run_order_book_day()
+            if prof.enabled: t = prof.lap("order_book", t)
+        if len(self.pools) > 1:
+            arb = self.router.arbitrage(cfg.ARBITRAGE_MIN_PROFIT_USD)
+            if arb and self.events.enabled("exchange", DEBUG): self.events.log("exchange", DEBUG, f"Arbitrage: {format_num(arb['coins'])} COIN across pools, profit ${format_num(arb['profit'], 2)}", day=self.day, **arb)
+            if prof.enabled: t = prof.lap("arbitrage", t)
+        if cfg.LEDGER_CHECK_EVERY_DAYS > 0 and self.day % cfg.LEDGER_CHECK_EVERY_DAYS == 0: self.verify_aggregates()
+        self.closing = True
+        try:
+            for listener in tuple(self.day_listeners): listener(self) # tuple(): a listener may remove itself
+        finally: self.closing = False
+        for pool in self.pools: pool.start_session() # Trades after this point (incl. manual ones between days) belong to the next day
+        if prof.enabled: prof.lap("listeners", t)
+
+    def day_in_progress(self): return bool(self.scheduler) # Between begin_day() and close_day(): snapshots wait for the close
+    def clock(self): return self.scheduler.now # Simulated seconds since day 0 started
+
+    def advance(self, until, deadline=None): # Runs every event up to simulated second `until`, opening days as they start; returns events run
+        sched = self.scheduler; ran = 0 # deadline: a time.perf_counter() value after which no new timestamp is started
+        while True:
+            if not sched: # Between days: the next one starts where the last one closed
+                if self.day * SECONDS_PER_DAY >= until: return ran
+                self.begin_day()
+            ran += sched.run_until(min(until, self.day * SECONDS_PER_DAY), deadline) # Never past the open day's close: the next day isn't scheduled yet
+            if sched or (deadline is not None and time.perf_counter() >= deadline): return ran
+
+    def step_day(self): self.advance((self.day if self.scheduler else self.day + 1) * SECONDS_PER_DAY) # Runs the open day to its close, or one whole new day
+
+    def run_days(self, days): # Headless entry point: advances `days` days back-to-back, no wall-clock involved
+        days = int(days)
+        if days <= 0: return 0
+        for _ in range(days): self.step_day()
+        return days
+
+    # --- Pacing ---
+    # Simulated time runs at `speed` days per DAY_DURATION seconds of wall-clock time, event by event, so sub-daily events
+    # land at their moment of the day. last_reward_time is the wall-clock time the current simulated moment was due.
+    # After a stall (suspended process, long frame) the missed time is worked off within `budget` seconds per call
+    # (default CATCHUP_FRAME_BUDGET) instead of all at once; at least one event runs per call so the backlog always
+    # shrinks. At speed "max" each call just runs for `budget` seconds (one day if budget <= 0). Returns events run.
+    def set_speed(self, speed): # A SPEEDS name or a multiplier; pacing restarts from now, so no backlog carries across
+        self.speed = SPEEDS[speed] if isinstance(speed, str) else float(speed)
+        self.last_reward_time = time.time(); self.catchup_backlog = self.catchup_total = 0; return self.speed
+
+    def wall_seconds_per_tick(self): return self.config.DAY_DURATION / self.speed / SECONDS_PER_DAY # Wall-clock seconds per simulated second (speed > 0)
+
+    def distribute_rewards(self, budget=None):
+        cfg = self.config; budget = cfg.CATCHUP_FRAME_BUDGET if budget is None else budget; now = time.time(); speed = self.speed
+        if speed <= 0 or speed == math.inf: # Paused, or flat out: nothing is ever owed to the wall clock
+            self.last_reward_time = now; self.catchup_backlog = self.catchup_total = 0
+            if speed <= 0: return 0
+            if budget <= 0: ran = self.scheduler.processed; self.step_day(); return self.scheduler.processed - ran
+            return self.advance(math.inf, time.perf_counter() + budget)
+        sched = self.scheduler; start = sched.now; per_tick = self.wall_seconds_per_tick()
+        target = start + int((now - self.last_reward_time) / per_tick)
+        if target <= start: self.catchup_backlog = self.catchup_total = 0; return 0
+        days_due = (target - start) // SECONDS_PER_DAY
+        if days_due > 1 and self.catchup_total == 0: self.catchup_total = days_due; self.events.log("system", WARNING, f"Catch-up: {days_due} days behind real time", day=self.day)
+        ran = self.advance(target, time.perf_counter() + budget if budget > 0 else None)
+        self.last_reward_time += (sched.now - start) * per_tick
+        self.catchup_backlog = (target - sched.now) // SECONDS_PER_DAY
+        if self.catchup_backlog == 0: self.catchup_total = 0
+        elif self.catchup_backlog > self.catchup_total: self.catchup_total = self.catchup_backlog # Falling further behind
+        return ran
+
+    def next_event_delay(self): # Wall-clock seconds until the next event is due at the current speed (inf while paused)
+        if self.speed <= 0: return math.inf
+        if self.speed == math.inf: return 0.0
+        sched = self.scheduler; due = sched.next_time() if sched else self.day * SECONDS_PER_DAY + 1 # Between days: the next day's first second
+        return max(0.0, self.last_reward_time + (due - sched.now) * self.wall_seconds_per_tick() - time.time())
+
+    def get_catchup_status(self): # How far the simulation trails real time, and progress through the current catch-up
+        behind_seconds = max(0.0, time.time() - self.last_reward_time) if 0 < self.speed < math.inf else 0.0
+        progress = 1.0 - self.catchup_backlog / self.catchup_total if self.catchup_total else 1.0
+        return {"behind_days": self.catchup_backlog, "behind_seconds": behind_seconds, "progress": progress, "catching_up": self.catchup_backlog > 0}
+
+    def run_paced(self, days): # Headless counterpart of distribute_rewards: `days` more days at self.speed, sleeping until each event is due
+        if self.speed == math.inf: return self.run_days(days)
+        if self.speed <= 0: raise ValueError("Cannot run paced while paused (speed 0)")
+        sched = self.scheduler; end = (self.day + max(0, int(days))) * SECONDS_PER_DAY; per_tick = self.wall_seconds_per_tick()
+        start = sched.now; t0 = time.time()
+        while sched.now < end:
+            self.advance(min(end, start + int((time.time() - t0) / per_tick)))
+            due = sched.next_time() if sched else self.day * SECONDS_PER_DAY + 1
+            time.sleep(max(0.0, t0 + (min(due, end) - start) * per_tick - time.time()))
+        self.last_reward_time = time.time(); return days
+
+    def add_day_listener(self, listener): self.day_listeners.append(listener); return listener
+    def remove_day_listener(self, listener):
+        if listener in self.day_listeners: self.day_listeners.remove(listener)
+
+    def launch_contest(self, total_reward_str, num_winners_str):
+        try: total_reward=int(str(total_reward_str).replace(',','')); num_winners=int(str(num_winners_str).replace(',','')); assert total_reward>0 and num_winners>0
+        except(ValueError,TypeError,AssertionError): self.notify("Reward/Winners must be > 0", "error"); return False
+        if total_reward > self.remainder: msg=f"Not enough coins in Summa ({format_num(self.remainder)}) for contest ({format_num(total_reward)})"; self.notify(msg, "error"); self.events.log("contest", ERROR, msg, day=self.day); return False
+        if num_winners > len(self.users): self.events.log("contest", WARNING, f"Requested {num_winners} winners, but only {len(self.users)} users exist. Awarding to all users.", day=self.day); num_winners = len(self.users)
+        if num_winners == 0: self.notify("No users for contest", "warning"); return False
+        events = self.events; log_winners = events.enabled("contest", DEBUG) # Per-winner lines are debug-level: a contest can have thousands
+        self.remainder -= total_reward; events.log("contest", INFO, f"Took {format_num(total_reward)} coins from Summa. Remainder: {format_num(self.remainder)}", day=self.day)
+        winners=[self.users[i] for i in self.users.sample(num_winners, self.rng)]
+        if log_winners: events.log("contest", DEBUG, f"Winners (User IDs): {[u.id for u in winners]}", day=self.day)
+        rewards_dist=0; rem_reward=total_reward; rem_winners=num_winners; dist_percentages = [0.30, 0.20, 0.15]; winner_index = 0;
+        for i, perc in enumerate(dist_percentages):
+            if rem_winners <= 0: break
+            if i < len(winners): prize = int(total_reward * perc); prize = min(prize, rem_reward); winners[winner_index].coin_balance += prize; rewards_dist += prize; rem_reward -= prize; rem_winners -= 1; log_winners and events.log("contest", DEBUG, f"User {winners[winner_index].id} ({i+1}): +{format_num(prize)} coins", day=self.day); winner_index += 1
+        if rem_winners > 0 and rem_reward > 0:
+            prize_other = rem_reward / rem_winners;
+            for i in range(winner_index, num_winners):
+                 actual_r = prize_other if i < num_winners - 1 else rem_reward
+                 actual_r = min(actual_r, rem_reward);
+                 winners[i].coin_balance += actual_r; rewards_dist += actual_r; rem_reward -= actual_r; log_winners and events.log("contest", DEBUG, f"User {winners[i].id} (Other): +{format_num(actual_r, 2)} coins", day=self.day);
+                 if rem_reward < 1e-9: break
+        events.log("contest", INFO, f"Contest finished. {num_winners} winners, total distributed: {format_num(rewards_dist)} coins", day=self.day, winners=num_winners, coins=rewards_dist); self.notify(f"Contest! {num_winners} winners.", "success"); return True
+
+    def add_node(self, stake_str, commission_str, is_our=True, silent=False):
+        cfg = self.config
+        try: stake_val=int(str(stake_str).replace(',','')); commission_val=float(str(commission_str).replace(',','.')); assert 0 <= commission_val <= 100; commission_frac = commission_val / 100.0; assert stake_val > 0
+        except (ValueError, TypeError, AssertionError):
+            if not silent: self.notify("Node input error (Stake>0, Comm 0-100)", "error"); return False
+        if stake_val < cfg.MIN_STAKE:
+             if not silent: msg=f"Stake < min ({format_num(cfg.MIN_STAKE)})"; self.notify(msg, "error"); return False
+        if self.remainder >= stake_val:
+            self.nodes.add(stake_val, commission_frac, is_our); self.remainder -= stake_val
+            if not silent: msg=f"Node added! Remainder: {format_num(self.remainder)}"; self.events.log("node", INFO, msg, day=self.day, stake=stake_val); self.notify("Node added", "success"); return True
+        else:
+             if not silent: msg=f"Not enough coins in Summa ({format_num(self.remainder)})"; self.notify(msg, "error"); return False
+
+    def stop_node(self, node_index_str):
+        try: node_index=int(node_index_str)-1;
+        except ValueError: self.notify("Invalid node number (not integer)", "error"); return False
+        if not (0 <= node_index < len(self.nodes)): self.notify("Invalid node number (out of bounds)", "error"); return False
+        node = self.nodes[node_index];
+        if node.active and node.is_our_node:
+            result = node.stop();
+            if result is not None:
+                try: stk_ret, bal_ret = result; stk_float = float(stk_ret or 0.0); bal_float = float(bal_ret or 0.0); self.remainder += stk_float + bal_float; msg=f"Node {node_index+1} stopped. Returned to Summa: {format_num(stk_float)} (stake) + {format_num(bal_float)} (bal). Remainder: {format_num(self.remainder)}"; self.events.log("node", INFO, msg, day=self.day); self.notify(f"Node {node_index+1} stopped", "success"); return True
+                except Exception as e: self.events.log("node", ERROR, f"Error processing node return: {e}", day=self.day); self.notify("Node stop fund return error", "error"); return False
+            else: msg=f"Failed to stop Node {node_index+1} (internal error?)"; self.notify(msg, "error"); return False
+        elif not node.active: msg=f"Node {node_index+1} already stopped"; self.notify(msg, "warning"); return False
+        else: msg=f"Node {node_index+1} is not yours"; self.notify(msg, "error"); return False
+
+    def simulate_user_activity(self): # Today's user trading back to back, outside the scheduler (benchmarks, scripts)
+        self.start_user_day()
+        for slot in range(self.config.TRADES_PER_ACTIVE_USER): self.trade_slot(slot, split=False)
+
+    def start_user_day(self, _=None): # Event: picks today's active users (once per day)
+        cfg = self.config; self.user_day = None
+        if self.cohorts is not None: self.cohorts.active = None
+        if not self.users or not self.exchange or self.exchange.k == 0.0: return
+        if self.day <= self.last_simulated_day: return
+        self.last_simulated_day = self.day
+        if cfg.USER_MODEL == "cohorts": # Aggregate flows on the main pool only; limit orders are an agent-mode feature
+            if self.cohorts is None: self.cohorts = CohortModel(cfg)
+            self.cohorts.start_day(self); return
+        num_active_users = max(1, int(len(self.users) * cfg.DAILY_ACTIVE_USER_PERCENT)); active_users_today = self.users.sample(num_active_users, self.rng);
+        behaviors = cfg.USER_BEHAVIORS
+        if len(behaviors) > 1: kind = behavior_of(active_users_today, behaviors); buy_probability = np.array([b[2] for b in behaviors])[kind]; size_scale = np.array([b[3] for b in behaviors])[kind]
+        else: buy_probability = behaviors[0][2]; size_scale = behaviors[0][3]
+        self.user_day = (active_users_today, buy_probability, size_scale)
+
+    def open_trade_slot(self, slot): # Event: a trade slot opens (see begin_day)
+        prof = self.profiler; t = prof.clock() if prof.enabled else 0.0
+        self.trade_slot(slot)
+        if prof.enabled: prof.lap("user_activity", t)
+
+    def trade_slot(self, slot, split=True): # Every active user places at most one order per slot, so no wallet appears twice in a slot
+        cfg = self.config; cuts = self._slot_cuts(slot) if split else None # cuts: (slot start, slice starts inside the slot, slot end)
+        if cfg.USER_MODEL == "cohorts": # The cohorts' aggregate flows, shared out over the runs by their length
+            flows = self.cohorts.open_slot(self) if self.cohorts is not None else None
+            if flows is None: return
+            if not cuts: self.cohorts.run_flows(self, flows); self.cohorts.settle(self, flows); return
+            bounds = np.array(cuts, dtype=np.float64); shares = np.diff(bounds) / (bounds[-1] - bounds[0])
+            self.execute_cohort_flows((flows, shares[0], len(shares) == 1))
+            for k in range(1, len(shares)): self.scheduler.at(cuts[k], self.execute_cohort_flows, (flows, shares[k], k == len(shares) - 1))
+            return
+        if self.user_day is None: return
+        active_users_today, buy_probability, size_scale = self.user_day
+        is_buy = self.rng.random(len(active_users_today)) < buy_probability
+        coins_to_trade_potential = self.rng.uniform(cfg.SIMULATED_TRADE_MIN_COINS, cfg.SIMULATED_TRADE_MAX_COINS, len(active_users_today)) * size_scale
+        usd_bal = self.users.usd[active_users_today]; coin_bal = self.users.coin[active_users_today]
+        amount_to_sell = np.minimum(np.minimum(coins_to_trade_potential, coin_bal * cfg.USER_TRADE_PERCENT_MAX), coin_bal)
+        buying = is_buy & (usd_bal > 0.01); selling = ~is_buy & (coin_bal > 0) & (amount_to_sell >= cfg.SIMULATED_TRADE_MIN_COINS)
+        trading = buying | selling
+        traders = active_users_today[trading]; sides = np.where(buying[trading], 1, -1); amounts = np.where(buying, coins_to_trade_potential, amount_to_sell)[trading]
+        offsets = None # Limit orders: distance from spot at posting time, NaN for market orders
+        if cfg.USER_LIMIT_ORDER_PERCENT > 0 and self.book_in_use():
+            posting = self.rng.random(len(traders)) < cfg.USER_LIMIT_ORDER_PERCENT; offsets = np.where(posting, self.rng.uniform(0.0, cfg.USER_LIMIT_ORDER_MAX_OFFSET, len(traders)), np.nan)
+        orders = (traders, sides, amounts, offsets)
+        if not cuts or len(traders) == 0: self.execute_user_orders(orders); return
+        # Orders are already in random order (a sample), so taking the first n_0 of them, then the next n_1... with
+        # multinomial counts is the same as sorting uniform timestamps, without drawing or sorting any
+        counts = self.rng.multinomial(len(traders), np.diff(cuts) / (cuts[-1] - cuts[0])); edges = np.concatenate(([0], np.cumsum(counts)))
+        runs = [tuple(None if column is None else column[edges[k]:edges[k + 1]] for column in orders) for k in range(len(counts))]
+        self.execute_user_orders(runs[0])
+        for k in range(1, len(runs)): self.scheduler.at(cuts[k], self.execute_user_orders, runs[k])
+
+    def _slot_cuts(self, slot): # [now, slice starts strictly inside the slot..., slot end], or None if no slice starts inside it
+        # A slot runs until the next one opens; the MM checks at the slice starts inside it split its orders into runs
+        cfg = self.config; slots = max(1, int(cfg.TRADES_PER_ACTIVE_USER)); slices = min(max(1, int(cfg.DAY_SLICES)), SECONDS_PER_DAY)
+        start = (self.day - 1) * SECONDS_PER_DAY; begin = self.scheduler.now; end = start + (slot + 1) * SECONDS_PER_DAY // slots
+        inside = [t for t in (start + i * SECONDS_PER_DAY // slices for i in range(1, slices)) if begin < t < end]
+        return [begin] + inside + [end] if inside else None
+
+    def execute_cohort_flows(self, run): # Event: (slot flows, share, last run of the slot) in cohort mode
+        flows, share, last = run
+        self.cohorts.run_flows(self, flows, share)
+        if last: self.cohorts.settle(self, flows)
+
+    def execute_user_orders(self, orders): # Event: (traders, sides, amounts, offsets) with nothing else due between them, in time order
+        traders, sides, amounts, offsets = orders
+        if len(traders) == 0 or not self.exchange: return
+        if self.book_in_use(): # Order by order across book + pool; a share of them are limit orders
+            limits = np.full(len(traders), np.nan) if offsets is None else self.exchange.get_spot_price() * (1.0 - sides * offsets)
+            self._trade_users_on_book(traders, sides, amounts, limits); return
+        # Otherwise every order hits the main pool in one vectorized batch; budgets are read now, so a run scheduled
+        # later in the day sees whatever happened to the wallets since the slot opened
+        result = self.exchange.execute_batch(sides, amounts, np.where(sides > 0, self.users.usd[traders], self.users.coin[traders]))
+        self._settle_user_trades(traders, sides, result)
+        # Buyers who couldn't afford their full size spend their whole USD balance instead (closed-form size, fee included)
+        retry = traders[(sides > 0) & ~result["filled"]]
+        if len(retry) == 0: return
+        usd_bal = self.users.usd[retry]; retry = retry[usd_bal >= 0.01]
+        if len(retry) == 0: return
+        self._settle_user_trades(retry, np.ones(len(retry), dtype=np.int64), self.exchange.execute_budget_buys(self.users.usd[retry], self.config.SIMULATED_TRADE_MIN_COINS))
+
+    def _settle_user_trades(self, user_indices, sides, result): # Applies execute_batch fills to the traders' wallets
+        filled = result["filled"]
+        if not filled.any(): return
+        buy = sides[filled] > 0; coins = result["coins"][filled]; usd = result["usd"][filled]
+        self.users.apply_trades(user_indices[filled], np.where(buy, coins, -coins), np.where(buy, -usd, usd))
+
+    # --- Order Book ---
+    # Users (owner: ledger index) and the MM (owner: BOOK_OWNER_MM) trade on self.book next to the main pool. What a resting
+    # order may still pay is escrowed when it rests (USD at the limit for bids, COIN for asks) and released as it fills or
+    # is cancelled. Takers route across book and pool, taking whichever is cheaper at the margin (route_order), so a thin
+    # book just leaves the pool to fill the order. Extra pools follow the main pool through arbitrage, as for user batches.
+    def book_in_use(self): return bool(self.book) or self.config.USER_LIMIT_ORDER_PERCENT > 0 or (self.config.MM_BOOK_QUOTES and self.config.MM_ENABLED)
+
+    def _place_order(self, owner, side, coins, limit, usd_available): # Returns (COIN delta, USD delta, maker fills, resting order or None) for the owner, escrow included
+        book = self.book; order = None
+        if limit is not None:
+            limit = book.to_tick(limit) * book.tick
+            if limit <= 0: return 0.0, 0.0, (), None
+            if side > 0: coins = min(coins, usd_available / limit) # Room to escrow the rest
+        if coins <= 0: return 0.0, 0.0, (), None
+        result = route_order(book, self.exchange, side, coins, limit, usd_available if side > 0 else math.inf)
+        coin_delta = result["coins"] if side > 0 else -result["coins"]; usd_delta = -result["usd"] if side > 0 else result["usd"]
+        if limit is not None and result["left"] >= self.config.SIMULATED_TRADE_MIN_COINS:
+            order, _ = book.add(side, limit, result["left"], owner, self.day) # Nothing left at or past the limit: it rests whole
+            if side > 0: usd_delta -= result["left"] * limit
+            else: coin_delta -= result["left"]
+            self.book_queue.append(order)
+        return coin_delta, usd_delta, result["fills"], order
+
+    def place_order(self, owner, side, coins, limit=None): # One market (limit=None) or limit order for a user index or BOOK_OWNER_MM; returns the resting order or None
+        if not self.exchange or coins <= 0: return None
+        if owner == BOOK_OWNER_MM: coins = min(coins, self.mm_coin_balance) if side < 0 else coins; usd = self.mm_usd_balance
+        else: user = self.users[owner]; coins = min(coins, user.coin_balance) if side < 0 else coins; usd = user.usd_balance
+        coin_delta, usd_delta, fills, order = self._place_order(owner, side, float(coins), limit, usd)
+        if owner == BOOK_OWNER_MM: self.mm_coin_balance += coin_delta; self.mm_usd_balance += usd_delta
+        else: user.coin_balance += coin_delta; user.usd_balance += usd_delta
+        self._settle_book_fills(fills); return order
+
+    def cancel_order(self, order_id): # Takes a resting order off the book and refunds its escrow; False if it already filled or expired
+        cancelled = self.book.cancel(order_id)
+        if cancelled is None: return False
+        order, coins = cancelled; coin_delta, usd_delta = (0.0, coins * order[1] * self.book.tick) if order[2] > 0 else (coins, 0.0)
+        if order[3] == BOOK_OWNER_MM: self.mm_coin_balance += coin_delta; self.mm_usd_balance += usd_delta
+        else: user = self.users[order[3]]; user.coin_balance += coin_delta; user.usd_balance += usd_delta
+        return True
+
+    def _settle_book_fills(self, fills): # Pays the makers of book fills: bids get COIN plus any escrow beyond the fill price, asks get USD
+        if not fills: return
+        tick = self.book.tick; indices = []; coin = []; usd = []
+        for order, coins, paid in fills:
+            coin_delta, usd_delta = (coins, coins * order[1] * tick - paid) if order[2] > 0 else (0.0, paid)
+            if order[3] == BOOK_OWNER_MM: self.mm_coin_balance += coin_delta; self.mm_usd_balance += usd_delta
+            else: indices.append(order[3]); coin.append(coin_delta); usd.append(usd_delta)
+        if indices: self.users.apply_fills(np.array(indices, dtype=np.int64), np.array(coin), np.array(usd))
+
+    def _trade_users_on_book(self, traders, sides, amounts, limits): # One order per trader (unique), limits NaN for market orders
+        n = len(traders); usd = self.users.usd[traders].tolist(); coin_delta = np.zeros(n); usd_delta = np.zeros(n); fills = []
+        for i, (owner, side, amount, limit) in enumerate(zip(traders.tolist(), sides.tolist(), amounts.tolist(), limits.tolist())):
+            coin_delta[i], usd_delta[i], order_fills, _ = self._place_order(owner, side, amount, None if limit != limit else limit, usd[i]); fills.extend(order_fills)
+        self.users.apply_trades(traders, coin_delta, usd_delta); self._settle_book_fills(fills)
+
+    def run_order_book_day(self): # Expires old orders, refreshes the MM's quotes, then fills whatever the pool's price moved through
+        cfg = self.config; queue = self.book_queue; cutoff = self.day - cfg.ORDER_TTL_DAYS; expired = 0
+        while queue and queue[0][5] <= cutoff: expired += self.cancel_order(queue.popleft()[4])
+        if expired and self.events.enabled("exchange", DEBUG): self.events.log("exchange", DEBUG, f"Order book: {expired} orders expired", day=self.day, expired=expired)
+        if cfg.MM_BOOK_QUOTES and cfg.MM_ENABLED: self.requote_mm()
+        if self.exchange and self.exchange.k != 0.0: self._settle_book_fills(cross_with_pool(self.book, self.exchange))
+
+    def requote_mm(self): # Replaces the MM's bid/ask around spot, within its balance buffers
+        cfg = self.config
+        for order_id in self.mm_quotes: self.cancel_order(order_id)
+        self.mm_quotes = []; price = self.exchange.get_spot_price() if self.exchange else None
+        if price is None or price <= 1e-9: return
+        size = cfg.MM_QUOTE_SIZE_COIN; bid = price * (1.0 - cfg.MM_QUOTE_SPREAD); ask = price * (1.0 + cfg.MM_QUOTE_SPREAD)
+        quotes = []
+        if self.mm_usd_balance - size * bid >= cfg.MM_MIN_USD_BUFFER: quotes.append(self.place_order(BOOK_OWNER_MM, 1, size, bid))
+        if self.mm_coin_balance - size >= cfg.MM_MIN_COIN_BUFFER: quotes.append(self.place_order(BOOK_OWNER_MM, -1, size, ask))
+        self.mm_quotes = [order[4] for order in quotes if order is not None]
+        if self.events.enabled("mm", DEBUG): self.events.log("mm", DEBUG, f"Book quotes: {len(self.mm_quotes)} around {format_num(price, 4)} (±{cfg.MM_QUOTE_SPREAD:.1%}, {format_num(size)} COIN)", day=self.day, quotes=len(self.mm_quotes))
+
+    def system_buy_coins(self, usd_to_spend_str):
+        try:
+            usd_to_spend = float(str(usd_to_spend_str).replace(',', '.'))
+            assert usd_to_spend > 0
+        except (ValueError, TypeError, AssertionError):
+            self.notify("Invalid SYSTEM USD amount (>0)", "error")
+            return False
+        if self.our_usd_balance < usd_to_spend: self.notify(f"Insufficient SYSTEM USD ({format_num(self.our_usd_balance, 2)}<{format_num(usd_to_spend,2)})", "error"); return False
+        if not self.exchange: self.notify("Exchange not initialized", "error"); return False
+        fill = self.router.system_buy(usd_to_spend)
+        if fill is None: self.notify("Cannot buy COIN (liquidity/quote error?)", "error"); return False
+        coins_received, usd_to_spend = fill; self.our_usd_balance -= usd_to_spend; self.remainder += coins_received; self.events.log("exchange", INFO, f"Manual system buy: {format_num(coins_received)} COIN for ${format_num(usd_to_spend,2)}. Sys Bal: {format_num(self.remainder)} C / ${format_num(self.our_usd_balance,2)}", day=self.day); return True
+
+    def system_sell_coins(self, coins_to_sell_str):
+        try:
+            coins_to_sell = float(str(coins_to_sell_str).replace(',', '.'))
+            assert coins_to_sell > 0
+        except (ValueError, TypeError, AssertionError):
+            self.notify("Invalid SUMMA COIN amount (>0)", "error")
+            return False
+        if self.remainder < coins_to_sell: self.notify(f"Insufficient COIN in Summa ({format_num(self.remainder)}<{format_num(coins_to_sell)})", "error"); return False
+        if not self.exchange: self.notify("Exchange not initialized", "error"); return False
+        fill = self.router.system_sell(coins_to_sell)
+        if fill is None: self.notify("Cannot sell COIN (liquidity/quote error?)", "error"); return False
+        usd_received, coins_to_sell = fill; self.remainder -= coins_to_sell; self.our_usd_balance += usd_received; self.events.log("exchange", INFO, f"Manual system sell: {format_num(coins_to_sell)} COIN for ${format_num(usd_received,2)}. Sys Bal: {format_num(self.remainder)} C / ${format_num(self.our_usd_balance,2)}", day=self.day); return True
+
+    # --- Aggregates (O(1): running counters maintained by every mutation path) ---
+    def get_staked(self): return self.nodes.stake_total
+    def get_free_float(self): return self.remainder
+    def get_mm_coin_balance(self): return self.mm_coin_balance
+    def get_mm_usd_balance(self): return self.mm_usd_balance
+    def get_our_nodes_stake(self): return self.nodes.our_stake_total
+    def get_our_nodes_rewards_total(self): return self.nodes.our_rewards_total
+    def get_total_user_coin_balance(self): return self.users.total_coin()
+    def get_total_user_usd_balance(self): return self.users.total_usd()
+
+    def recount_node_totals(self): return self.nodes.recount() # Full O(nodes) recount; returns the previous running values
+
+    def verify_aggregates(self): # Debug cross-check of every running counter against a full recount; resyncs and reports drift
+        names = ("staked", "our_stake", "our_rewards", "user_coin", "user_usd")
+        running = self.recount_node_totals() + self.users.recount()
+        recounted = (self.nodes.stake_total, self.nodes.our_stake_total, self.nodes.our_rewards_total, self.users.coin_total, self.users.usd_total)
+        drift = {name: (r, c) for name, r, c in zip(names, running, recounted) if not math.isclose(r, c, rel_tol=1e-9, abs_tol=1e-6)}
+        for name, (r, c) in drift.items(): print(f"[Ledger Check Day {self.day}] {name} drifted: running {r!r} vs recount {c!r}", file=sys.stderr)
+        return drift
+
+# --- Function to print data to console ---
+def print_game_data_to_console(network_obj):
+    print("\n--- Game State ---", file=sys.stderr); print(f"[Network] Day: {network_obj.day}", file=sys.stderr); print(f" Total Coins: {format_num(network_obj.total_emission)} (Base: {format_num(network_obj.base_emission)}, Added: {format_num(network_obj.added_emission)})", file=sys.stderr); print(f" Staked (All): {format_num(network_obj.get_staked())}", file=sys.stderr); print(f" Remainder (Summa): {format_num(network_obj.get_free_float())}", file=sys.stderr); print(f" Our Stake: {format_num(network_obj.get_our_nodes_stake())}", file=sys.stderr); print(f" Our Node Rewards: {format_num(network_obj.get_our_nodes_rewards_total())}", file=sys.stderr); print(f" Our USD Balance (System): ${format_num(network_obj.our_usd_balance, 2)}", file=sys.stderr); print(f" MM COIN Balance: {format_num(network_obj.get_mm_coin_balance())}", file=sys.stderr); print(f" MM USD Balance: ${format_num(network_obj.get_mm_usd_balance(), 2)}", file=sys.stderr); print(f" Users: {len(network_obj.users)} | Total User COIN: {format_num(network_obj.get_total_user_coin_balance())} | Total User USD: ${format_num(network_obj.get_total_user_usd_balance(), 2)}", file=sys.stderr); print(f"[MM Status] {'ENABLED' if network_obj.config.MM_ENABLED else 'DISABLED'}", file=sys.stderr);
+    print("[Exchange]", file=sys.stderr); current_exchange = getattr(network_obj, 'exchange', None);
+    if current_exchange: print(f" Pool COIN: {format_num(current_exchange.coin_pool)}", file=sys.stderr); print(f" Pool USD: ${format_num(current_exchange.usd_pool, 2)}", file=sys.stderr); spot_price = current_exchange.get_spot_price(); k_value = current_exchange.k; price_str = f"{spot_price:.6f}" if isinstance(spot_price, (int, float)) else f"N/A ({spot_price})"; k_str = format_num(k_value, 2) if k_value is not None else 'N/A'; print(f" Price (USD/COIN): {price_str} | k: {k_str}", file=sys.stderr);
+    else: print(" Exchange object not found.", file=sys.stderr);
+    print("[Nodes]", file=sys.stderr);
+    if not network_obj.nodes: print(" No nodes.", file=sys.stderr)
+    else:
+        h=f"  {'#':<3}|{'St':<5}|{'Own':<4}|{'Stake':<15}|{'Rewards':<18}|{'Fee':<7}"
+        print(h,file=sys.stderr)
+        print("  "+"-"*(len(h)-2),file=sys.stderr);
+        for i,n in enumerate(network_obj.nodes):
+            s="Act" if n.active else "Stop"
+            o = "Yes" if n.is_our_node else "No"
+            st=format_num(n.stake); r=format_num(n.balance)
+            c=f"{n.commission*100:.1f}%"
+            print(f"  {i+1:<3}|{s:<5}|{o:<4}|{st:<15}|{r:<18}|{c:<7}",file=sys.stderr)
+            if i < len(network_obj.nodes) - 1:
+                print("  "+"-"*(len(h)-2),file=sys.stderr)
+    print("--- End State ---", file=sys.stderr)
+
+# --- Headless CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the blockchain simulation headless (no display, no wall-clock pacing).")
+    parser.add_argument("--days", type=int, default=DAYS_PER_YEAR, help="Number of days to simulate (default: one year)")
+    parser.add_argument("--users", type=int, default=0, help="Extra users to add on top of INITIAL_USERS before running")
+    parser.add_argument("--speed", choices=[name for name in SPEEDS if name != "pause"], default="max", help="Wall-clock pacing: 1x = one day per DAY_DURATION seconds (default: max, no waiting)")
+    parser.add_argument("--day-slices", type=int, default=DAY_SLICES, metavar="N", help="Cut each day into N slices, each with its own rewards, site traffic and MM check (default: 1)")
+    parser.add_argument("--quiet", action="store_true", help="Silence per-day engine logging on stdout")
+    parser.add_argument("--state", action="store_true", help="Print the full game state to stderr when done")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--restore", metavar="PATH", help="Continue from a snapshot instead of starting at day 0")
+    parser.add_argument("--snapshot", metavar="PATH", help="Write a snapshot here when the run finishes")
+    parser.add_argument("--snapshot-every", type=int, default=0, metavar="N", help="Also snapshot every N days into --snapshot-dir")
+    parser.add_argument("--snapshot-dir", default="snapshots")
+    parser.add_argument("--candles", metavar="PATH", help="Append one OHLCV candle per simulated day to this memory-mapped store")
+    parser.add_argument("--metrics", metavar="PATH", help="Stream one row of metrics per simulated day to this .csv file or .parquet directory (Parquet needs pyarrow)")
+    parser.add_argument("--profile", metavar="PATH", help="Time every phase of the day loop and write the stats here (.json or .csv)")
+    parser.add_argument("--pool", action="append", default=[], metavar="COIN:USD:FEE", help="Add a COIN/USD pool next to the main one (repeatable), e.g. 10000000:3000000:0.001")
+    parser.add_argument("--limit-orders", type=float, default=USER_LIMIT_ORDER_PERCENT, metavar="SHARE", help="Share of simulated user orders posted as limit orders on the order book (default: 0)")
+    parser.add_argument("--user-model", choices=("agents", "cohorts"), default=USER_MODEL, help="Simulate users one by one or as balance/behavior cohorts (mean-field, for very large populations)")
+    parser.add_argument("--mm-quotes", action="store_true", help="Have the market maker quote a daily bid/ask on the order book")
+    parser.add_argument("--events", metavar="PATH", help="Append MM/contest/exchange/node/user/system events to this JSON-lines file")
+    parser.add_argument("--event-level", choices=list(LEVELS_BY_NAME), default="info", help="Minimum level recorded by the event log (default: info)")
+    parser.add_argument("--echo-events", choices=list(LEVELS_BY_NAME), default=None, metavar="LEVEL", help="Also print events at or above LEVEL to stderr (still shown with --quiet)")
+    args = parser.parse_args(argv)
+    if args.restore or args.snapshot or args.snapshot_every: import snapshot # Deferred: snapshot imports this module
+    if args.candles: import candles
+    if args.metrics: import metrics
+
+    with contextlib.ExitStack() as quiet:
+        if args.quiet: quiet.enter_context(contextlib.redirect_stdout(quiet.enter_context(open(os.devnull, "w")))) # Closed when the run is done
+        try: extra_pools = [tuple(float(v) for v in spec.split(":")) for spec in args.pool]; assert all(len(p) == 3 for p in extra_pools)
+        except (ValueError, AssertionError): parser.error("--pool takes COIN:USD:FEE, e.g. 10000000:3000000:0.001")
+        network = snapshot.load_snapshot(args.restore) if args.restore else Network(SimConfig(EXCHANGE_EXTRA_POOLS=extra_pools, USER_LIMIT_ORDER_PERCENT=args.limit_orders, MM_BOOK_QUOTES=args.mm_quotes, USER_MODEL=args.user_model, DAY_SLICES=args.day_slices), seed=args.seed)
+        if args.users > 0: network.add_multiple_users(args.users)
+        if args.snapshot_every > 0: network.add_day_listener(snapshot.PeriodicSnapshotter(args.snapshot_dir, args.snapshot_every))
+        if args.candles: candle_store = candles.CandleStore(args.candles); network.add_day_listener(candles.CandleRecorder(candle_store))
+        if args.metrics:
+            try: metrics_writer = metrics.MetricsWriter(args.metrics)
+            except metrics.MetricsError as e: parser.error(str(e))
+            network.add_day_listener(metrics.MetricsRecorder(metrics_writer))
+        if args.profile: network.profiler.enabled = True
+        network.events.level = LEVELS_BY_NAME[args.event_level]; network.events.echo = LEVELS_BY_NAME[args.echo_events] if args.echo_events else None
+        if args.events: network.events.open(args.events)
+        network.set_speed(args.speed)
+        t0 = time.perf_counter(); network.run_paced(args.days); elapsed = time.perf_counter() - t0
+    price = network.exchange.get_spot_price() if network.exchange else None
+    print(f"Simulated {format_num(args.days)} days in {elapsed:.3f}s ({format_num(args.days / elapsed if elapsed > 0 else 0, 1)} days/s). Day: {network.day} | Users: {format_num(len(network.users))} | Price: {f'${price:.5f}' if price is not None else 'N/A'}")
+    if args.profile: print("\n".join(network.profiler.format_lines())); print(f"Profile saved: {network.profiler.export(args.profile)}")
+    if len(network.pools) > 1:
+        print(f"Pools: {', '.join(f'${p.get_spot_price():.5f} (fee {p.fee_rate:.2%})' for p in network.pools)} | Arbitrage: {network.router.arb_count} runs, {format_num(network.router.arb_volume_coin)} COIN, ${format_num(network.router.arb_profit_usd, 2)} profit")
+        quote_cache = network.router.quote_cache_stats()
+        if quote_cache["hits"] + quote_cache["misses"]: print(f"Routed quote cache: {format_num(quote_cache['hits'])} hits / {format_num(quote_cache['misses'])} misses ({quote_cache['hit_rate']:.1%})")
+    if network.book.adds: book = network.book; print(f"Order book: {format_num(book.adds)} orders, {format_num(book.fills)} fills, {format_num(book.volume_coin)} COIN matched, {format_num(len(book))} resting (bid {format_num(book.best_bid(), 4)} / ask {format_num(book.best_ask(), 4)})")
+    if args.events: network.events.close(); print(f"Events: {', '.join(f'{c}={n}' for c, n in network.events.counts.items()) or 'none'} -> {args.events}")
+    if args.candles: candle_store.flush(); print(f"Candles: {format_num(len(candle_store))} days in {args.candles}")
+    if args.metrics: metrics_writer.close(); print(f"Metrics: {format_num(metrics_writer.written)} days in {metrics_writer.batches} batches ({metrics_writer.seconds * 1e3:.1f} ms writing) -> {args.metrics}")
+    if args.snapshot: print(f"Snapshot saved: {snapshot.save_snapshot(network, args.snapshot)}")
+    if args.state: print_game_data_to_console(network)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
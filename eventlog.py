@@ -0,0 +1,74 @@
+# EVENTLOG - Leveled, categorized simulation events: in-memory ring buffer + background flush to a JSON-lines file
+#
+# Hot paths guard on enabled() before formatting anything, so a disabled category costs one dict lookup:
+#     if events.enabled("mm"): events.log("mm", INFO, f"...", day=self.day)
+# File format: one compact JSON object per line, {"t": unix time, "day": d, "cat": "mm", "lvl": "info", "msg": "...", ...fields}
+
+import sys
+import json
+import time
+import threading
+from collections import deque
+
+DEBUG = 10; INFO = 20; WARNING = 30; ERROR = 40; OFF = 100
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+LEVELS_BY_NAME = {name: level for level, name in LEVEL_NAMES.items()}
+EVENT_CATEGORIES = ("mm", "contest", "exchange", "node", "user", "system")
+EVENTLOG_CAPACITY = 4096 # Most recent events kept in memory (what the UI can show)
+EVENTLOG_FLUSH_INTERVAL = 0.5 # Seconds between background writes
+
+def format_event(event): # Console form: "[day 12] MM      info    message"
+    t, day, category, level, message, fields = event
+    return f"[day {day}] {category.upper():<8}{LEVEL_NAMES.get(level, level):<8}{message}"
+
+class EventLog:
+    def __init__(self, level=INFO, capacity=EVENTLOG_CAPACITY, path=None, echo=None):
+        self.level = level; self.levels = {} # Per-category overrides of the default level (OFF disables a category)
+        self.recent = deque(maxlen=capacity); self.counts = {}
+        self.echo = echo # None, or the minimum level also printed to stdout as it happens
+        self.writer = None
+        if path: self.open(path)
+
+    def enabled(self, category, level=INFO): return level >= self.levels.get(category, self.level)
+    def set_level(self, category, level): self.levels[category] = level
+
+    def log(self, category, level, message, day=None, **fields):
+        if level < self.levels.get(category, self.level): return
+        event = (time.time(), day, category, level, message, fields)
+        self.recent.append(event); self.counts[category] = self.counts.get(category, 0) + 1
+        if self.writer: self.writer.pending.append(event)
+        if self.echo is not None and level >= self.echo: print(format_event(event), file=sys.stderr) # stderr: survives --quiet, keeps stdout for results
+
+    def tail(self, n): # Last n events, oldest first; safe to call from another thread
+        events = list(self.recent); return events[-n:] if n > 0 else []
+
+    # --- File output ---
+    def open(self, path, interval=EVENTLOG_FLUSH_INTERVAL):
+        self.close(); self.writer = EventLogWriter(path, interval); self.writer.start(); return self.writer
+    def close(self):
+        if self.writer: self.writer.close(); self.writer = None
+
+class EventLogWriter(threading.Thread): # Drains pending events to disk every `interval` seconds, off the simulation thread
+    def __init__(self, path, interval=EVENTLOG_FLUSH_INTERVAL):
+        super().__init__(name="eventlog-writer", daemon=True)
+        self.path = path; self.interval = interval; self.pending = deque(); self.stopping = threading.Event(); self.written = 0
+        self.file = open(path, "a", encoding="utf-8")
+
+    def run(self):
+        while not self.stopping.wait(self.interval): self.flush()
+
+    def flush(self):
+        lines = []
+        while self.pending:
+            t, day, category, level, message, fields = self.pending.popleft()
+            record = {"t": round(t, 3), "day": day, "cat": category, "lvl": LEVEL_NAMES.get(level, level), "msg": message}
+            if fields: record.update(fields)
+            lines.append(json.dumps(record, separators=(",", ":"), default=str))
+        if not lines: return
+        try: self.file.write("\n".join(lines) + "\n"); self.file.flush(); self.written += len(lines)
+        except OSError as e: print(f"Event log write error for '{self.path}': {e}", file=sys.stderr)
+
+    def close(self):
+        self.stopping.set()
+        if self.is_alive(): self.join()
+        self.flush(); self.file.close()
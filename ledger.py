@@ -0,0 +1,209 @@
+# LEDGER - Columnar (struct-of-arrays) storage for simulation entities (users, nodes)
+
+import numpy as np
+
+# --- User Ledger ---
+# One contiguous array per field instead of one Python object per user:
+# id (int64) + coin (float64) + usd (float64) = 24 bytes/user, plus amortized growth slack.
+# coin_total/usd_total are running counters kept in step by every mutation method below (and the User view setters),
+# so totals are O(1) to read; recount() rebuilds them from the columns.
+LEDGER_MIN_CAPACITY = 1024
+LEDGER_GROWTH_FACTOR = 1.5
+
+class UserLedger:
+    def __init__(self, initial_usd=0.0, capacity=LEDGER_MIN_CAPACITY):
+        self.initial_usd = float(initial_usd); self.size = 0; self.next_id = 1; self.coin_total = 0.0; self.usd_total = 0.0
+        capacity = max(int(capacity), 1)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.coin = np.zeros(capacity, dtype=np.float64)
+        self.usd = np.zeros(capacity, dtype=np.float64)
+
+    def __len__(self): return self.size
+    def __bool__(self): return self.size > 0
+    def __iter__(self): return (User(self, i) for i in range(self.size))
+    def __getitem__(self, index):
+        if index < 0: index += self.size
+        if not (0 <= index < self.size): raise IndexError("user index out of range")
+        return User(self, index)
+
+    @property
+    def capacity(self): return len(self.ids)
+    def nbytes(self): return self.ids.nbytes + self.coin.nbytes + self.usd.nbytes
+
+    # Live views over the used part of the columns (no copy; invalidated by the next grow)
+    def id_view(self): return self.ids[:self.size]
+    def coin_view(self): return self.coin[:self.size]
+    def usd_view(self): return self.usd[:self.size]
+
+    def _reserve(self, needed):
+        if needed <= len(self.ids): return
+        new_capacity = max(needed, int(len(self.ids) * LEDGER_GROWTH_FACTOR) + 1, LEDGER_MIN_CAPACITY)
+        for name in ("ids", "coin", "usd"):
+            old = getattr(self, name); new = np.zeros(new_capacity, dtype=old.dtype); new[:self.size] = old[:self.size]; setattr(self, name, new)
+
+    def add(self, count=1, usd=None, coin=0.0): # Bulk insert; returns the index of the first new user
+        count = int(count)
+        if count <= 0: return self.size
+        start = self.size; end = start + count
+        self._reserve(end)
+        self.ids[start:end] = np.arange(self.next_id, self.next_id + count, dtype=np.int64)
+        self.coin[start:end] = coin
+        self.usd[start:end] = self.initial_usd if usd is None else usd
+        self.coin_total += float(self.coin[start:end].sum()); self.usd_total += float(self.usd[start:end].sum())
+        self.size = end; self.next_id += count
+        return start
+
+    def sample(self, k, rng): # k distinct user indices in random order
+        k = min(int(k), self.size)
+        if k <= 0: return np.empty(0, dtype=np.int64)
+        return rng.choice(self.size, size=k, replace=False)
+
+    def credit_coin(self, indices, amount): # indices must be unique
+        self.coin[indices] += amount; self.coin_total += float(np.sum(amount)) if np.ndim(amount) else float(amount) * len(indices)
+    def apply_trades(self, indices, coin_delta, usd_delta): # indices must be unique
+        self.coin[indices] += coin_delta; self.usd[indices] += usd_delta
+        self.coin_total += float(np.sum(coin_delta)); self.usd_total += float(np.sum(usd_delta))
+    def apply_fills(self, indices, coin_delta, usd_delta): # Like apply_trades, but indices may repeat (e.g. one maker filled twice)
+        np.add.at(self.coin, indices, coin_delta); np.add.at(self.usd, indices, usd_delta)
+        self.coin_total += float(np.sum(coin_delta)); self.usd_total += float(np.sum(usd_delta))
+    def total_coin(self): return self.coin_total
+    def total_usd(self): return self.usd_total
+    def recount(self): # Full O(n) recount; returns the previous running totals for cross-checking
+        previous = (self.coin_total, self.usd_total)
+        self.coin_total = float(self.coin[:self.size].sum()); self.usd_total = float(self.usd[:self.size].sum())
+        return previous
+
+# --- User View ---
+# Lightweight handle onto one ledger row, so Exchange.buy_coins(user, ...) and the UI keep working unchanged.
+class User:
+    __slots__ = ("ledger", "index")
+    def __init__(self, ledger, index): self.ledger = ledger; self.index = index
+    @property
+    def id(self): return int(self.ledger.ids[self.index])
+    @property
+    def coin_balance(self): return float(self.ledger.coin[self.index])
+    @coin_balance.setter
+    def coin_balance(self, value): ledger = self.ledger; ledger.coin_total += float(value - ledger.coin[self.index]); ledger.coin[self.index] = value
+    @property
+    def usd_balance(self): return float(self.ledger.usd[self.index])
+    @usd_balance.setter
+    def usd_balance(self, value): ledger = self.ledger; ledger.usd_total += float(value - ledger.usd[self.index]); ledger.usd[self.index] = value
+    def __repr__(self): return f"User(id={self.id}, coin={self.coin_balance}, usd={self.usd_balance})"
+
+# --- Node Ledger ---
+# Validators as columns, with rewards tracked through a global reward-per-stake index instead of per-node balances:
+# accrue() bumps reward_index by reward / active stake, which is O(1) however many nodes exist. A node's balance is
+# settled lazily: balance[i] holds what was earned up to checkpoint[i], and the rest is
+#     stake[i] * (1 - commission[i]) * (reward_index - checkpoint[i])
+# folded in by settle() on stop / stake change, or computed without mutating on read.
+# Commission is the fee withheld from a node's rewards; accrue() returns the withheld total so the caller can route it.
+# Running totals cover active stake, active stake net of commission, and the balances of our nodes (settled or not).
+NODE_COLUMNS = (("initial_stake", np.float64), ("stake", np.float64), ("commission", np.float64), ("balance", np.float64),
+                ("checkpoint", np.float64), ("active", np.bool_), ("is_our", np.bool_))
+NODE_CHANGES_MAX = 4096 # Change log entries kept at most (older half dropped past that); sort indexes further behind rebuild
+
+class NodeLedger:
+    version = 0 # Bumped whenever an existing row changes (stop, stake change); appends only grow size. Lets sort indexes stay valid.
+    changes = None # [(node index, columns changed)] per version bump, so sort indexes can update just those rows (see node_table.py)
+    changes_base = 0 # Version of changes[0]: entries before it were trimmed
+    def __init__(self, capacity=LEDGER_MIN_CAPACITY):
+        self.size = 0; self.reward_index = 0.0
+        self.stake_total = 0.0; self.net_stake_total = 0.0; self.our_stake_total = 0.0; self.our_net_stake_total = 0.0; self.our_rewards_total = 0.0
+        capacity = max(int(capacity), 1)
+        for name, dtype in NODE_COLUMNS: setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def __len__(self): return self.size
+    def __bool__(self): return self.size > 0
+    def __iter__(self): return (Node(self, i) for i in range(self.size))
+    def __getitem__(self, index):
+        if index < 0: index += self.size
+        if not (0 <= index < self.size): raise IndexError("node index out of range")
+        return Node(self, index)
+
+    @property
+    def capacity(self): return len(self.stake)
+
+    def _reserve(self, needed):
+        if needed <= len(self.stake): return
+        new_capacity = max(needed, int(len(self.stake) * LEDGER_GROWTH_FACTOR) + 1, LEDGER_MIN_CAPACITY)
+        for name, _ in NODE_COLUMNS:
+            old = getattr(self, name); new = np.zeros(new_capacity, dtype=old.dtype); new[:self.size] = old[:self.size]; setattr(self, name, new)
+
+    def add(self, stake, commission, is_our=True): # Starts earning from the current reward_index; returns the node's index
+        i = self.size; self._reserve(i + 1); stake = float(stake); commission = float(commission); net = stake * (1.0 - commission)
+        self.initial_stake[i] = stake; self.stake[i] = stake; self.commission[i] = commission; self.balance[i] = 0.0
+        self.checkpoint[i] = self.reward_index; self.active[i] = True; self.is_our[i] = is_our
+        self.stake_total += stake; self.net_stake_total += net
+        if is_our: self.our_stake_total += stake; self.our_net_stake_total += net
+        self.size = i + 1; return i
+
+    def accrue(self, reward): # Spreads `reward` over the active stake in O(1); returns the commission withheld from it
+        if self.stake_total <= 1e-9: return 0.0
+        increment = reward / self.stake_total; self.reward_index += increment
+        self.our_rewards_total += self.our_net_stake_total * increment
+        return (self.stake_total - self.net_stake_total) * increment
+
+    def pending(self, i): # Earned since the last settlement (0 for stopped nodes)
+        if not self.active[i]: return 0.0
+        return float(self.stake[i] * (1.0 - self.commission[i]) * (self.reward_index - self.checkpoint[i]))
+    def balance_of(self, i): return float(self.balance[i]) + self.pending(i) # Read-only: safe from other threads
+    def settle(self, i): self.balance[i] += self.pending(i); self.checkpoint[i] = self.reward_index
+    def settle_all(self): # O(n); e.g. before a snapshot, so saved balances are plain numbers
+        n = self.size; self.balance[:n] = self.balances(); self.checkpoint[:n] = self.reward_index
+    def balances(self): # Current balance of every node as a new array
+        n = self.size; active = self.active[:n]
+        return self.balance[:n] + np.where(active, self.stake[:n] * (1.0 - self.commission[:n]) * (self.reward_index - self.checkpoint[:n]), 0.0)
+
+    def _changed(self, i, columns):
+        if self.changes is None: self.changes = []; self.changes_base = self.version
+        self.changes.append((i, columns)); self.version += 1
+        if len(self.changes) > NODE_CHANGES_MAX: self.trim_changes(self.version - NODE_CHANGES_MAX // 2)
+    def changes_since(self, version): # Changes from `version` up to now, or None if some of them were trimmed
+        if version >= self.version: return []
+        if self.changes is None or version < self.changes_base: return None
+        return self.changes[version - self.changes_base:]
+    def trim_changes(self, version): # Drops the changes before `version`, once nothing still needs them
+        drop = min(version, self.version) - self.changes_base
+        if self.changes is not None and drop > 0: del self.changes[:drop]; self.changes_base += drop
+
+    def set_stake(self, i, stake): # Settles first, so rewards earned at the old stake are kept
+        self.settle(i); self._changed(i, ("stake",)); stake = float(stake); delta = stake - self.stake[i]; net = delta * (1.0 - self.commission[i])
+        if self.active[i]:
+            self.stake_total += delta; self.net_stake_total += net
+            if self.is_our[i]: self.our_stake_total += delta; self.our_net_stake_total += net
+        self.stake[i] = stake
+
+    def stop(self, i): # Settles and deactivates; returns (stake, balance) released, or None if already stopped
+        if not self.active[i]: return None
+        self.settle(i); stake = float(self.stake[i]); balance = float(self.balance[i]); net = stake * (1.0 - self.commission[i])
+        self.stake_total -= stake; self.net_stake_total -= net
+        if self.is_our[i]: self.our_stake_total -= stake; self.our_net_stake_total -= net; self.our_rewards_total -= balance
+        self.active[i] = False; self.stake[i] = 0.0; self.balance[i] = 0.0; self._changed(i, ("status", "stake", "rewards"))
+        return stake, balance
+
+    def recount(self): # Full O(n) recount; returns the previous (stake, our stake, our rewards) running totals
+        previous = (self.stake_total, self.our_stake_total, self.our_rewards_total)
+        n = self.size; active = self.active[:n]; ours = self.is_our[:n]; stake = np.where(active, self.stake[:n], 0.0); net = stake * (1.0 - self.commission[:n])
+        self.stake_total = float(stake.sum()); self.net_stake_total = float(net.sum())
+        self.our_stake_total = float(stake[ours].sum()); self.our_net_stake_total = float(net[ours].sum())
+        self.our_rewards_total = float(self.balances()[ours].sum())
+        return previous
+
+# --- Node View ---
+class Node:
+    __slots__ = ("ledger", "index")
+    def __init__(self, ledger, index): self.ledger = ledger; self.index = index
+    @property
+    def initial_stake(self): return float(self.ledger.initial_stake[self.index])
+    @property
+    def stake(self): return float(self.ledger.stake[self.index])
+    @property
+    def commission(self): return float(self.ledger.commission[self.index])
+    @property
+    def balance(self): return self.ledger.balance_of(self.index)
+    @property
+    def active(self): return bool(self.ledger.active[self.index])
+    @property
+    def is_our_node(self): return bool(self.ledger.is_our[self.index])
+    def stop(self): return self.ledger.stop(self.index)
+    def __repr__(self): return f"Node(stake={self.stake}, commission={self.commission}, balance={self.balance}, active={self.active})"
@@ -0,0 +1,135 @@
+# METRICS - Per-day metrics stream: one row per simulated day, batched and written to CSV or Parquet off the simulation thread
+#
+#   network.add_day_listener(MetricsRecorder(MetricsWriter("run.csv")))      or "run.parquet" (needs pyarrow)
+#
+# The day listener only appends one tuple of numbers to a queue; the writer thread wakes every METRICS_FLUSH_INTERVAL
+# seconds, turns what is pending into one (rows, columns) block and appends it as a batch:
+#   .csv       header once, then each batch written and flushed in one go: `tail -f`, pandas etc. see every batch so far
+#   .parquet   a directory of part files, each a complete Parquet file (renamed into place once written), so
+#              pandas.read_parquet("run.parquet") / pyarrow.dataset read every part written so far while the run goes on.
+#              A part holds up to METRICS_PART_ROWS rows and is written at least every METRICS_PART_SECONDS
+# CSV is formatted by pyarrow when it is installed (full precision, off the GIL), else in Python with 12 significant digits:
+# one bytes %-format over the whole batch, in the writer thread (~5-8 us a row on one slow core, the recorder's tuple ~1.5 us).
+# Measured against it: np.savetxt on the stacked block ~1.6x slower, numpy's own float-to-string (astype) ~5x.
+# Opening an existing output appends to it; a run resumed from an older snapshot writes those days again (keep the last row per day).
+# trades/volume_*/fees_usd are the day's, summed over every pool; *_total columns are running totals; the rest are end-of-day levels.
+
+import os
+import sys
+import time
+import threading
+from collections import deque
+from itertools import chain
+import numpy as np
+
+METRICS_FLUSH_INTERVAL = 0.5 # Seconds between writer wake-ups
+METRICS_PART_ROWS = 65_536 # Parquet: rows per part file, at most
+METRICS_PART_SECONDS = 30.0 # Parquet: pending rows are written out at least this often
+METRICS_CSV_FLOAT_FORMAT = "%.12g" # Without pyarrow
+
+METRIC_COLUMNS = ( # (name, "i8" | "f8"), in row order
+    ("day", "i8"), ("total_emission", "f8"), ("added_emission", "f8"), ("staked", "f8"), ("summa", "f8"), ("our_usd", "f8"),
+    ("coin_pool", "f8"), ("usd_pool", "f8"), ("price", "f8"), ("k", "f8"), ("mm_coin", "f8"), ("mm_usd", "f8"),
+    ("users", "i8"), ("user_coin", "f8"), ("user_usd", "f8"),
+    ("trades", "i8"), ("volume_coin", "f8"), ("volume_usd", "f8"), ("fees_usd", "f8"),
+    ("book_fills_total", "i8"), ("book_volume_coin_total", "f8"), ("arb_count_total", "i8"), ("arb_volume_coin_total", "f8"),
+)
+METRIC_NAMES = tuple(name for name, _ in METRIC_COLUMNS)
+
+class MetricsError(Exception): pass
+
+def _pyarrow(): # The pyarrow module with its csv/parquet submodules loaded, or None when it is not installed
+    try: import pyarrow, pyarrow.csv, pyarrow.parquet
+    except ImportError: return None
+    return pyarrow
+
+def pyarrow_available(): return _pyarrow() is not None
+
+def metrics_format(path): # "csv" or "parquet", from the extension
+    ext = os.path.splitext(str(path).rstrip("/\\"))[1].lower()
+    if ext in (".csv", ".parquet"): return ext[1:]
+    raise MetricsError(f"Metrics path '{path}' must end in .csv or .parquet")
+
+# --- Writing ---
+class MetricsWriter(threading.Thread): # Buffers rows as they come and writes them to disk in batches, off the simulation thread
+    def __init__(self, path, interval=METRICS_FLUSH_INTERVAL, part_rows=METRICS_PART_ROWS, part_seconds=METRICS_PART_SECONDS):
+        super().__init__(name="metrics-writer", daemon=True)
+        self.path = path; self.format = metrics_format(path); self.interval = interval; self.part_rows = max(1, int(part_rows)); self.part_seconds = part_seconds
+        self.pending = deque(); self.stopping = threading.Event() # Row tuples from the simulation thread
+        self.staged = [] # Parquet: rows taken from pending, waiting for a full part
+        self.written = 0; self.batches = 0; self.seconds = 0.0 # Rows and batches written, time spent writing them
+        self.pa = _pyarrow(); self.last_write = time.monotonic()
+        if self.format == "parquet":
+            if self.pa is None: raise MetricsError("Parquet metrics need pyarrow (pip install pyarrow); use a .csv path instead")
+            os.makedirs(path, exist_ok=True)
+            self.parts = sum(1 for name in os.listdir(path) if name.startswith("part-") and name.endswith(".parquet"))
+        else:
+            header = ",".join(METRIC_NAMES)
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                with open(path, "r", encoding="utf-8") as f: existing = f.readline().rstrip("\r\n")
+                if existing != header: raise MetricsError(f"'{path}' has other columns than this metrics stream; use a new file")
+                self.file = open(path, "ab")
+            else: self.file = open(path, "wb"); self.file.write(header.encode() + b"\n"); self.file.flush()
+            self.row_format = (",".join("%d" if kind == "i8" else METRICS_CSV_FLOAT_FORMAT for _, kind in METRIC_COLUMNS) + "\n").encode()
+        if self.pa is not None:
+            pa = self.pa; self.schema = pa.schema([(name, pa.int64() if kind == "i8" else pa.float64()) for name, kind in METRIC_COLUMNS])
+
+    def run(self):
+        while not self.stopping.wait(self.interval): self.flush(final=False)
+
+    def flush(self, final=True): # Writes the pending rows (Parquet: once a part is due, or everything if final); one thread at a time
+        pending = self.pending; popleft = pending.popleft; t0 = time.perf_counter()
+        rows = [popleft() for _ in range(len(pending))] # The simulation thread may keep appending meanwhile
+        if self.format == "csv":
+            if rows: self._write(rows)
+        else:
+            self.staged += rows
+            if self.staged and (final or len(self.staged) >= self.part_rows or time.monotonic() - self.last_write >= self.part_seconds):
+                staged = self.staged; self.staged = []
+                for start in range(0, len(staged), self.part_rows): self._write(staged[start:start + self.part_rows])
+        self.seconds += time.perf_counter() - t0
+
+    def _write(self, rows):
+        try:
+            if self.format == "parquet": self._write_part(rows)
+            else: self.file.write(self._csv(rows)); self.file.flush()
+        except OSError as e: print(f"Metrics write error for '{self.path}': {e}", file=sys.stderr); return
+        self.written += len(rows); self.batches += 1; self.last_write = time.monotonic()
+
+    def _table(self, rows): # Columnar batch: the rows as one (rows, columns) float64 block, then one pyarrow array per metric
+        pa = self.pa; block = np.fromiter(chain.from_iterable(rows), np.float64, len(rows) * len(METRIC_COLUMNS)).reshape(len(rows), -1)
+        return pa.Table.from_arrays([pa.array(block[:, i].astype(np.int64) if kind == "i8" else block[:, i], field.type)
+                                     for i, ((_, kind), field) in enumerate(zip(METRIC_COLUMNS, self.schema))], schema=self.schema)
+
+    def _csv(self, rows): # Batch as CSV bytes, no header
+        if self.pa is None: return (self.row_format * len(rows)) % tuple(chain.from_iterable(rows)) # Bytes throughout: no encode pass
+        pa = self.pa; sink = pa.BufferOutputStream()
+        pa.csv.write_csv(self._table(rows), sink, write_options=pa.csv.WriteOptions(include_header=False))
+        return sink.getvalue().to_pybytes()
+
+    def _write_part(self, rows): # A complete Parquet file per batch, renamed into place so readers never see half of one
+        name = f"part-{self.parts:06d}.parquet"; tmp_path = os.path.join(self.path, f".{name}.tmp") # Dot-prefixed: skipped by dataset readers
+        self.pa.parquet.write_table(self._table(rows), tmp_path); os.replace(tmp_path, os.path.join(self.path, name)); self.parts += 1
+
+    def close(self):
+        self.stopping.set()
+        if self.is_alive(): self.join()
+        self.flush()
+        if self.format == "csv": self.file.close()
+
+# --- Recording ---
+class MetricsRecorder: # Day listener: network.add_day_listener(MetricsRecorder(writer)); starts the writer thread if needed
+    def __init__(self, writer):
+        self.writer = writer; self.append = writer.pending.append
+        if not writer.is_alive(): writer.start()
+    def __call__(self, network):
+        exchange = network.exchange
+        if exchange is None: return
+        trades = 0; volume_coin = volume_usd = fees_usd = 0.0
+        for pool in network.pools: # Since start_session(), i.e. today
+            marks = pool.session_marks; trades += pool.trade_count - marks[0]; volume_coin += pool.volume_coin - marks[1]; volume_usd += pool.volume_usd - marks[2]; fees_usd += pool.fees_usd - marks[3]
+        price = exchange.get_spot_price(); users = network.users; book = network.book; router = network.router
+        self.append((network.day, network.total_emission, network.added_emission, network.nodes.stake_total, network.remainder, network.our_usd_balance,
+                             exchange.coin_pool, exchange.usd_pool, float("nan") if price is None else price, exchange.k, network.mm_coin_balance, network.mm_usd_balance,
+                             len(users), users.coin_total, users.usd_total, trades, volume_coin, volume_usd, fees_usd,
+                             book.fills, book.volume_coin, router.arb_count, router.arb_volume_coin))
@@ -0,0 +1,96 @@
+# NODE_TABLE - Sorted, filtered windows over a NodeLedger for the virtualized node table
+#
+# One ascending sort order per column is kept and maintained instead of re-sorting per frame:
+#   - nodes appended since the last query are merged in (sort the few new rows, searchsorted + insert),
+#   - a stop or stake change moves just that node, and only in the orders of the columns it changed (NodeLedger.changes);
+#     more than NODE_ORDER_MAX_MOVES of them at once rebuild that column instead; the ledger's change log is trimmed to
+#     the oldest version any order still holds,
+#   - rewards grow with every accrual, at each node's own rate, so once the reward index has moved their order is
+#     re-checked against fresh balances and, if anything overtook, re-sorted from the previous order (nearly sorted: ~O(n)).
+# A query then costs O(rows shown): the window is a slice of the (filtered) order, read in reverse for descending.
+
+from collections import namedtuple
+import numpy as np
+
+NODE_SORT_KEYS = ("number", "status", "own", "stake", "rewards", "commission") # Table column order
+NODE_FILTERS = ("all", "our", "active")
+NODE_ORDER_MAX_MOVES = 64 # Changed rows moved one by one (O(n) memmove each) before a full re-sort is cheaper
+
+NodeRow = namedtuple("NodeRow", "number active is_our_node stake balance commission") # number: 1-based, as stop_node expects
+NodeQuery = namedtuple("NodeQuery", "sort descending filter offset count")
+NodeWindow = namedtuple("NodeWindow", "rows total offset") # total: nodes matching the filter; offset: after clamping
+DEFAULT_NODE_QUERY = NodeQuery("number", False, "all", 0, 64)
+
+class _Order: # Ascending permutation of node indices for one column, plus the key values in that order
+    __slots__ = ("indices", "keys", "size", "version", "reward_index", "filtered")
+    def __init__(self, indices, keys, size, version, reward_index): self.indices = indices; self.keys = keys; self.size = size; self.version = version; self.reward_index = reward_index; self.filtered = {}
+
+class NodeTableIndex:
+    def __init__(self): self.ledger = None; self.orders = {}
+
+    def _keys(self, key, n):
+        ledger = self.ledger
+        if key == "number": return np.arange(n, dtype=np.float64)
+        if key == "status": return ledger.active[:n].astype(np.float64)
+        if key == "own": return ledger.is_our[:n].astype(np.float64)
+        if key == "stake": return ledger.stake[:n]
+        if key == "rewards": return ledger.balances()
+        if key == "commission": return ledger.commission[:n]
+        raise ValueError(f"Unknown node sort key '{key}'")
+
+    def _build(self, key, n):
+        keys = self._keys(key, n); indices = np.argsort(keys, kind="stable")
+        return _Order(indices, keys[indices], n, self.ledger.version, self.ledger.reward_index)
+
+    def order(self, key):
+        ledger = self.ledger; n = ledger.size; entry = self.orders.get(key)
+        if entry is None or entry.size > n: entry = self.orders[key] = self._build(key, n)
+        if entry.version != ledger.version and not self._apply_changes(key, entry): entry = self.orders[key] = self._build(key, entry.size)
+        if entry.size < n: # Only appends since last time: merge the new rows in
+            new = np.arange(entry.size, n); new_keys = self._keys(key, n)[entry.size:]
+            sub = np.argsort(new_keys, kind="stable"); new = new[sub]; new_keys = new_keys[sub]
+            pos = np.searchsorted(entry.keys, new_keys, side="right") # After equal keys: ties stay in node order
+            entry.indices = np.insert(entry.indices, pos, new); entry.keys = np.insert(entry.keys, pos, new_keys); entry.size = n; entry.filtered = {}
+        if key == "rewards" and entry.reward_index != ledger.reward_index: self._refresh_rewards(entry)
+        ledger.trim_changes(min(e.version for e in self.orders.values()))
+        return entry
+
+    def _apply_changes(self, key, entry): # Moves the rows changed since entry.version to their new place; False: too many, rebuild
+        ledger = self.ledger; changes = ledger.changes_since(entry.version)
+        if changes is None: return False # Trimmed past this order's version
+        entry.version = ledger.version
+        if any("status" in columns for _, columns in changes): entry.filtered.pop("active", None)
+        rows = sorted({i for i, columns in changes if key in columns and i < entry.size}) # Rows appended later are merged with fresh keys
+        if not rows: return True
+        if len(rows) > NODE_ORDER_MAX_MOVES: return False
+        current = self._keys(key, entry.size); indices = entry.indices; keys = entry.keys
+        for i in rows:
+            pos = int(np.flatnonzero(indices == i)[0]); indices = np.delete(indices, pos); keys = np.delete(keys, pos); k = current[i]
+            lo = int(np.searchsorted(keys, k, side="left")); hi = int(np.searchsorted(keys, k, side="right"))
+            pos = lo + int(np.searchsorted(indices[lo:hi], i)) # Among equal keys, in node order
+            indices = np.insert(indices, pos, i); keys = np.insert(keys, pos, k)
+        entry.indices = indices; entry.keys = keys; entry.filtered = {}; return True
+
+    def _refresh_rewards(self, entry): # Exact again at the current reward index; re-sorts only if some node overtook another
+        keys = self.ledger.balances()[entry.indices]; entry.reward_index = self.ledger.reward_index
+        if len(keys) > 1 and bool(np.any(keys[1:] < keys[:-1])):
+            sub = np.argsort(keys, kind="stable"); entry.indices = entry.indices[sub]; keys = keys[sub]; entry.filtered = {}
+        entry.keys = keys
+
+    def _filtered(self, entry, name):
+        if name == "all": return entry.indices
+        indices = entry.filtered.get(name)
+        if indices is None:
+            if name not in NODE_FILTERS: raise ValueError(f"Unknown node filter '{name}'")
+            mask = self.ledger.is_our if name == "our" else self.ledger.active
+            indices = entry.filtered[name] = entry.indices[mask[entry.indices]]
+        return indices
+
+    def window(self, ledger, query): # Rows for one screenful of the table
+        if ledger is not self.ledger: self.ledger = ledger; self.orders = {} # e.g. a restored snapshot
+        indices = self._filtered(self.order(query.sort), query.filter)
+        if query.descending: indices = indices[::-1]
+        total = len(indices); offset = max(0, min(int(query.offset), total - query.count))
+        rows = tuple(NodeRow(i + 1, bool(ledger.active[i]), bool(ledger.is_our[i]), float(ledger.stake[i]), ledger.balance_of(i), float(ledger.commission[i]))
+                     for i in indices[offset:offset + query.count].tolist())
+        return NodeWindow(rows, total, offset)
@@ -0,0 +1,187 @@
+# ORDERBOOK - Price-time priority limit order book for COIN/USD, and hybrid routing between the book and an AMM pool
+#
+# Prices are held as integer ticks (price / tick), so equal prices always share one level. Each side keeps a heap of its
+# level ticks (bids negated, so both heaps pop the best level first) and a dict tick -> [live orders, FIFO deque]:
+#   add     O(log n)   heappush only when the price level is new
+#   cancel  O(1)       the order is zeroed in place and skipped when its level is next matched
+#   match   O(log n) per level consumed, O(1) per order filled
+# An emptied level leaves the dict at once; its heap entry goes stale and is dropped when it reaches the top.
+# Orders are plain lists [remaining COIN, tick, side, owner, id, day]: side +1 bid / -1 ask, owner is the caller's tag.
+# Fills are (maker order, COIN, USD). Balances are NOT touched here: like Exchange.execute_batch, the caller settles
+# fills with whoever placed the orders, and escrows what a resting order could still need.
+
+import math
+from heapq import heappush, heappop, heapify
+from collections import deque
+
+ORDER_BOOK_TICK = 0.0001 # USD per price tick
+ORDER_BOOK_COMPACT_SLACK = 64 # Stale heap entries tolerated (beyond the live level count) before a heap is rebuilt
+
+class OrderBook:
+    # Event counters; class-level so books restored without __init__ (snapshots) start clean
+    adds = 0; cancels = 0; fills = 0; volume_coin = 0.0; volume_usd = 0.0
+
+    def __init__(self, tick=ORDER_BOOK_TICK):
+        self.tick = float(tick); self.next_id = 1; self.orders = {} # id -> resting order
+        self.bids = {}; self.asks = {}; self.bid_heap = []; self.ask_heap = [] # bid_heap holds -tick
+
+    def __len__(self): return len(self.orders)
+    def __bool__(self): return bool(self.orders)
+
+    def to_tick(self, price): return int(round(price / self.tick))
+
+    # --- Top of book ---
+    def best_bid_tick(self):
+        heap = self.bid_heap; levels = self.bids
+        while heap:
+            if -heap[0] in levels: return -heap[0]
+            heappop(heap)
+        return None
+    def best_ask_tick(self):
+        heap = self.ask_heap; levels = self.asks
+        while heap:
+            if heap[0] in levels: return heap[0]
+            heappop(heap)
+        return None
+    def best_bid(self): t = self.best_bid_tick(); return None if t is None else t * self.tick
+    def best_ask(self): t = self.best_ask_tick(); return None if t is None else t * self.tick
+
+    def depth(self, side, levels=10): # [(price, COIN)] for the best `levels` price levels of one side (+1 bids, -1 asks)
+        book = self.bids if side > 0 else self.asks
+        ticks = sorted(book, reverse=side > 0)[:levels]
+        return [(t * self.tick, sum(order[0] for order in book[t][1])) for t in ticks]
+
+    def escrow(self): # (COIN behind resting asks, USD behind resting bids at their limit prices); O(orders)
+        coins = usd = 0.0
+        for order in self.orders.values():
+            if order[2] > 0: usd += order[0] * order[1] * self.tick
+            else: coins += order[0]
+        return coins, usd
+
+    # --- Order events ---
+    def add(self, side, price, coins, owner=None, day=0): # Limit order: matches what it crosses, rests the rest; returns (order or None, fills)
+        tick = round(price / self.tick); self.adds += 1; fills = ()
+        if side > 0:
+            heap = self.ask_heap; levels = self.asks
+            while heap and heap[0] not in levels: heappop(heap) # Stale top
+            if heap and heap[0] <= tick: fills, coins = self.match(side, coins, tick)
+        else:
+            heap = self.bid_heap; levels = self.bids
+            while heap and -heap[0] not in levels: heappop(heap)
+            if heap and -heap[0] >= tick: fills, coins = self.match(side, coins, tick)
+        if coins <= 0: return None, fills
+        order = [coins, tick, side, owner, self.next_id, day]; self.next_id += 1
+        self._rest(order); return order, fills
+
+    def _rest(self, order): # Queues an order at the back of its level
+        tick = order[1]
+        if order[2] > 0: levels = self.bids; heap = self.bid_heap; key = -tick
+        else: levels = self.asks; heap = self.ask_heap; key = tick
+        level = levels.get(tick)
+        if level is None:
+            level = levels[tick] = [0, deque()]; heappush(heap, key)
+            if len(heap) > 2 * len(levels) + ORDER_BOOK_COMPACT_SLACK: # Drop stale entries left by cancelled levels
+                heap[:] = [-t for t in levels] if order[2] > 0 else list(levels); heapify(heap)
+        level[0] += 1; level[1].append(order); self.orders[order[4]] = order
+
+    def cancel(self, order_id): # Returns (order, COIN that was still resting), or None if it is no longer on the book
+        order = self.orders.pop(order_id, None)
+        if order is None: return None
+        coins = order[0]; order[0] = 0.0; self.cancels += 1
+        levels = self.bids if order[2] > 0 else self.asks; level = levels[order[1]]; level[0] -= 1
+        if level[0] == 0: del levels[order[1]]
+        return order, coins
+
+    def match(self, side, coins, limit=None): # Taker order of `coins` (side +1 buys from asks); stops past limit tick. Returns (fills, COIN left)
+        if side > 0: heap = self.ask_heap; levels = self.asks; sign = 1
+        else: heap = self.bid_heap; levels = self.bids; sign = -1
+        fills = []; add = fills.append; orders = self.orders; tick_size = self.tick; filled = usd = 0.0
+        while coins > 0 and heap:
+            tick = heap[0] * sign; level = levels.get(tick)
+            if level is None: heappop(heap); continue
+            if limit is not None and (tick > limit if side > 0 else tick < limit): break
+            queue = level[1]; price = tick * tick_size
+            while queue:
+                order = queue[0]; q = order[0]
+                if q <= 0: queue.popleft(); continue # Cancelled
+                if q <= coins: coins -= q; order[0] = 0.0; queue.popleft(); del orders[order[4]]; level[0] -= 1; add((order, q, q * price)); filled += q; usd += q * price
+                else: order[0] = q - coins; add((order, coins, coins * price)); filled += coins; usd += coins * price; coins = 0.0; break
+            if level[0] == 0: del levels[tick]; heappop(heap)
+        self.fills += len(fills); self.volume_coin += filled; self.volume_usd += usd
+        return fills, coins
+
+    def resting(self): return sorted(self.orders.values(), key=lambda order: order[4]) # Time priority order, e.g. for snapshots
+    def restore(self, order): # Re-queues a saved order as-is (no matching); restore in resting() order to keep queue positions
+        order = list(order); self._rest(order); self.next_id = max(self.next_id, order[4] + 1); return order
+
+# --- Hybrid routing: book + AMM pool ---
+# A taker takes whichever source is cheaper at the margin. The pool's marginal buy cost is (1+f)*k/x^2 and its marginal
+# sell revenue (1-f)*k/x^2, so a pool fill that brings the pool exactly to the next book price P has the closed form
+#     buy:  x_end = sqrt((1+f)*k / P)        sell:  x_end = sqrt((1-f)*k / P)
+# and the route alternates: book level while it beats the pool, then the pool up to the next level's price, and so on.
+# Pool fills use the user-trade fee rules (buy: gross + fee, sell: gross - fee) and update the pool's statistics.
+def _pool_fill(pool, side, coins): # Returns (USD paid/received, fee), or None if the pool can't fill it
+    x = pool.coin_pool; y = pool.usd_pool; k = pool.k
+    if coins <= 0 or k == 0.0: return None
+    if side > 0:
+        if coins >= x - 1e-9: return None
+        gross = k / (x - coins) - y; fee = gross * pool.fee_rate; usd = gross + fee
+        if usd <= 0: return None
+        pool.coin_pool = x - coins; pool.usd_pool = y + usd
+    else:
+        gross = y - k / (x + coins); fee = gross * pool.fee_rate; usd = gross - fee
+        if usd <= 0: return None
+        pool.coin_pool = x + coins; pool.usd_pool = y - gross
+    pool._recalculate_k(); pool.record_fill(coins, usd, fee); return usd, fee
+
+def route_order(book, pool, side, coins, limit=None, budget=math.inf): # Taker order across book + pool, never past `limit` (a price)
+    # budget caps the USD a buy may spend. Returns {"fills": book fills, "coins": filled, "usd": paid (buy) / received (sell),
+    # "pool_coins": the pool's part of "coins", "fee": pool fees, "left": COIN not filled}
+    tick_size = book.tick # The limit's own level or better: rounding to the nearest tick could land half a tick past it
+    limit_tick = None if limit is None else math.floor(limit / tick_size + 1e-9) if side > 0 else math.ceil(limit / tick_size - 1e-9)
+    fills = []; filled = usd = pool_coins = fees = 0.0
+    while coins > 1e-9 and budget - usd > 1e-9:
+        best = book.best_ask_tick() if side > 0 else book.best_bid_tick()
+        if best is not None and limit_tick is not None and (best > limit_tick if side > 0 else best < limit_tick): best = None
+        best_price = None if best is None else best * tick_size
+        x = pool.coin_pool; k = pool.k; f = pool.fee_rate
+        margin = ((1.0 + f) if side > 0 else (1.0 - f)) * pool.usd_pool / x if k != 0.0 else None
+        if best is not None and (margin is None or (best_price <= margin * (1.0 + 1e-9) if side > 0 else best_price >= margin * (1.0 - 1e-9))): # Book level first
+            take = coins if side < 0 or budget == math.inf else min(coins, (budget - usd) / best_price)
+            if take <= 1e-9: break
+            level_fills, rest = book.match(side, take, best)
+            fills.extend(level_fills); got = take - rest; filled += got; usd += sum(fill[2] for fill in level_fills); coins -= got
+            continue
+        bound = best_price if best is not None else limit # The pool may be taken to this price, then the book (or the limit) is better
+        if margin is None or (bound is not None and (margin >= bound if side > 0 else margin <= bound)): break
+        if bound is None: amount = coins
+        elif side > 0: amount = min(coins, x - math.sqrt((1.0 + f) * k / bound))
+        else: amount = min(coins, math.sqrt((1.0 - f) * k / bound) - x)
+        if side > 0 and budget != math.inf: # Closed-form max COIN for the budget left, fee included, short of its rounding error
+            left = pool.affordable_spend(budget - usd); amount = min(amount, left * x / ((1.0 + f) * pool.usd_pool + left))
+        if amount <= 1e-9: break
+        result = _pool_fill(pool, side, amount)
+        if result is None: break
+        filled += amount; usd += result[0]; fees += result[1]; pool_coins += amount; coins -= amount
+    return {"fills": fills, "coins": filled, "usd": usd, "pool_coins": pool_coins, "fee": fees, "left": max(0.0, coins)}
+
+def cross_with_pool(book, pool): # Fills resting orders the pool's price has moved through, against the pool; returns fills
+    # A bid above the pool's marginal buy cost buys from the pool (up to where the pool reaches the bid), an ask below its
+    # marginal sell revenue sells into it. The order fills at the pool's price, not its limit: fill USD is what moved.
+    fills = []
+    for side in (1, -1): # Pool side: +1 the pool sells to bids, -1 it buys from asks
+        levels = book.bids if side > 0 else book.asks
+        while pool.k != 0.0:
+            best = book.best_bid_tick() if side > 0 else book.best_ask_tick()
+            if best is None: break
+            price = best * book.tick; x = pool.coin_pool; f = pool.fee_rate
+            if side > 0: amount = x - math.sqrt((1.0 + f) * pool.k / price) # Lifts the pool's marginal cost to the bid
+            else: amount = math.sqrt((1.0 - f) * pool.k / price) - x # Lowers the pool's marginal revenue to the ask
+            coins = min(amount, sum(order[0] for order in levels[best][1]))
+            if coins <= 1e-9: break
+            result = _pool_fill(pool, side, coins)
+            if result is None: break
+            level_fills, _ = book.match(-side, coins, best)
+            scale = result[0] / sum(fill[2] for fill in level_fills) # Repriced from the limit to the pool's average price
+            fills.extend((order, q, usd * scale) for order, q, usd in level_fills)
+    return fills
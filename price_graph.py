@@ -0,0 +1,95 @@
+# PRICE GRAPH - Append-only price buffer with level-of-detail (min/max) decimation for plotting
+
+import math
+import numpy as np
+
+SERIES_INITIAL_CAPACITY = 1024
+
+# --- Price Series ---
+# Points live in a preallocated, doubling float64 buffer (NaN = no valid price that day).
+# Alongside it we keep a min/max pyramid: level L holds the min and max of each aligned block of 2**L points,
+# updated incrementally on append. Any window of N points can then be reduced to W pixel columns by reading
+# ~W..2W entries of one level, so plotting cost depends on the pixel width, not on the history length.
+class PriceSeries:
+    def __init__(self, capacity=SERIES_INITIAL_CAPACITY):
+        self.values = np.full(max(2, int(capacity)), np.nan, dtype=np.float64); self.size = 0
+        self.levels = [] # levels[i] = [mins, maxs, count] for block size 2**(i+1)
+        self.min_value = math.inf; self.max_value = -math.inf; self.valid_count = 0
+        self.version = 0 # Bumped on every append; renderers cache on it
+
+    def __len__(self): return self.size
+    def view(self): return self.values[:self.size]
+    def last(self): return float(self.values[self.size - 1]) if self.size else None
+    def last_valid(self, size=None): # Most recent non-NaN price among the first `size` points
+        valid = np.flatnonzero(~np.isnan(self.values[:self.size if size is None else size]))
+        return float(self.values[valid[-1]]) if len(valid) else None
+
+    def append(self, price):
+        if price is None or not isinstance(price, (int, float)) or math.isnan(price) or math.isinf(price) or price < 0: price = math.nan
+        if self.size == len(self.values): self.values = _grown(self.values, len(self.values) * 2)
+        self.values[self.size] = price; self.size += 1; self.version += 1
+        if price == price: # Valid point: maintain running extremes
+            self.valid_count += 1
+            if price < self.min_value: self.min_value = price
+            if price > self.max_value: self.max_value = price
+        # Completed a block at level 1, 2, ...? Propagate upwards while the new block closes a pair.
+        lo_src, hi_src, n = self.values, self.values, self.size; level = 0
+        while n % 2 == 0 and n > 0:
+            if level == len(self.levels): self.levels.append([np.full(SERIES_INITIAL_CAPACITY, np.nan), np.full(SERIES_INITIAL_CAPACITY, np.nan), 0])
+            mins, maxs, count = self.levels[level]
+            if count == len(mins): mins = _grown(mins, count * 2); maxs = _grown(maxs, count * 2); self.levels[level][0] = mins; self.levels[level][1] = maxs
+            mins[count] = np.fmin(lo_src[n - 2], lo_src[n - 1]); maxs[count] = np.fmax(hi_src[n - 2], hi_src[n - 1]) # fmin/fmax skip NaN
+            self.levels[level][2] = n = count + 1
+            lo_src, hi_src = mins, maxs; level += 1
+
+    def extend(self, prices):
+        for price in prices: self.append(price)
+
+    # Returns (x_fraction, lows, highs) for at most ~width columns covering the first `size` points (default: all).
+    # x_fraction in [0, 1] is the column position; lows/highs are the per-column extremes (NaN where no valid data).
+    # Points and completed blocks are never rewritten, so a prefix stays readable while another thread keeps appending.
+    def decimate(self, width, size=None):
+        n = self.size if size is None else size; width = max(1, int(width))
+        if n == 0: return np.empty(0), np.empty(0), np.empty(0)
+        if n <= width: # Fewer points than pixels: plot raw points
+            raw = self.values[:n]; return np.linspace(0.0, 1.0, n) if n > 1 else np.zeros(1), raw, raw
+        level = min(int(math.log2(n / width)), len(self.levels)) # Coarsest level that still gives >= width blocks
+        if level == 0: lows = highs = self.values[:n]; covered = n
+        else:
+            level_data = self.levels[level - 1]; count = n >> level; lows = level_data[0][:count]; highs = level_data[1][:count]; covered = count << level
+        m = len(lows); starts = (np.arange(width) * m) // width
+        col_lows = np.fmin.reduceat(lows, starts); col_highs = np.fmax.reduceat(highs, starts)
+        if covered < n: # Tail points not yet folded into a complete block at this level (< 2**level of them)
+            tail = self.values[covered:n]; tail = tail[tail == tail]
+            if len(tail): col_lows[-1] = np.fmin(col_lows[-1], tail.min()); col_highs[-1] = np.fmax(col_highs[-1], tail.max())
+        return np.linspace(0.0, 1.0, width), col_lows, col_highs
+
+def _grown(arr, capacity):
+    new = np.full(capacity, np.nan, dtype=arr.dtype); new[:len(arr)] = arr; return new
+
+# --- Plot Buffer ---
+# Screen-space polyline for a PriceSeries inside a rect, rebuilt only when the series length or the rect changes.
+# `size` plots just the first `size` points (a published snapshot of a series another thread is appending to).
+class PlotBuffer:
+    def __init__(self, series): self.series = series; self.key = None; self.points = []; self.y_range = (0.0, 0.0); self.rebuilds = 0
+
+    def points_for(self, left, top, width, height, size=None):
+        size = self.series.size if size is None else size
+        key = (size, left, top, width, height)
+        if key == self.key: return self.points
+        self.key = key; self.rebuilds += 1
+        xs, lows, highs = self.series.decimate(width, size)
+        valid = ~np.isnan(lows)
+        if not valid.any(): self.points = []; return self.points
+        min_price = float(lows[valid].min()); max_price = float(highs[valid].max()); price_range = max_price - min_price
+        if price_range < 1e-9: price_range = max(max_price * 0.1, 1e-6); max_price += price_range * 0.5; min_price -= price_range * 0.5
+        min_price = max(0, min_price); price_range = max_price - min_price
+        if price_range < 1e-9: price_range = 1.0; max_price = max(0.5, max_price + 0.5); min_price = 0.0
+        self.y_range = (min_price, max_price)
+        px = left + xs[valid] * (width - 1); y_scale = height / price_range
+        py_low = np.clip(top + height - (lows[valid] - min_price) * y_scale, top, top + height)
+        py_high = np.clip(top + height - (highs[valid] - min_price) * y_scale, top, top + height)
+        if len(lows) <= width and np.array_equal(lows, highs, equal_nan=True): points = np.column_stack((px, py_low))
+        else: points = np.column_stack((np.repeat(px, 2), np.column_stack((py_low, py_high)).ravel())) # Vertical min-max stroke per column keeps spikes visible
+        self.points = points.tolist()
+        return self.points
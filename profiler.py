@@ -0,0 +1,56 @@
+# PROFILER - Per-phase timing (call counts, cumulative time, p50/p99 over a recent window)
+#
+# Instrumented code checks `profiler.enabled` itself, so a disabled profiler costs one attribute test per phase:
+#     t = prof.clock() if prof.enabled else 0.0
+#     ...phase...
+#     if prof.enabled: t = prof.lap("phase_name", t)
+
+import csv
+import json
+import time
+
+PROFILER_WINDOW = 2048 # Most recent samples per phase kept for the percentiles
+
+class PhaseStats:
+    __slots__ = ("count", "total", "max", "samples", "pos")
+    def __init__(self): self.count = 0; self.total = 0.0; self.max = 0.0; self.samples = []; self.pos = 0
+
+class PhaseProfiler:
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, enabled=False, window=PROFILER_WINDOW):
+        self.enabled = enabled; self.window = max(1, int(window)); self.phases = {} # Insertion order = first time each phase ran
+
+    def record(self, name, seconds):
+        stats = self.phases.get(name)
+        if stats is None: stats = self.phases[name] = PhaseStats()
+        stats.count += 1; stats.total += seconds
+        if seconds > stats.max: stats.max = seconds
+        if len(stats.samples) < self.window: stats.samples.append(seconds)
+        else: stats.samples[stats.pos] = seconds; stats.pos = (stats.pos + 1) % self.window # Ring buffer once full
+
+    def lap(self, name, start): # Records now - start under `name` and returns now, so consecutive phases chain
+        now = time.perf_counter(); self.record(name, now - start); return now
+
+    def reset(self): self.phases = {}
+
+    def summary(self): # One dict per phase; times in milliseconds
+        rows = []
+        for name, stats in list(self.phases.items()): # list(): the phase dict may grow on another thread
+            samples = sorted(stats.samples); n = len(samples)
+            rows.append({"phase": name, "count": stats.count, "total_ms": stats.total * 1e3, "mean_ms": stats.total * 1e3 / stats.count if stats.count else 0.0,
+                         "p50_ms": samples[n // 2] * 1e3 if n else 0.0, "p99_ms": samples[min(n - 1, int(n * 0.99))] * 1e3 if n else 0.0, "max_ms": stats.max * 1e3})
+        return rows
+
+    def export(self, path): # .csv -> one row per phase, anything else -> JSON
+        rows = self.summary()
+        with open(path, "w", newline="") as f:
+            if path.endswith(".csv"):
+                writer = csv.DictWriter(f, fieldnames=["phase", "count", "total_ms", "mean_ms", "p50_ms", "p99_ms", "max_ms"]); writer.writeheader(); writer.writerows(rows)
+            else: json.dump({"window": self.window, "phases": rows}, f, indent=2)
+        return path
+
+    def format_lines(self): # Fixed-width text rows for consoles and the HUD overlay
+        lines = [f"{'phase':<22}{'calls':>9}{'total ms':>11}{'p50 ms':>9}{'p99 ms':>9}"]
+        for row in self.summary(): lines.append(f"{row['phase']:<22}{row['count']:>9}{row['total_ms']:>11.1f}{row['p50_ms']:>9.3f}{row['p99_ms']:>9.3f}")
+        return lines
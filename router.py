@@ -0,0 +1,193 @@
+# ROUTER - Splits orders across several constant-product COIN/USD pools, and arbitrages them back into line
+#
+# A pool with reserves (r_in, r_out) pays  h * r_out * g*a / (r_in + g*a)  for an input a, where g is the share of
+# the input that reaches the curve and h the share of the output paid out (fees live in g or h). Its marginal rate
+# h*g*k / (r_in + g*a)^2 falls as a grows, so the best split gives every used pool the same marginal rate, which
+# has a closed form once the set of used pools is known:
+#     r_in_i + g_i*a_i = t * sqrt(h_i*g_i*k_i),   t = (A + sum r_in_i/g_i) / sum sqrt(h_i*g_i*k_i)/g_i
+# The used pools are always the ones with the best starting rate, so one pass over the pools sorted by starting
+# rate finds the set: add pools until the next one starts below the common marginal rate 1/t^2.
+# Buying an exact COIN amount (minimum total cost) works the same way from the other side of the curve.
+#
+# With a single pool every call goes straight to that Exchange, so a one-pool network trades exactly as before.
+#
+# Routed quotes cost a split plus one quote per pool, so they are memoized per (kind, amount) for the current pool state:
+# the cache belongs to one state of the pools (which Exchange objects, and each one's Exchange.version, bumped by every
+# reserve mutation) and is dropped as soon as any pool trades or is swapped for another, so a stale quote is never
+# served. Single-pool quotes are closed-form and cheaper to recompute than to look up, so they are not cached.
+
+import math
+from operator import attrgetter
+import numpy as np
+
+QUOTE_CACHE_SIZE = 256 # Routed quotes kept per pool state
+_pool_version = attrgetter("version")
+
+class Router:
+    # Arbitrage totals (an outside arbitrageur keeps the profit); class-level so restored routers start clean
+    arb_count = 0; arb_volume_coin = 0.0; arb_profit_usd = 0.0
+    quote_cache = None; quote_cache_state = None; cache_hits = 0; cache_misses = 0 # See QUOTE_CACHE_SIZE
+
+    def __init__(self, pools): self.pools = list(pools) # pools[0] is the main pool (price history, candles, user batches)
+
+    @property
+    def main(self): return self.pools[0]
+
+    # --- Splits: one input amount per pool (0.0 for pools left out) ---
+    def _split_in(self, amount, params): # params: (r_in, r_out, g, h) per pool; maximizes total output
+        rates = [(h * g * r_out / r_in if r_in > 1e-9 and r_out > 1e-9 else 0.0, i) for i, (r_in, r_out, g, h) in enumerate(params)]
+        rates.sort(reverse=True); used = []; sum_r = 0.0; sum_s = 0.0; t = 0.0
+        for rate, i in rates:
+            if rate <= 0.0 or (used and rate * t * t <= 1.0): break # Next pool starts below the common marginal rate
+            r_in, r_out, g, h = params[i]; sum_r += r_in / g; sum_s += math.sqrt(h * g * r_in * r_out) / g
+            used.append(i); t = (amount + sum_r) / sum_s
+        split = [0.0] * len(params)
+        for i in used: r_in, r_out, g, h = params[i]; split[i] = max(0.0, (t * math.sqrt(h * g * r_in * r_out) - r_in) / g)
+        if used: split[used[0]] += amount - sum(split) # Rounding residue goes to the best pool, so the split sums exactly
+        return split
+
+    def _split_out(self, amount, params): # params: (r_in, r_out, c) per pool, c = cost multiplier on the input; minimizes total input
+        rates = sorted((c * r_in / r_out if r_in > 1e-9 and r_out > 1e-9 else math.inf, i) for i, (r_in, r_out, c) in enumerate(params))
+        used = []; sum_out = 0.0; sum_s = 0.0; t = 0.0
+        for rate, i in rates:
+            if rate == math.inf or (used and t > 0 and rate * t * t >= 1.0): break # Next pool starts above the common marginal cost
+            r_in, r_out, c = params[i]; sum_out += r_out; sum_s += math.sqrt(c * r_in * r_out)
+            used.append(i); t = (sum_out - amount) / sum_s
+        if t <= 0: return None # More than the used pools can ever deliver
+        split = [0.0] * len(params)
+        for i in used: r_in, r_out, c = params[i]; split[i] = max(0.0, r_out - t * math.sqrt(c * r_in * r_out))
+        split[used[0]] += amount - sum(split)
+        return split
+
+    def split_sell(self, coins, fees=True): return self._split_in(coins, [(p.coin_pool, p.usd_pool, 1.0, 1.0 - p.fee_rate if fees else 1.0) for p in self.pools])
+    def split_buy_usd(self, usd, fees=False): return self._split_in(usd, [(p.usd_pool, p.coin_pool, 1.0 / (1.0 + p.fee_rate) if fees else 1.0, 1.0) for p in self.pools])
+    def split_buy(self, coins): return self._split_out(coins, [(p.usd_pool, p.coin_pool, 1.0 + p.fee_rate) for p in self.pools])
+
+    # --- Quotes (same dict shapes as Exchange, summed over the split) ---
+    def get_spot_price(self): return self.main.get_spot_price()
+    def _routed_quote(self, split, quote_name, amount_key, totals):
+        if split is None: return None
+        result = dict.fromkeys(totals, 0.0)
+        for pool, share in zip(self.pools, split):
+            if share <= 0: continue
+            quote = getattr(pool, quote_name)(share)
+            if quote is None: return None
+            for key in totals: result[key] += quote[key]
+        if result[amount_key] <= 0: return None
+        return result
+    def get_buy_quote(self, coins): return self.main.get_buy_quote(coins) if len(self.pools) == 1 else self._cached_quote("buy", coins, self._buy_quote)
+    def get_sell_quote(self, coins): return self.main.get_sell_quote(coins) if len(self.pools) == 1 else self._cached_quote("sell", coins, self._sell_quote)
+    def get_system_buy_quote_for_usd(self, usd): return self.main.get_system_buy_quote_for_usd(usd) if len(self.pools) == 1 else self._cached_quote("system_buy", usd, self._system_buy_quote)
+    def get_system_sell_quote_for_coins(self, coins): return self.main.get_system_sell_quote_for_coins(coins) if len(self.pools) == 1 else self._cached_quote("system_sell", coins, self._system_sell_quote)
+    def _buy_quote(self, coins):
+        quote = self._routed_quote(self.split_buy(float(coins)), "get_buy_quote", "usd_cost", ("usd_cost", "fee"))
+        if quote: quote["effective_price"] = quote["usd_cost"] / float(coins)
+        return quote
+    def _sell_quote(self, coins):
+        quote = self._routed_quote(self.split_sell(float(coins)), "get_sell_quote", "usd_received", ("usd_received", "fee"))
+        if quote: quote["effective_price"] = quote["usd_received"] / float(coins)
+        return quote
+    def _system_buy_quote(self, usd):
+        quote = self._routed_quote(self.split_buy_usd(float(usd)), "get_system_buy_quote_for_usd", "coins_received", ("coins_received", "usd_spent"))
+        if quote: quote["effective_price"] = quote["usd_spent"] / quote["coins_received"]
+        return quote
+    def _system_sell_quote(self, coins):
+        quote = self._routed_quote(self.split_sell(float(coins), fees=False), "get_system_sell_quote_for_coins", "usd_received", ("usd_received", "coins_sold"))
+        if quote: quote["effective_price"] = quote["usd_received"] / quote["coins_sold"]
+        return quote
+
+    def _cached_quote(self, kind, amount, compute): # Returned quotes are shared with the cache: read them, don't modify them
+        try: key = (kind, float(amount))
+        except (TypeError, ValueError): return compute(amount) # Let the quote itself reject it, as without the cache
+        state = (*self.pools, *map(_pool_version, self.pools)); cache = self.quote_cache # Per pool, not summed: a restored pool restarts at version 0
+        if cache is None or state != self.quote_cache_state: cache = self.quote_cache = {}; self.quote_cache_state = state
+        quote = cache.get(key, cache)
+        if quote is not cache: self.cache_hits += 1; return quote
+        self.cache_misses += 1; quote = compute(amount)
+        if len(cache) >= QUOTE_CACHE_SIZE: cache.clear() # Bounded: start over rather than track recency
+        cache[key] = quote; return quote
+    def quote_cache_stats(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {"hits": self.cache_hits, "misses": self.cache_misses, "hit_rate": self.cache_hits / lookups if lookups else 0.0, "size": len(self.quote_cache or ())}
+    def depth_curve(self, coin_sizes): # Exchange.depth_curve for routed orders: one split per size and side (one NumPy pass with a single pool)
+        if len(self.pools) == 1: return self.main.depth_curve(coin_sizes)
+        sizes = np.asarray(coin_sizes, dtype=np.float64); spot = self.get_spot_price() or np.nan
+        buy = np.array([q["effective_price"] if q else np.nan for q in map(self._buy_quote, sizes.tolist())], dtype=np.float64)
+        sell = np.array([q["effective_price"] if q else np.nan for q in map(self._sell_quote, sizes.tolist())], dtype=np.float64)
+        return {"sizes": sizes, "spot": spot, "buy_price": buy, "sell_price": sell, "buy_slippage": buy / spot - 1.0, "sell_slippage": 1.0 - sell / spot}
+    def quote_copy(self): # Detached copies of every pool, for quoting on another thread
+        copy = Router.__new__(Router); copy.pools = [p.quote_copy() for p in self.pools]; return copy
+
+    # --- Execution ---
+    def system_buy(self, usd): # Fee-free (system/MM) buy; returns (coins received, USD spent) or None
+        if len(self.pools) == 1: coins = self.main.system_buy(usd); return None if coins is None else (coins, usd)
+        coins = spent = 0.0
+        for pool, share in zip(self.pools, self.split_buy_usd(usd)):
+            got = pool.system_buy(share) if share > 0 else None
+            if got is not None: coins += got; spent += share
+        return (coins, spent) if coins > 0 else None
+    def system_sell(self, coins): # Fee-free (system/MM) sell; returns (USD received, COIN sold) or None
+        if len(self.pools) == 1: usd = self.main.system_sell(coins); return None if usd is None else (usd, coins)
+        usd = sold = 0.0
+        for pool, share in zip(self.pools, self.split_sell(coins, fees=False)):
+            got = pool.system_sell(share) if share > 0 else None
+            if got is not None: usd += got; sold += share
+        return (usd, sold) if usd > 0 else None
+
+    def buy_coins(self, user, coin_amount_str): # Exchange.buy_coins across pools: all-or-nothing on the total cost
+        if len(self.pools) == 1: return self.main.buy_coins(user, coin_amount_str)
+        try: coins = float(str(coin_amount_str).replace(',', '.')); assert coins > 0
+        except (ValueError, TypeError, AssertionError): self.main.notify("Invalid coin amount (>0)", "error"); return False
+        split = self.split_buy(coins); quote = self._routed_quote(split, "get_buy_quote", "usd_cost", ("usd_cost", "fee"))
+        if quote is None: self.main.notify("Cannot buy (check amount/liquidity)", "error"); return False
+        if user.usd_balance < quote["usd_cost"]: self.main.notify(f"Insufficient USD ({user.usd_balance:,.2f}<{quote['usd_cost']:,.2f})", "error"); return False
+        for pool, share in zip(self.pools, split):
+            if share > 0: pool.buy_coins(user, share)
+        return True
+    def sell_coins(self, user, coin_amount_str):
+        if len(self.pools) == 1: return self.main.sell_coins(user, coin_amount_str)
+        try: coins = float(str(coin_amount_str).replace(',', '.')); assert coins > 0
+        except (ValueError, TypeError, AssertionError): self.main.notify("Invalid coin amount (>0)", "error"); return False
+        if user.coin_balance < coins: self.main.notify(f"Insufficient coins ({user.coin_balance:,.0f}<{coins:,.0f})", "error"); return False
+        split = self.split_sell(coins)
+        if self._routed_quote(split, "get_sell_quote", "usd_received", ("usd_received",)) is None: self.main.notify("Cannot sell (check amount/liquidity)", "error"); return False
+        for pool, share in zip(self.pools, split):
+            if share > 0: pool.sell_coins(user, share)
+        return True
+
+    # --- Arbitrage ---
+    # An arbitrageur buys COIN (paying fees) where it is cheap and sells it (paying fees) where it is dear until the marginal
+    # buy cost meets the marginal sell revenue at a common lambda. Sweeping lambda upward over the pools' starting marginals,
+    # pools join the buy set and leave the sell set one at a time; inside each stretch the sets are fixed and
+    #     t = (sum_B x + sum_S x) / (sum_B sqrt((1+f)k) + sum_S sqrt((1-f)k)),   lambda = 1/t^2
+    # and the first stretch that contains its own lambda is the answer. The arbitrageur stays COIN-neutral.
+    def arbitrage(self, min_profit=0.0): # Returns {"coins", "profit"} for the trades made, or None if the pools are already in line
+        pools = [p for p in self.pools if p.k != 0.0]
+        if len(pools) < 2: return None
+        buy_marginal = [(1.0 + p.fee_rate) * p.usd_pool / p.coin_pool for p in pools]; sell_marginal = [(1.0 - p.fee_rate) * p.usd_pool / p.coin_pool for p in pools]
+        if min(buy_marginal) >= max(sell_marginal): return None
+        buy_root = [math.sqrt((1.0 + p.fee_rate) * p.k) for p in pools]; sell_root = [math.sqrt((1.0 - p.fee_rate) * p.k) for p in pools]
+        events = sorted([(m, 0, i) for i, m in enumerate(buy_marginal)] + [(m, 1, i) for i, m in enumerate(sell_marginal)])
+        buy_set = set(); sell_set = set(range(len(pools)))
+        x_b = s_b = 0.0; x_s = sum(p.coin_pool for p in pools); s_s = sum(sell_root); low = 0.0; t = None
+        for value, kind, i in events:
+            if buy_set and sell_set:
+                t_try = (x_b + x_s) / (s_b + s_s); lam = 1.0 / (t_try * t_try)
+                if low <= lam <= value: t = t_try; break
+            if kind == 0: buy_set.add(i); x_b += pools[i].coin_pool; s_b += buy_root[i]
+            else: sell_set.discard(i); x_s -= pools[i].coin_pool; s_s -= sell_root[i]
+            low = value
+        if t is None: return None
+        buys = {i: pools[i].coin_pool - t * buy_root[i] for i in buy_set}; sells = {i: t * sell_root[i] - pools[i].coin_pool for i in sell_set}
+        buys = {i: d for i, d in buys.items() if d > 0}; sells = {i: e for i, e in sells.items() if e > 0}
+        bought = sum(buys.values()); sold = sum(sells.values())
+        if bought <= 1e-9 or sold <= 1e-9: return None
+        sells = {i: e * bought / sold for i, e in sells.items()} # Exactly COIN-neutral
+        buy_quotes = [pools[i].get_buy_quote(d) for i, d in buys.items()]; sell_quotes = [pools[i].get_sell_quote(e) for i, e in sells.items()]
+        if None in buy_quotes or None in sell_quotes: return None
+        cost = sum(q["usd_cost"] for q in buy_quotes); revenue = sum(q["usd_received"] for q in sell_quotes)
+        if revenue - cost <= min_profit: return None
+        for i, d in buys.items(): pools[i].execute_batch([1], [d], [math.inf])
+        for i, e in sells.items(): pools[i].execute_batch([-1], [e], [math.inf])
+        self.arb_count += 1; self.arb_volume_coin += bought; self.arb_profit_usd += revenue - cost
+        return {"coins": bought, "profit": revenue - cost}
@@ -0,0 +1,185 @@
+# SNAPSHOT - Versioned binary checkpoint/restore of a full Network
+#
+# File layout (little-endian):
+#   magic  b"BSGSNAP\0"   8 bytes
+#   u32    format version
+#   u32    header length (bytes of UTF-8 JSON that follow)
+#   JSON   header: scalars, config, RNG state, and {name: dtype/shape/offset} for every column
+#   ...    raw column data, each column starting on a 64-byte boundary
+# Columns are memory-mapped copy-on-write on load, so restoring a 1M-user, multi-year state costs
+# one header parse plus page faults for whatever the simulation actually touches afterwards.
+
+import os
+import sys
+import json
+import time
+import struct
+from collections import deque
+import numpy as np
+from engine import Network, Exchange, SimConfig, format_num
+from router import Router
+from orderbook import OrderBook
+from ledger import UserLedger, NodeLedger, NODE_COLUMNS
+from profiler import PhaseProfiler
+from eventlog import EventLog
+from scheduler import Scheduler, SECONDS_PER_DAY
+
+SNAPSHOT_MAGIC = b"BSGSNAP\0"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_ALIGN = 64
+_PREFIX = struct.Struct("<8sII")
+
+# Plain attributes of Network that are saved as-is in the JSON header
+NETWORK_SCALARS = ("day", "base_emission", "total_emission", "added_emission", "remainder", "our_usd_balance",
+                   "mm_coin_balance", "mm_usd_balance", "prev_coin_pool", "prev_usd_pool", "prev_price", "last_simulated_day")
+# NodeLedger scalars: the reward-per-stake index and its running totals (node balances are saved unsettled, with their checkpoints)
+NODE_SCALARS = ("reward_index", "stake_total", "net_stake_total", "our_stake_total", "our_net_stake_total", "our_rewards_total")
+EXCHANGE_SCALARS = ("coin_pool", "usd_pool", "fee_rate", "k", "trade_count", "volume_coin", "volume_usd", "fees_usd",
+                    "session_open", "session_high", "session_low", "session_marks")
+ROUTER_SCALARS = ("arb_count", "arb_volume_coin", "arb_profit_usd")
+BOOK_SCALARS = ("tick", "next_id", "adds", "cancels", "fills", "volume_coin", "volume_usd")
+BOOK_COLUMNS = (("coins", np.float64), ("tick", np.int64), ("side", np.int8), ("owner", np.int64), ("id", np.int64), ("day", np.int64)) # One per order list slot
+
+class SnapshotError(Exception): pass
+
+def _align(nbytes): return -(-nbytes // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+
+# --- Save ---
+def _columns(network):
+    users = network.users; nodes = network.nodes
+    return {
+        "user_ids": users.id_view(), "user_coin": users.coin_view(), "user_usd": users.usd_view(),
+        **{f"node_{name}": getattr(nodes, name)[:nodes.size] for name, _ in NODE_COLUMNS},
+        "price_history": np.array([np.nan if p is None else p for p in network.price_history], dtype=np.float64), # None -> NaN
+        **_book_columns(network.book),
+    }
+
+def _book_columns(book): # Resting orders in time priority, one column per order field
+    orders = book.resting()
+    return {f"book_{name}": np.array([order[i] for order in orders], dtype=dtype) for i, (name, dtype) in enumerate(BOOK_COLUMNS)}
+
+def _exchange_fields(exchange, closing): # Saved as of the next session: from a day listener, the closed day's is still open
+    fields = {name: getattr(exchange, name) for name in EXCHANGE_SCALARS}
+    if closing:
+        price = exchange.get_spot_price(); fields.update(session_open=price, session_high=price, session_low=price)
+        fields["session_marks"] = (exchange.trade_count, exchange.volume_coin, exchange.volume_usd, exchange.fees_usd) # What start_session() sets
+    return fields
+
+def save_snapshot(network, path): # Between days only (e.g. from a day listener): pending events of an open day can't be saved
+    if network.day_in_progress(): raise SnapshotError(f"Day {network.day} is still in progress; snapshots are taken between days")
+    columns = _columns(network)
+    header = {
+        "network": {name: getattr(network, name) for name in NETWORK_SCALARS},
+        "exchange": _exchange_fields(network.exchange, network.closing) if network.exchange else None,
+        "extra_pools": [_exchange_fields(pool, network.closing) for pool in network.pools[1:]],
+        "router": {name: getattr(network.router, name) for name in ROUTER_SCALARS},
+        "nodes": {name: getattr(network.nodes, name) for name in NODE_SCALARS},
+        "book": {**{name: getattr(network.book, name) for name in BOOK_SCALARS}, "mm_quotes": network.mm_quotes},
+        "users": {"next_id": network.users.next_id, "initial_usd": network.users.initial_usd, "coin_total": network.users.coin_total, "usd_total": network.users.usd_total},
+        "price_history_maxlen": network.price_history.maxlen,
+        "config": network.config.to_dict(),
+        "rng": network.rng.bit_generator.state,
+        "saved_at": time.time(),
+        "arrays": {},
+    }
+    relative = 0 # Column offsets are relative to the first aligned byte after the header
+    for name, arr in columns.items():
+        header["arrays"][name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": relative}
+        relative += _align(arr.nbytes)
+    header_bytes = json.dumps(header).encode("utf-8"); data_start = _align(_PREFIX.size + len(header_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes))); f.write(header_bytes)
+        for name, arr in columns.items():
+            f.seek(data_start + header["arrays"][name]["offset"]); f.write(np.ascontiguousarray(arr).tobytes())
+        f.truncate(data_start + relative)
+    os.replace(tmp_path, path) # Readers never see a half-written snapshot
+    return path
+
+# --- Load ---
+def read_header(path):
+    with open(path, "rb") as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size: raise SnapshotError(f"'{path}' is too short to be a snapshot")
+        magic, version, header_len = _PREFIX.unpack(prefix)
+        if magic != SNAPSHOT_MAGIC: raise SnapshotError(f"'{path}' is not a simulation snapshot")
+        if version > SNAPSHOT_VERSION: raise SnapshotError(f"Snapshot format v{version} is newer than supported v{SNAPSHOT_VERSION}")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    header["data_start"] = _align(_PREFIX.size + header_len)
+    return header
+
+def _open_column(path, header, name, mmap):
+    info = header["arrays"][name]; dtype = np.dtype(info["dtype"]); shape = tuple(info["shape"]); offset = header["data_start"] + info["offset"]
+    if not mmap or int(np.prod(shape)) == 0: # np.memmap cannot map zero bytes
+        with open(path, "rb") as f: f.seek(offset); return np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    return np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=shape) # Copy-on-write: the sim can keep mutating, the file stays intact
+
+def load_snapshot(path, mmap=True):
+    header = read_header(path); col = lambda name: _open_column(path, header, name, mmap)
+
+    network = Network.__new__(Network) # Skip __init__: no allocation log, no re-seeding, no re-simulation
+    network.config = SimConfig(**header["config"])
+    for name, value in header["network"].items():
+        if name in NETWORK_SCALARS: setattr(network, name, value) # Older snapshots also carry the node totals, now kept on the ledger
+    network.day_listeners = []; network.last_reward_time = time.time(); network.profiler = PhaseProfiler(); network.events = EventLog()
+    network.rng = np.random.default_rng(); network.rng.bit_generator.state = header["rng"]
+    network.scheduler = Scheduler(network.day * SECONDS_PER_DAY) # Saved between days: nothing pending
+
+    users = UserLedger.__new__(UserLedger)
+    users.ids = col("user_ids"); users.coin = col("user_coin"); users.usd = col("user_usd"); users.size = len(users.ids)
+    users.next_id = header["users"]["next_id"]; users.initial_usd = header["users"]["initial_usd"]
+    users.coin_total = header["users"].get("coin_total", 0.0); users.usd_total = header["users"].get("usd_total", 0.0)
+    if "coin_total" not in header["users"]: users.recount()
+    network.users = users # capacity == size: the first add() copies into ordinary growable arrays
+
+    nodes = NodeLedger.__new__(NodeLedger); nodes.size = header["arrays"]["node_stake"]["shape"][0]
+    for name, dtype in NODE_COLUMNS: # node_checkpoint is absent from older snapshots, whose balances were fully settled
+        setattr(nodes, name, col(f"node_{name}") if f"node_{name}" in header["arrays"] else np.zeros(nodes.size, dtype=dtype))
+    for name in NODE_SCALARS: setattr(nodes, name, header.get("nodes", {}).get(name, 0.0))
+    network.nodes = nodes
+    if "nodes" not in header: nodes.recount()
+
+    history = col("price_history")
+    network.price_history = deque((None if np.isnan(p) else p for p in history.tolist()), maxlen=header["price_history_maxlen"])
+
+    network.exchange = _restore_exchange(network, header["exchange"]) if header["exchange"] is not None else None
+    network.pools = ([network.exchange] if network.exchange else []) + [_restore_exchange(network, fields) for fields in header.get("extra_pools", [])]
+    network.router = Router(network.pools)
+    for name, value in header.get("router", {}).items(): setattr(network.router, name, value)
+
+    fields = header.get("book", {}); network.book = book = OrderBook(fields.get("tick", network.config.ORDER_BOOK_TICK)) # Older snapshots: empty book
+    if "book_id" in header["arrays"]:
+        columns = [col(f"book_{name}").tolist() for name, _ in BOOK_COLUMNS]
+        network.book_queue = deque(book.restore(order) for order in zip(*columns)) # Saved in time priority: queue positions and expiry order hold
+    else: network.book_queue = deque()
+    for name in BOOK_SCALARS: setattr(book, name, fields.get(name, getattr(book, name)))
+    network.mm_quotes = fields.get("mm_quotes", [])
+    return network
+
+def _restore_exchange(network, fields):
+    exchange = Exchange.__new__(Exchange)
+    for name, value in fields.items(): setattr(exchange, name, value)
+    exchange.session_marks = tuple(exchange.session_marks) # JSON round-trips tuples as lists
+    if "session_open" not in fields: exchange.start_session()
+    exchange.on_message = network.notify; exchange.events = network.events
+    return exchange
+
+# --- Periodic snapshots ---
+class PeriodicSnapshotter: # Day listener: network.add_day_listener(PeriodicSnapshotter("snapshots", every=365))
+    def __init__(self, directory, every, keep=None):
+        self.directory = directory; self.every = max(1, int(every)); self.keep = keep; self.written = []
+        os.makedirs(directory, exist_ok=True)
+    def __call__(self, network):
+        if network.day % self.every: return
+        self.written.append(save_snapshot(network, snapshot_path(self.directory, network.day)))
+        while self.keep and len(self.written) > self.keep:
+            old = self.written.pop(0)
+            try: os.remove(old)
+            except OSError as e: print(f"Snapshot cleanup error for '{old}': {e}", file=sys.stderr)
+
+def snapshot_path(directory, day): return os.path.join(directory, f"day_{day:08d}.bsnap")
+
+def describe(path): # One-line summary without mapping any columns
+    header = read_header(path); arrays = header["arrays"]
+    return f"{path}: day {header['network']['day']}, {format_num(arrays['user_ids']['shape'][0])} users, {format_num(arrays['node_stake']['shape'][0])} nodes, {format_num(arrays['price_history']['shape'][0])} price points"
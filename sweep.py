@@ -0,0 +1,88 @@
+# SWEEP - Parallel Monte Carlo runner for Network over seeds and parameter grids
+
+import sys
+import os
+import ast
+import json
+import time
+import argparse
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from engine import Network, SimConfig, format_num, DAYS_PER_YEAR
+
+# Per-day series streamed back by every run (float32 keeps a 10-year run at ~7 KB per series)
+SERIES = ("price", "coin_pool", "usd_pool", "mm_coin", "mm_usd")
+
+# --- Tasks ---
+def param_grid(grid): # {"KEY": [v1, v2], ...} -> list of override dicts (cartesian product)
+    if not grid: return [{}]
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+def make_tasks(grid, seeds, days, base_seed=0):
+    # The RNG stream of a run depends only on (base_seed, run_id), never on which worker picks it up or when
+    tasks = []
+    for run_id, (overrides, seed_index) in enumerate(itertools.product(param_grid(grid), range(seeds))):
+        tasks.append({"run_id": run_id, "overrides": overrides, "seed_index": seed_index, "days": int(days),
+                      "seed": np.random.SeedSequence(base_seed, spawn_key=(run_id,))})
+    return tasks
+
+def run_task(task): # Executed in the worker process
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        network = Network(SimConfig(**task["overrides"]), seed=task["seed"])
+        days = task["days"]; out = np.full((len(SERIES), days), np.nan, dtype=np.float32)
+        for d in range(days):
+            network.step_day()
+            ex = network.exchange; price = ex.get_spot_price()
+            out[0, d] = np.nan if price is None else price; out[1, d] = ex.coin_pool; out[2, d] = ex.usd_pool
+            out[3, d] = network.mm_coin_balance; out[4, d] = network.mm_usd_balance
+    return {"run_id": task["run_id"], "overrides": task["overrides"], "seed_index": task["seed_index"], "series": out}
+
+# --- Runner ---
+def run_sweep(tasks, workers=None, chunksize=None, func=run_task): # Yields func(task) results in task order while later runs are still in flight
+    workers = workers or os.cpu_count() or 1 # func must be a module-level function (it is pickled to the workers)
+    if workers == 1:
+        for task in tasks: yield func(task)
+        return
+    chunksize = chunksize or max(1, len(tasks) // (workers * 8)) # Few enough round-trips for 10k-run sweeps, small enough to balance load
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(func, tasks, chunksize=chunksize)
+
+def collect(results, num_runs, days): # Stacks streamed results into one (runs, series, days) array
+    data = np.full((num_runs, len(SERIES), days), np.nan, dtype=np.float32); meta = [None] * num_runs
+    for result in results:
+        data[result["run_id"]] = result["series"]; meta[result["run_id"]] = {"overrides": result["overrides"], "seed_index": result["seed_index"]}
+    return data, meta
+
+# --- CLI ---
+def parse_grid(specs): # ["MM_BASE_REACTION_PERCENT=0.25,0.5", ...] -> {"MM_BASE_REACTION_PERCENT": [0.25, 0.5]}
+    grid = {}
+    for spec in specs or []:
+        key, _, values = spec.partition("=")
+        if not values: raise ValueError(f"Bad --grid entry '{spec}' (expected KEY=v1,v2,...)")
+        SimConfig(**{key: None}) # Validates the key name
+        grid[key] = [ast.literal_eval(v) for v in values.split(",")]
+    return grid
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fan (config, seed) runs of the simulation out across processes.")
+    parser.add_argument("--days", type=int, default=DAYS_PER_YEAR)
+    parser.add_argument("--seeds", type=int, default=8, help="Runs per grid point")
+    parser.add_argument("--base-seed", type=int, default=0)
+    parser.add_argument("--grid", action="append", help="KEY=v1,v2,... (repeatable; cartesian product)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default=None, help="Write stacked series to this .npz (plus runs metadata as JSON inside)")
+    args = parser.parse_args(argv)
+
+    tasks = make_tasks(parse_grid(args.grid), args.seeds, args.days, args.base_seed)
+    t0 = time.perf_counter(); data, meta = collect(run_sweep(tasks, args.workers), len(tasks), args.days); elapsed = time.perf_counter() - t0
+    final_price = data[:, 0, -1]
+    print(f"{format_num(len(tasks))} runs x {format_num(args.days)} days in {elapsed:.2f}s ({len(tasks) / elapsed:.1f} runs/s, {len(tasks) * args.days / elapsed:,.0f} days/s)")
+    print(f"Final price: mean ${np.nanmean(final_price):.5f} | p5 ${np.nanpercentile(final_price, 5):.5f} | p95 ${np.nanpercentile(final_price, 95):.5f}")
+    if args.out: np.savez_compressed(args.out, series=data, series_names=np.array(SERIES), runs=np.array(json.dumps(meta))); print(f"Saved {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
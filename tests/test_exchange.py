@@ -0,0 +1,83 @@
+# Exchange: batched execution against the one-trade-at-a-time path it replaces
+
+import os
+import sys
+from types import SimpleNamespace
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import Exchange
+
+POOL = (30_000_000.0, 10_000_000.0, 0.003) # COIN, USD, fee
+
+def _random_trades(seed, count=400, traders=20):
+    rng = np.random.default_rng(seed)
+    sides = np.where(rng.random(count) < 0.5, 1, -1); owners = rng.integers(0, traders, count)
+    amounts = rng.lognormal(np.log(5_000), 1.5, count)
+    amounts[rng.random(count) < 0.02] = POOL[0] * 2 # More than the pool holds: rejected for liquidity
+    amounts[rng.random(count) < 0.02] = -1.0 # Non-positive: rejected outright
+    return sides, owners, amounts, rng.uniform(0, 20_000, traders), rng.uniform(0, 30_000, traders)
+
+def test_execute_batch_matches_one_at_a_time():
+    sides, owners, amounts, usd, coin = _random_trades(seed=3)
+    one = Exchange(*POOL); users = [SimpleNamespace(usd_balance=u, coin_balance=c) for u, c in zip(usd.tolist(), coin.tolist())]
+    expected = []
+    for side, owner, amount in zip(sides.tolist(), owners.tolist(), amounts.tolist()):
+        user = users[owner]; before = (user.usd_balance, user.coin_balance)
+        if amount <= 0: expected.append((False, 0.0, 0.0)); continue # Rejected by the string parsing of buy_coins/sell_coins
+        ok = (one.buy_coins if side > 0 else one.sell_coins)(user, repr(amount))
+        expected.append((ok, abs(user.usd_balance - before[0]), abs(user.coin_balance - before[1])))
+
+    batch = Exchange(*POOL); usd_left = usd.copy(); coin_left = coin.copy(); fills = []
+    for side, owner, amount in zip(sides.tolist(), owners.tolist(), amounts.tolist()): # Budgets read at fill time, as the engine does
+        result = batch.execute_batch([side], [amount], [usd_left[owner] if side > 0 else coin_left[owner]])
+        filled = bool(result["filled"][0]); paid = float(result["usd"][0]); coins = float(result["coins"][0])
+        if filled: usd_left[owner] -= side * paid; coin_left[owner] += side * coins
+        fills.append((filled, paid, coins))
+
+    assert batch.coin_pool == one.coin_pool and batch.usd_pool == one.usd_pool and batch.k == one.k
+    assert [f[0] for f in fills] == [e[0] for e in expected]
+    assert any(not e[0] for e in expected) and any(e[0] for e in expected)
+    for (filled, paid, coins), (ok, usd_moved, coin_moved) in zip(fills, expected):
+        if ok: assert np.isclose(paid, usd_moved, rtol=1e-9) and np.isclose(coins, coin_moved, rtol=1e-9)
+    np.testing.assert_allclose(usd_left, [u.usd_balance for u in users], rtol=1e-12)
+    np.testing.assert_allclose(coin_left, [u.coin_balance for u in users], rtol=1e-12)
+    assert batch.trade_count == one.trade_count and np.isclose(batch.volume_usd, one.volume_usd) and np.isclose(batch.fees_usd, one.fees_usd)
+
+def test_execute_batch_in_one_call_matches_sequential_calls(): # Fixed budgets: one call over the whole batch == one call per trade
+    sides, _, amounts, _, _ = _random_trades(seed=5); budgets = np.where(sides > 0, 40_000.0, 6_000.0)
+    whole = Exchange(*POOL).execute_batch(sides, amounts, budgets)
+    single = Exchange(*POOL); parts = [single.execute_batch(sides[i:i + 1], amounts[i:i + 1], budgets[i:i + 1]) for i in range(len(sides))]
+    for key in ("filled", "coins", "usd", "fee"): np.testing.assert_array_equal(whole[key], np.concatenate([p[key] for p in parts]))
+
+def test_insufficient_balance_rejected_without_moving_the_pool():
+    one = Exchange(*POOL); batch = Exchange(*POOL); user = SimpleNamespace(usd_balance=10.0, coin_balance=5.0)
+    assert not one.buy_coins(user, "1000") and not one.sell_coins(user, "6")
+    result = batch.execute_batch([1, -1], [1000.0, 6.0], [10.0, 5.0])
+    assert not result["filled"].any() and (result["usd"] == 0).all()
+    assert (one.coin_pool, one.usd_pool) == (batch.coin_pool, batch.usd_pool) == POOL[:2]
+    assert user.usd_balance == 10.0 and user.coin_balance == 5.0 and batch.trade_count == one.trade_count == 0
+
+def _largest_affordable(exchange, budget, steps=200): # Bisection over get_buy_quote: the most COIN whose quoted cost fits the budget
+    low, high = 0.0, exchange.coin_pool
+    for _ in range(steps):
+        mid = (low + high) / 2; quote = exchange.get_buy_quote(mid)
+        if quote is not None and quote["usd_cost"] <= budget: low = mid
+        else: high = mid
+    return low
+
+def test_budget_buys_never_overspend_and_fill_even_far_above_the_reserves():
+    rng = np.random.default_rng(11)
+    for _ in range(500):
+        coin, usd = 10 ** rng.uniform(3, 12, 2); fee = rng.choice([0.0, 0.0005, 0.003, 0.01, 0.3]); budget = usd * 10 ** rng.uniform(-6, 12)
+        exchange = Exchange(coin, usd, fee); quote = exchange.get_buy_quote(float(exchange.max_buy_for_usd([budget])[0]))
+        result = exchange.execute_budget_buys([budget])
+        assert result["filled"][0], (coin, usd, fee, budget) # A budget always buys something: the margin keeps the cost inside it
+        assert result["usd"][0] <= budget and quote["usd_cost"] <= budget
+
+def test_budget_buys_and_max_buy_match_the_iterative_search():
+    for budget in (0.01, 250.0, 40_000.0, 3e6, 1e7, 1e9, 1e13, 1e18):
+        exchange = Exchange(*POOL); expected = _largest_affordable(exchange, budget)
+        quoted = float(exchange.max_buy_for_usd([budget])[0]); assert exchange.get_buy_quote(quoted)["usd_cost"] <= budget
+        assert quoted <= expected and np.isclose(quoted, expected, rtol=1e-9, atol=1e-14 * POOL[0]), budget # atol: tiny buys cost a few ulps of the USD reserve
+        result = exchange.execute_budget_buys([budget])
+        assert result["coins"][0] == quoted and result["usd"][0] <= budget
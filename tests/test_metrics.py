@@ -0,0 +1,41 @@
+# Metrics stream: what the CSV (Python fallback or pyarrow) and Parquet outputs read back as, for one run
+
+import os
+import sys
+import io
+import contextlib
+import numpy as np
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import Network, SimConfig
+from metrics import MetricsWriter, MetricsRecorder, METRIC_NAMES
+
+DAYS = 30
+
+def _run(paths, python_csv=()): # One seeded run streamed to every path; python_csv: paths forced onto the fallback formatter
+    with contextlib.redirect_stdout(io.StringIO()): network = Network(SimConfig(INITIAL_USERS=200), seed=5)
+    writers = [MetricsWriter(path, interval=3600) for path in paths]; seen = []
+    for writer in writers:
+        if writer.path in python_csv: writer.pa = None
+        network.add_day_listener(MetricsRecorder(writer))
+    network.add_day_listener(lambda n: seen.append((n.day, n.exchange.coin_pool, n.exchange.usd_pool, len(n.users), n.exchange.trade_count - n.exchange.session_marks[0])))
+    with contextlib.redirect_stdout(io.StringIO()): network.run_days(DAYS)
+    for writer in writers: writer.close()
+    return np.array(seen)
+
+def _csv(path): return np.genfromtxt(path, delimiter=",", names=True)
+
+def test_python_csv_reads_back_the_run(tmp_path):
+    path = str(tmp_path / "run.csv"); seen = _run([path], python_csv=[path]); data = _csv(path)
+    assert len(data) == DAYS
+    for i, name in enumerate(("day", "coin_pool", "usd_pool", "users", "trades")):
+        np.testing.assert_allclose(data[name], seen[:, i], rtol=1e-11, err_msg=name) # 12 significant digits
+
+def test_csv_and_parquet_read_back_the_same_values(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    paths = [str(tmp_path / name) for name in ("run.parquet", "pyarrow.csv", "python.csv")]
+    _run(paths, python_csv=paths[2:]); table = pq.read_table(paths[0]).to_pydict()
+    assert list(table) == list(METRIC_NAMES) and len(table["day"]) == DAYS
+    for name in METRIC_NAMES:
+        np.testing.assert_array_equal(_csv(paths[1])[name], table[name], err_msg=f"pyarrow CSV {name}") # Full precision both ways
+        np.testing.assert_allclose(_csv(paths[2])[name], table[name], rtol=1e-11, err_msg=f"Python CSV {name}")
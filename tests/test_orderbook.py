@@ -0,0 +1,57 @@
+# Order book: price-time priority, limits, and the pool leg of hybrid routing against a direct pool trade
+
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import Exchange
+from orderbook import OrderBook, route_order
+
+POOL = (30_000_000.0, 10_000_000.0, 0.003) # COIN, USD, fee; spot 0.3333
+
+def _random_book(rng, book, orders=200, spot=POOL[1] / POOL[0]):
+    for _ in range(orders):
+        side = 1 if rng.random() < 0.5 else -1; offset = rng.uniform(0.001, 0.05)
+        book.add(side, spot * (1 - offset if side > 0 else 1 + offset), float(rng.lognormal(np.log(5_000), 1.0)), owner=int(rng.integers(100)))
+
+def test_fifo_within_a_price_level():
+    book = OrderBook(); first, _ = book.add(-1, 0.35, 100.0, owner="a"); book.add(-1, 0.35, 50.0, owner="b")
+    book.add(-1, 0.34, 10.0, owner="better price"); cancelled, _ = book.add(-1, 0.35, 70.0, owner="cancelled"); book.add(-1, 0.35, 80.0, owner="c")
+    book.cancel(cancelled[4])
+    fills, left = book.match(1, 200.0)
+    assert [(order[3], coins) for order, coins, _ in fills] == [("better price", 10.0), ("a", 100.0), ("b", 50.0), ("c", 40.0)] and left == 0.0
+    assert first[0] == 0.0 and [order[3] for order in book.resting()] == ["c"] and book.resting()[0][0] == 40.0 # c keeps its place, partly filled
+    _, fills = book.add(1, 0.36, 10.0, owner="taker"); assert fills[0][0][3] == "c"
+
+def test_matching_and_routing_never_fill_past_the_limit():
+    rng = np.random.default_rng(6)
+    for trial in range(40):
+        book = OrderBook(); pool = Exchange(*POOL); _random_book(rng, book)
+        side = 1 if trial % 2 else -1; spot = pool.get_spot_price(); limit = spot * (1 + side * rng.uniform(0.0, 0.04)); k = pool.k
+        result = route_order(book, pool, side, float(rng.lognormal(np.log(200_000), 1.5)), limit)
+        for _, coins, usd in result["fills"]:
+            assert (usd / coins <= limit * (1 + 1e-12)) if side > 0 else (usd / coins >= limit * (1 - 1e-12))
+        margin = (1 + side * pool.fee_rate) * k / pool.coin_pool ** 2 # Price of the pool's last coin; the fee a buy leaves in the pool grows k after it
+        if result["pool_coins"] > 0: assert (margin <= limit * (1 + 1e-9)) if side > 0 else (margin >= limit * (1 - 1e-9))
+        best = book.best_ask() if side > 0 else book.best_bid() # What the order left on the book is beyond the limit
+        if result["left"] > 1e-9 and best is not None: assert (best > limit - book.tick) if side > 0 else (best < limit + book.tick)
+        fills, _ = book.match(side, 1e9, book.to_tick(limit))
+        assert all((usd / coins <= limit + book.tick) if side > 0 else (usd / coins >= limit - book.tick) for _, coins, usd in fills)
+
+def test_pool_leg_of_route_order_matches_a_direct_pool_trade():
+    for side, coins in ((1, 1_000.0), (1, 750_000.0), (-1, 2_500.0), (-1, 4_000_000.0)):
+        routed = Exchange(*POOL); direct = Exchange(*POOL); book = OrderBook()
+        book.add(-side, routed.get_spot_price() * (1 + side * 0.5), 1e6) # Far outside the pool's range: never touched
+        result = route_order(book, routed, side, coins)
+        expected = direct.execute_batch([side], [coins], [np.inf])
+        assert result["fills"] == [] and result["pool_coins"] == result["coins"] == coins and result["left"] == 0.0
+        assert np.isclose(result["usd"], expected["usd"][0], rtol=1e-12) and np.isclose(result["fee"], expected["fee"][0], rtol=1e-12)
+        assert np.isclose(routed.coin_pool, direct.coin_pool, rtol=1e-12) and np.isclose(routed.usd_pool, direct.usd_pool, rtol=1e-12)
+        assert routed.trade_count == direct.trade_count == 1 and np.isclose(routed.fees_usd, direct.fees_usd, rtol=1e-12)
+
+def test_budgeted_route_never_spends_past_the_budget():
+    rng = np.random.default_rng(8)
+    for _ in range(40):
+        book = OrderBook(); pool = Exchange(*POOL); _random_book(rng, book); budget = float(10 ** rng.uniform(1, 8))
+        result = route_order(book, pool, 1, 1e12, budget=budget)
+        assert 0 < result["usd"] <= budget
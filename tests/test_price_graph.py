@@ -0,0 +1,62 @@
+# Price graph: min/max pyramid decimation against the raw points, incremental appends against a rebuild, and edge cases
+
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from price_graph import PriceSeries, PlotBuffer
+
+def _prices(rng, n, nan_share=0.1):
+    prices = np.exp(np.cumsum(rng.normal(0, 0.05, n))); prices[rng.random(n) < nan_share] = np.nan; return prices
+
+def _series(prices): series = PriceSeries(capacity=4); series.extend(prices.tolist()); return series
+
+def _buckets(series, n, width): # Raw point range behind each decimated column, as decimate() lays them out
+    if n <= width: return [(i, i + 1) for i in range(n)]
+    level = min(int(np.log2(n / width)), len(series.levels)); m = n >> level; starts = (np.arange(width) * m) // width
+    bounds = [int(s) << level for s in starts] + [n] # The last column also takes the tail not yet folded into a block
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def test_decimation_keeps_each_buckets_true_min_and_max():
+    rng = np.random.default_rng(1)
+    for n in (1, 2, 3, 7, 64, 65, 1000, 1023, 1024, 1025, 4097, 20_001):
+        prices = _prices(rng, n); series = _series(prices)
+        for width in (1, 3, 50, 333, 640, 5000):
+            xs, lows, highs = series.decimate(width)
+            buckets = _buckets(series, n, width); assert len(xs) == len(lows) == len(highs) == len(buckets), (n, width)
+            for (start, end), low, high in zip(buckets, lows, highs):
+                chunk = prices[start:end]; chunk = chunk[~np.isnan(chunk)]
+                if len(chunk): assert low == chunk.min() and high == chunk.max(), (n, width, start, end)
+                else: assert np.isnan(low) and np.isnan(high)
+            if (~np.isnan(prices)).any(): assert np.nanmin(lows) == np.nanmin(prices) and np.nanmax(highs) == np.nanmax(prices)
+
+def test_incremental_appends_match_a_rebuild_from_scratch():
+    rng = np.random.default_rng(2); prices = _prices(rng, 3000, nan_share=0.2)
+    series = PriceSeries(capacity=4); plot = PlotBuffer(series); seen = []
+    for i, price in enumerate(prices.tolist()): # Read while appending, as the UI does with a published size
+        series.append(price)
+        if i % 97 == 0 or i in (1, 2, 1023, 1024): seen.append((i + 1, series.decimate(300), [list(p) for p in plot.points_for(10, 20, 300, 120)]))
+    for level, (mins, maxs, count) in enumerate(series.levels): # Each level straight from the raw values
+        block = 2 ** (level + 1); raw = prices[:count * block].reshape(count, block)
+        np.testing.assert_array_equal(mins[:count], np.fmin.reduce(raw, axis=1)); np.testing.assert_array_equal(maxs[:count], np.fmax.reduce(raw, axis=1)) # NaN only where all are
+    for size, decimated, points in seen:
+        rebuilt = _series(prices[:size])
+        for got, expected in zip(series.decimate(300, size), rebuilt.decimate(300)): np.testing.assert_array_equal(got, expected)
+        for got, expected in zip(decimated, rebuilt.decimate(300)): np.testing.assert_array_equal(got, expected)
+        assert points == [list(p) for p in PlotBuffer(rebuilt).points_for(10, 20, 300, 120)], size
+    assert series.valid_count == int((~np.isnan(prices)).sum()) and series.min_value == np.nanmin(prices) and series.max_value == np.nanmax(prices)
+
+def test_odd_lengths_and_all_nan_series():
+    for n in (3, 5, 129, 1025): # Odd: the last point is only in the tail, never in a completed block
+        prices = np.full(n, 1.0); prices[-1] = 9.0; series = _series(prices)
+        for width in (1, 2, 64):
+            _, lows, highs = series.decimate(width); assert np.nanmax(highs) == 9.0 and np.nanmin(lows) == 1.0, (n, width)
+        points = PlotBuffer(series).points_for(0, 0, 64, 100); assert min(y for _, y in points) == 0.0 # The spike reaches the top
+    empty = PriceSeries(); assert PlotBuffer(empty).points_for(0, 0, 64, 100) == [] and len(empty.decimate(64)[0]) == 0
+    nan = _series(np.full(1001, np.nan)); plot = PlotBuffer(nan)
+    assert nan.valid_count == 0 and nan.last_valid() is None and plot.points_for(0, 0, 64, 100) == [] and nan.levels[0][2] == 500
+    assert all(np.isnan(column).all() for column in nan.decimate(64)[1:])
+    one = _series(np.array([np.nan] * 10 + [2.5] + [np.nan] * 10)); plot = PlotBuffer(one) # One valid point: a single point, not a line
+    assert one.valid_count == 1 and one.last_valid() == 2.5 and len(plot.points_for(0, 0, 64, 100)) == 1 and plot.y_range[0] < 2.5 < plot.y_range[1]
+    flat = PlotBuffer(_series(np.zeros(5))); points = flat.points_for(0, 0, 64, 100) # Flat at zero: a range is made up, clamped at 0
+    assert flat.y_range[0] == 0.0 < flat.y_range[1] and len(points) == 5 and all(0 <= y <= 100 for _, y in points)
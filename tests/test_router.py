@@ -0,0 +1,69 @@
+# Router: split orders across pools, never worse than the best single pool; one pool == that Exchange; arbitrage closes the gap
+
+import os
+import sys
+from types import SimpleNamespace
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import Exchange, Network, SimConfig
+from router import Router
+from snapshot import save_snapshot, load_snapshot
+
+POOLS = ((30_000_000.0, 10_000_000.0, 0.003), (5_000_000.0, 1_900_000.0, 0.0005), (12_000_000.0, 3_700_000.0, 0.01)) # COIN, USD, fee
+
+def _router(pools=POOLS): return Router([Exchange(*p) for p in pools])
+
+def test_routed_trades_never_worse_than_the_best_single_pool():
+    for coins in (10.0, 5_000.0, 250_000.0, 2_000_000.0, 9_000_000.0):
+        router = _router(); singles = [Exchange(*p) for p in POOLS]
+        best_cost = min(q["usd_cost"] for q in (p.get_buy_quote(coins) for p in singles) if q)
+        best_received = max(q["usd_received"] for q in (p.get_sell_quote(coins) for p in singles) if q)
+        assert router.get_buy_quote(coins)["usd_cost"] <= best_cost * (1 + 1e-12)
+        assert router.get_sell_quote(coins)["usd_received"] >= best_received * (1 - 1e-12)
+        user = SimpleNamespace(usd_balance=best_cost * 1.5, coin_balance=0.0)
+        assert router.buy_coins(user, repr(coins)) and np.isclose(user.coin_balance, coins, rtol=1e-12)
+        assert best_cost * 1.5 - user.usd_balance <= best_cost * (1 + 1e-12) # What the split actually cost, not just its quote
+
+def test_single_pool_router_trades_exactly_like_the_exchange():
+    router = _router(POOLS[:1]); exchange = Exchange(*POOLS[0])
+    routed = SimpleNamespace(usd_balance=5e6, coin_balance=4e6); direct = SimpleNamespace(usd_balance=5e6, coin_balance=4e6)
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        amount = repr(float(rng.lognormal(np.log(20_000), 1.5))); buy = rng.random() < 0.5
+        assert (router.buy_coins if buy else router.sell_coins)(routed, amount) == (exchange.buy_coins if buy else exchange.sell_coins)(direct, amount)
+    assert (router.main.coin_pool, router.main.usd_pool, router.main.k) == (exchange.coin_pool, exchange.usd_pool, exchange.k)
+    assert (routed.usd_balance, routed.coin_balance) == (direct.usd_balance, direct.coin_balance)
+    assert router.get_buy_quote(1234.5) == exchange.get_buy_quote(1234.5) and router.get_sell_quote(1234.5) == exchange.get_sell_quote(1234.5)
+
+def test_arbitrage_leaves_prices_inside_the_fee_band():
+    rng = np.random.default_rng(4)
+    for _ in range(50):
+        router = Router([Exchange(coin, coin * price, fee) for coin, price, fee in zip(rng.uniform(1e6, 5e7, 3), rng.uniform(0.1, 1.0, 3), rng.choice([0.0005, 0.003, 0.01], 3))])
+        before = sum(p.coin_pool for p in router.pools)
+        router.arbitrage()
+        assert np.isclose(sum(p.coin_pool for p in router.pools), before, rtol=1e-12) # COIN-neutral
+        buy = min((1 + p.fee_rate) * p.get_spot_price() for p in router.pools); sell = max((1 - p.fee_rate) * p.get_spot_price() for p in router.pools)
+        assert sell <= buy * (1 + 1e-9) # No pool pair left to buy in one and sell in another at a profit
+        assert router.arbitrage() is None
+
+def _fresh_quotes(router, amounts): # Uncached: what a new Router over the same pools quotes
+    fresh = Router(router.pools); return [(fresh._buy_quote(a), fresh._sell_quote(a)) for a in amounts]
+
+def test_quote_cache_follows_each_pool_not_the_sum_of_versions():
+    router = _router(); amounts = (1_000.0, 80_000.0)
+    router.pools[0].version += 1
+    for amount in amounts: router.get_buy_quote(amount); router.get_sell_quote(amount) # Cached at versions (1, 0, 0)
+    router.pools[1] = Exchange(*POOLS[1]); router.pools[1].buy_coins(SimpleNamespace(usd_balance=1e6, coin_balance=0.0), "50000")
+    router.pools[0].version -= 1; assert sum(p.version for p in router.pools) == 1 # Another state with the same sum: (0, 1, 0)
+    assert [(router.get_buy_quote(a), router.get_sell_quote(a)) for a in amounts] == _fresh_quotes(router, amounts)
+
+def test_quotes_are_fresh_across_trade_and_snapshot_restore(tmp_path):
+    network = Network(SimConfig(INITIAL_USERS=50, EXCHANGE_EXTRA_POOLS=POOLS[1:]), seed=3); network.run_days(2)
+    path = str(tmp_path / "day2.snap"); save_snapshot(network, path); amounts = (2_500.0, 400_000.0)
+    stale = [network.router.get_buy_quote(a) for a in amounts]
+    assert network.router.buy_coins(SimpleNamespace(usd_balance=1e7, coin_balance=0.0), "300000") # Trade, then quote
+    traded = [(network.router.get_buy_quote(a), network.router.get_sell_quote(a)) for a in amounts]
+    assert traded == _fresh_quotes(network.router, amounts) and [q for q, _ in traded] != stale
+    restored = load_snapshot(path) # Restore, then quote: the pools are back to the saved state
+    quotes = [(restored.router.get_buy_quote(a), restored.router.get_sell_quote(a)) for a in amounts]
+    assert quotes == _fresh_quotes(restored.router, amounts) and [q for q, _ in quotes] == stale
@@ -0,0 +1,41 @@
+# Scheduler: event order, and the day cycle it drives against the one-batch-per-day engine it replaced
+
+import os
+import sys
+import io
+import math
+import contextlib
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import Network, SimConfig
+from scheduler import Scheduler, SECONDS_PER_DAY
+
+# Seed 11, 300 users, 40 days, as run by the one-batch-per-day loop before the scheduler (with today's budget-buy margin)
+ONE_BATCH_PER_DAY = ((29995600.430472635, 10001551.817492977, 49993581.04608862, 5002140.180667801, 10991.269969246898, 2233.743991480748, 4490), 13.671037064384485)
+
+def _state(network):
+    return ((network.exchange.coin_pool, network.exchange.usd_pool, network.mm_coin_balance, network.mm_usd_balance,
+             network.users.coin_total, network.users.usd_total, network.exchange.trade_count), math.fsum(network.price_history))
+
+def _network(**config):
+    with contextlib.redirect_stdout(io.StringIO()): return Network(SimConfig(INITIAL_USERS=300, **config), seed=11)
+
+def test_events_run_in_time_order_fifo_among_equal_times():
+    sched = Scheduler(); ran = []
+    for when, name in ((5, "b1"), (2, "a"), (5, "b2"), (9, "c")): sched.at(when, ran.append, name)
+    sched.at(5, lambda _: sched.at(5, ran.append, "b3 (scheduled while running)"))
+    assert sched.run_until(5) == 5 and ran == ["a", "b1", "b2", "b3 (scheduled while running)"] and sched.now == 5 and sched.next_time() == 9
+
+def test_one_slice_day_matches_the_one_batch_per_day_engine():
+    network = _network(DAY_SLICES=1)
+    with contextlib.redirect_stdout(io.StringIO()): network.run_days(40)
+    state, prices = _state(network)
+    np.testing.assert_allclose(state, ONE_BATCH_PER_DAY[0], rtol=1e-12); assert np.isclose(prices, ONE_BATCH_PER_DAY[1], rtol=1e-12)
+
+def test_advancing_in_pieces_matches_run_days():
+    for slices in (1, 24):
+        whole = _network(DAY_SLICES=slices); pieces = _network(DAY_SLICES=slices); rng = np.random.default_rng(slices)
+        with contextlib.redirect_stdout(io.StringIO()):
+            whole.run_days(10)
+            while pieces.clock() < 10 * SECONDS_PER_DAY: pieces.advance(min(pieces.clock() + int(rng.integers(1, SECONDS_PER_DAY // 3)), 10 * SECONDS_PER_DAY))
+        assert pieces.day == whole.day == 10 and _state(pieces) == _state(whole)
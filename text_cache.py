@@ -0,0 +1,36 @@
+# TEXT CACHE - Rendered text surfaces keyed on (font, text, color), with LRU eviction
+
+from collections import OrderedDict
+
+TEXT_CACHE_MAX_ENTRIES = 2048 # Roughly a few MB of small text surfaces
+
+class TextCache:
+    def __init__(self, max_entries=TEXT_CACHE_MAX_ENTRIES, antialias=True):
+        self.max_entries = max(1, int(max_entries)); self.antialias = antialias
+        self.entries = OrderedDict() # LRU order: oldest first
+        self.pinned = {}             # Static labels: pre-rendered once, never evicted
+        self.hits = 0; self.misses = 0; self.evictions = 0
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.pinned.get(key)
+        if surface is not None: self.hits += 1; return surface
+        surface = self.entries.get(key)
+        if surface is not None: self.hits += 1; self.entries.move_to_end(key); return surface
+        self.misses += 1
+        surface = font.render(text, self.antialias, color)
+        self.entries[key] = surface
+        if len(self.entries) > self.max_entries: self.entries.popitem(last=False); self.evictions += 1
+        return surface
+
+    def pin(self, labels): # labels: iterable of (font, text, color)
+        for font, text, color in labels:
+            key = (font, text, color)
+            if key not in self.pinned: self.pinned[key] = self.entries.pop(key, None) or font.render(text, self.antialias, color)
+
+    def clear(self): self.entries.clear(); self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries), "pinned": len(self.pinned), "max_entries": self.max_entries}
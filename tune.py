@@ -0,0 +1,154 @@
+# TUNE - Parallel search over the market maker's constants, with successive halving (optionally Hyperband brackets)
+#
+#   python tune.py                                   81 random candidates, 30 -> 810 days, best config to stdout
+#   python tune.py --hyperband --out mm_best.json    several brackets trading candidate count against horizon
+#
+# Every candidate runs on the same seeds (common random numbers) over the tuning horizon of its rung. Its score is
+# the weighted sum of its objectives, each divided by what the default constants score over the same days/seeds
+# (defaults = 1.0 per objective, lower is better):
+#   volatility      std of daily log returns of the spot price
+#   mm_drawdown     worst drop of the MM's mark-to-market balance (USD + COIN at spot) from its running peak
+#   fair_value_gap  mean |price - calculate_fair_value()| / fair value
+# Each rung keeps the best 1/eta and runs them eta times longer, so weak candidates only cost a short horizon.
+# Survivors are re-run from day 0 (no state is carried over): the rungs' horizons sum to at most eta/(eta-1) of the last.
+
+import sys
+import os
+import json
+import math
+import time
+import argparse
+import contextlib
+import numpy as np
+from engine import Network, SimConfig, format_num
+from sweep import run_sweep
+from eventlog import OFF
+
+# (low, high, log scale) per tuned constant; candidates are drawn uniformly (log-uniformly) inside these bounds
+MM_SEARCH_SPACE = {
+    "MM_BASE_REACTION_PERCENT": (0.05, 1.0, False),
+    "MM_POOL_IMPACT_PERCENT": (0.001, 0.5, True),
+    "MM_MAX_BALANCE_USAGE_PERCENT": (0.01, 0.8, False),
+    "MM_ACTION_EPSILON": (0.1, 1000.0, True),
+    "MM_PANIC_THRESHOLD_PERCENT": (0.02, 0.30, False),
+    "MM_PANIC_DELTA_COIN_THRESHOLD_RATIO": (0.001, 0.05, True),
+    "MM_PANIC_BUY_BALANCE_USAGE_PERCENT": (0.05, 0.80, False),
+    "MM_FAIR_VALUE_DEVIATION_THRESHOLD": (0.02, 0.40, False),
+    "MM_PROACTIVE_BUY_USD": (100.0, 50_000.0, True),
+    "MM_PROACTIVE_SELL_COIN": (100.0, 100_000.0, True),
+    "MM_MIN_TRADE_SIZE_COIN": (10.0, 10_000.0, True),
+    "MM_MIN_TRADE_SIZE_USD": (5.0, 5_000.0, True),
+}
+TUNE_OBJECTIVES = ("volatility", "mm_drawdown", "fair_value_gap")
+TUNE_WEIGHTS = {"volatility": 1.0, "mm_drawdown": 1.0, "fair_value_gap": 1.0}
+TUNE_BASE_OVERRIDES = {"INITIAL_USERS": 2_000} # The population every candidate trades against
+
+def sample_candidates(count, rng, space=MM_SEARCH_SPACE): # List of override dicts
+    candidates = []
+    for _ in range(count):
+        candidate = {}
+        for key, (low, high, log) in space.items(): candidate[key] = float(math.exp(rng.uniform(math.log(low), math.log(high))) if log else rng.uniform(low, high))
+        candidates.append(candidate)
+    return candidates
+
+# --- Evaluation (runs in the worker processes) ---
+def evaluate(task): # {"candidate", "seed_index"} plus the three objectives over task["days"] days
+    days = task["days"]; prices = np.empty(days); values = np.empty(days); gaps = np.empty(days); failed = False
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        network = Network(SimConfig(**task["overrides"]), seed=task["seed"]); network.events.level = OFF # Nobody reads the events of a tuning run
+        for d in range(days):
+            network.step_day(); price = network.exchange.get_spot_price()
+            if price is None or not price > 0 or not math.isfinite(price): failed = True; break
+            fair_value = network.calculate_fair_value()
+            prices[d] = price; values[d] = network.mm_usd_balance + network.mm_coin_balance * price; gaps[d] = abs(price - fair_value) / fair_value
+    result = {"candidate": task["candidate"], "seed_index": task["seed_index"]}
+    if failed: result.update({name: math.inf for name in TUNE_OBJECTIVES}); return result
+    peak = np.maximum.accumulate(values)
+    result["volatility"] = float(np.std(np.diff(np.log(prices)))) if days > 1 else 0.0
+    result["mm_drawdown"] = float(np.max((peak - values) / peak))
+    result["fair_value_gap"] = float(np.mean(gaps))
+    return result
+
+def evaluate_all(candidates, ids, days, seeds, workers, base_overrides, base_seed=0): # {id: mean objectives over the seeds}
+    tasks = [{"candidate": i, "seed_index": s, "days": int(days), "overrides": {**base_overrides, **candidates[i]},
+              "seed": np.random.SeedSequence(base_seed, spawn_key=(s,))} for i in ids for s in range(seeds)] # Same seeds for every candidate
+    totals = {i: {name: 0.0 for name in TUNE_OBJECTIVES} for i in ids}
+    for result in run_sweep(tasks, workers, func=evaluate):
+        for name in TUNE_OBJECTIVES: totals[result["candidate"]][name] += result[name] / seeds
+    return totals
+
+def score(metrics, baseline, weights=TUNE_WEIGHTS): # Weighted sum of objectives relative to the defaults (defaults: sum of weights)
+    return sum(weight * metrics[name] / max(baseline[name], 1e-12) for name, weight in weights.items() if weight)
+
+# --- Search ---
+def successive_halving(candidates, min_days, max_days, eta=3, seeds=2, workers=None, weights=TUNE_WEIGHTS, base_overrides=TUNE_BASE_OVERRIDES, base_seed=0, log=print):
+    # candidates[0] must be the defaults ({}): they are re-run at every rung as the yardstick, competing only while alive.
+    # Returns [(score, id, metrics)] of the last rung, best first.
+    alive = list(range(len(candidates))); days = max(1, int(min_days)); rung = 0
+    while True:
+        last = days >= max_days or len(alive) <= 1
+        if last: days = int(max_days)
+        t0 = time.perf_counter(); metrics = evaluate_all(candidates, sorted(set(alive) | {0}), days, seeds, workers, base_overrides, base_seed)
+        ranked = sorted((score(metrics[i], metrics[0], weights), i, metrics[i]) for i in alive)
+        keep = len(ranked) if last else max(1, len(ranked) // eta); rung += 1
+        log(f"Rung {rung}: {len(alive)} candidates x {seeds} seeds x {format_num(days)} days in {time.perf_counter() - t0:.1f}s -> {'final' if last else f'keep {keep}'} (best {ranked[0][0]:.3f}, defaults {score(metrics[0], metrics[0], weights):.3f})")
+        if last: return ranked
+        alive = [i for _, i, _ in ranked[:keep]]; days = min(int(max_days), days * eta)
+
+def hyperband(space, max_days, eta=3, min_days=30, seeds=2, workers=None, weights=TUNE_WEIGHTS, base_overrides=TUNE_BASE_OVERRIDES, seed=0, log=print):
+    # Brackets from "many candidates, short first horizon" to "few candidates, full horizon"; returns the best of each
+    rng = np.random.default_rng(seed); brackets = max(0, int(math.floor(math.log(max_days / min_days, eta) + 1e-9))); best = []
+    for s in range(brackets, -1, -1):
+        count = int(math.ceil((brackets + 1) / (s + 1) * eta ** s)); first = max(1, int(round(max_days / eta ** s)))
+        log(f"Bracket s={s}: {count} candidates from {format_num(first)} days")
+        candidates = [{}] + sample_candidates(count, rng, space)
+        ranked = successive_halving(candidates, first, max_days, eta, seeds, workers, weights, base_overrides, seed, log)
+        best.append((ranked[0][0], candidates[ranked[0][1]], ranked[0][2]))
+    return sorted(best, key=lambda entry: entry[0])
+
+# --- CLI ---
+def parse_weights(specs): # ["volatility=2", ...] -> {"volatility": 2.0, ...} on top of TUNE_WEIGHTS
+    weights = dict(TUNE_WEIGHTS)
+    for spec in specs or []:
+        name, _, value = spec.partition("=")
+        if name not in TUNE_OBJECTIVES or not value: raise ValueError(f"Bad --weight '{spec}' (expected one of {', '.join(TUNE_OBJECTIVES)}=number)")
+        weights[name] = float(value)
+    return weights
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the market maker's constants: successive halving over random candidates, in parallel.")
+    parser.add_argument("--candidates", type=int, default=81, help="Random candidates in the first rung (plus the defaults)")
+    parser.add_argument("--eta", type=int, default=3, help="Keep 1/eta of the candidates per rung, give them eta times more days")
+    parser.add_argument("--min-days", type=int, default=30)
+    parser.add_argument("--max-days", type=int, default=810)
+    parser.add_argument("--seeds", type=int, default=2, help="Seeds per candidate and rung (shared by all candidates)")
+    parser.add_argument("--hyperband", action="store_true", help="Run Hyperband brackets instead of one successive-halving pass")
+    parser.add_argument("--users", type=int, default=TUNE_BASE_OVERRIDES["INITIAL_USERS"])
+    parser.add_argument("--user-model", choices=("agents", "cohorts"), default="agents")
+    parser.add_argument("--weight", action="append", metavar="OBJECTIVE=W", help=f"Objective weight (repeatable): {', '.join(TUNE_OBJECTIVES)}")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", metavar="PATH", help="Write the best overrides (SimConfig keyword arguments) and their scores here as JSON")
+    args = parser.parse_args(argv)
+    if args.eta < 2 or args.min_days < 1 or args.max_days < args.min_days: parser.error("need --eta >= 2 and 1 <= --min-days <= --max-days")
+    try: weights = parse_weights(args.weight)
+    except ValueError as e: parser.error(str(e))
+    base = {**TUNE_BASE_OVERRIDES, "INITIAL_USERS": args.users, "USER_MODEL": args.user_model}
+
+    t0 = time.perf_counter()
+    if args.hyperband: score_value, best, metrics = hyperband(MM_SEARCH_SPACE, args.max_days, args.eta, args.min_days, args.seeds, args.workers, weights, base, args.seed)[0]
+    else:
+        candidates = [{}] + sample_candidates(args.candidates, np.random.default_rng(args.seed))
+        score_value, best_id, metrics = successive_halving(candidates, args.min_days, args.max_days, args.eta, args.seeds, args.workers, weights, base, args.seed)[0]; best = candidates[best_id]
+    elapsed = time.perf_counter() - t0
+    defaults = SimConfig()
+    print(f"Search done in {elapsed:.1f}s. Best score {score_value:.3f} (defaults {sum(w for w in weights.values() if w):.3f}): " + ", ".join(f"{name} {metrics[name]:.4g}" for name in TUNE_OBJECTIVES))
+    for key, value in (best or {}).items(): print(f"  {key:<38} {value:>14.6g}  (default {getattr(defaults, key):.6g})")
+    if not best: print("  The defaults won: no candidate beat them")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f: json.dump({"overrides": best, "score": score_value, "objectives": metrics, "weights": weights, "base": base}, f, indent=2)
+        print(f"Saved {args.out}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
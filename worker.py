@@ -0,0 +1,90 @@
+# WORKER - Runs a Network's day loop on a background thread
+#
+# The UI never touches the Network directly: it reads `worker.view`, an immutable StateView the worker republishes
+# after every batch of simulated events or command (a single reference swap, so reads need no lock), and sends
+# mutations through submit(). Results and engine messages are handed back on the UI thread by poll().
+
+import sys
+import time
+import queue
+import threading
+import traceback
+from collections import deque, namedtuple
+from node_table import NodeTableIndex, DEFAULT_NODE_QUERY
+
+WORKER_MAX_IDLE_WAIT = 0.05 # Upper bound on how long the worker blocks waiting for commands between day checks
+UserRow = namedtuple("UserRow", "id coin_balance usd_balance")
+StateView = namedtuple("StateView", (
+    "day base_emission added_emission total_emission staked remainder our_usd_balance our_stake our_rewards "
+    "mm_coin mm_usd mm_enabled user_count user_coin user_usd first_user "
+    "exchange spot_price coin_pool usd_pool node_count nodes node_total node_offset price_count price_valid catchup speed clock published_at"))
+
+def make_view(network, price_series=None, node_index=None, node_query=DEFAULT_NODE_QUERY): # nodes: the table window selected by node_query
+    ex = network.exchange; users = network.users
+    nodes = (node_index or NodeTableIndex()).window(network.nodes, node_query)
+    first = users[0] if users else None
+    return StateView(
+        day=network.day, base_emission=network.base_emission, added_emission=network.added_emission, total_emission=network.total_emission,
+        staked=network.get_staked(), remainder=network.get_free_float(), our_usd_balance=network.our_usd_balance,
+        our_stake=network.get_our_nodes_stake(), our_rewards=network.get_our_nodes_rewards_total(),
+        mm_coin=network.get_mm_coin_balance(), mm_usd=network.get_mm_usd_balance(), mm_enabled=network.config.MM_ENABLED,
+        user_count=len(users), user_coin=network.get_total_user_coin_balance(), user_usd=network.get_total_user_usd_balance(),
+        first_user=UserRow(first.id, first.coin_balance, first.usd_balance) if first else None,
+        exchange=(ex.quote_copy() if len(network.pools) == 1 else network.router.quote_copy()) if ex else None, spot_price=ex.get_spot_price() if ex else None, # exchange: quotes route like real orders
+        coin_pool=ex.coin_pool if ex else 0.0, usd_pool=ex.usd_pool if ex else 0.0,
+        node_count=len(network.nodes), nodes=nodes.rows, node_total=nodes.total, node_offset=nodes.offset,
+        price_count=len(price_series) if price_series is not None else len(network.price_history),
+        price_valid=price_series.valid_count if price_series is not None else sum(p is not None for p in network.price_history),
+        catchup=network.get_catchup_status(), speed=network.speed, clock=network.clock(), published_at=time.time())
+
+class SimWorker(threading.Thread):
+    def __init__(self, network, price_series=None, on_message=None):
+        super().__init__(name="sim-worker", daemon=True)
+        self.network = network; self.price_series = price_series; self.on_message = on_message
+        self.turbo_budget = None # Set to a larger per-batch budget (seconds) to catch up faster with fewer view publishes
+        self.node_index = NodeTableIndex(); self.node_query = DEFAULT_NODE_QUERY # Which node table window each view carries
+        self.commands = queue.SimpleQueue(); self.results = deque(); self.messages = deque()
+        self.stopping = threading.Event(); self.error = None
+        network.on_message = lambda text, level: self.messages.append((text, level)) # Delivered on the UI thread by poll()
+        self.view = self._make_view()
+
+    # --- UI thread ---
+    def submit(self, func, on_done=None): self.commands.put((func, on_done)) # func(network) runs on the worker; on_done(result) back on the UI thread
+    def poll(self): # Call once per frame: dispatches queued engine messages and command results
+        while self.messages:
+            text, level = self.messages.popleft()
+            if self.on_message: self.on_message(text, level)
+        while self.results:
+            on_done, result = self.results.popleft(); on_done(result)
+    def set_node_query(self, query): # Scroll/sort/filter the node table; the worker republishes with the new window
+        if query != self.node_query: self.node_query = query; self.submit(lambda network: True)
+    def set_speed(self, speed): self.submit(lambda network: network.set_speed(speed)) # A SPEEDS name or multiplier
+    def stop(self, timeout=1.0): self.stopping.set(); self.commands.put((None, None)); self.join(timeout)
+
+    # --- Worker thread ---
+    def run(self):
+        network = self.network
+        try:
+            while not self.stopping.is_set():
+                wait = min(WORKER_MAX_IDLE_WAIT, network.next_event_delay()) # Until the next event is due at the current speed
+                changed = self._run_commands(wait)
+                changed += network.distribute_rewards(self.turbo_budget)
+                if changed: self.view = self._make_view()
+        except Exception as e:
+            traceback.print_exc(); self.error = e
+            self.messages.append((f"Simulation stopped: {e}", "error")); self.view = self._make_view()
+    def _make_view(self): return make_view(self.network, self.price_series, self.node_index, self.node_query)
+
+    def _run_commands(self, wait): # Blocks up to `wait` seconds for the first command, then drains the rest
+        ran = 0
+        try: item = self.commands.get(timeout=wait) if wait > 0 else self.commands.get_nowait()
+        except queue.Empty: return 0
+        while True:
+            func, on_done = item
+            if func is not None:
+                try: result = func(self.network)
+                except Exception as e: print(f"[Worker] Command failed: {e}", file=sys.stderr); self.messages.append((f"Command failed: {e}", "error")); result = False
+                if on_done: self.results.append((on_done, result))
+                ran += 1
+            try: item = self.commands.get_nowait()
+            except queue.Empty: return ran